@@ -5,113 +5,2838 @@ import google.generativeai as genai
 import PyPDF2
 from io import BytesIO
 from flask import Flask, render_template_string, request, jsonify, send_from_directory
-from datetime import datetime
+from flask import Response, stream_with_context
+from datetime import date, datetime
 from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import from_excel
 import json
+import csv
 import pandas as pd
+import numpy as np
 import re
+import hashlib
+import threading
+import pickle
+import sqlite3
+import zipfile
+import itertools
+import uuid
+import math
+import time
+import sys
+import argparse
+import atexit
+import multiprocessing
+import weakref
+from array import array
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 load_dotenv()
 
+# Nível dos logs (LOG_NIVEL=DEBUG mostra também as mensagens por registro)
+NIVEIS_LOG = {"DEBUG": 10, "INFO": 20, "AVISO": 30, "ERRO": 40}
+NIVEL_LOG = NIVEIS_LOG.get(os.getenv("LOG_NIVEL", "INFO").upper(), 20)
 
-class LeitorPlanilhas:
-    def _extrair_sindicato(self, funcionario):
+
+def log(nivel, mensagem, *args):
+    """
+    Imprime a mensagem se o nível estiver habilitado; com args, a formatação
+    (mensagem % args) só acontece quando a mensagem vai ser impressa
+    """
+    if NIVEIS_LOG[nivel] >= NIVEL_LOG:
+        print(mensagem % args if args else mensagem)
+
+
+def log_amostrado(nivel, indice, mensagem, *args, primeiros=5, a_cada=1000):
+    """
+    Log para laços por registro: só os primeiros e depois um a cada `a_cada`
+    """
+    if NIVEIS_LOG[nivel] >= NIVEL_LOG and (indice < primeiros or indice % a_cada == 0):
+        print(mensagem % args if args else mensagem)
+
+
+class Medicao:
+    __slots__ = ("linhas", "bytes")
+
+    def __init__(self):
+        self.linhas = 0
+        self.bytes = 0
+
+
+class Metricas:
+    """
+    Contadores e histogramas em memória das etapas do pipeline (carga de
+    planilha, extração de PDF, chamadas ao modelo, processamento local, escrita
+    do xlsx), exportados no formato texto do Prometheus em /metrics
+    """
+
+    LIMITES_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    AJUDA = {
+        "vr_etapa_duracao_segundos": "Duração de cada etapa do pipeline",
+        "vr_etapa_execucoes_total": "Execuções de cada etapa",
+        "vr_etapa_erros_total": "Execuções que terminaram em exceção",
+        "vr_etapa_linhas_total": "Linhas (registros, páginas) processadas",
+        "vr_etapa_bytes_total": "Bytes lidos ou gravados",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (nome, rótulos ordenados) -> valor ou [contagens por limite, soma, total]
+        self._contadores = {}
+        self._histogramas = {}
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = [[0] * len(self.LIMITES_DURACAO), 0.0, 0]
+                self._histogramas[chave] = histograma
+            for i, limite in enumerate(self.LIMITES_DURACAO):
+                if valor <= limite:
+                    histograma[0][i] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    @contextmanager
+    def medir(self, etapa, **rotulos):
+        """
+        with METRICAS.medir("escrita_xlsx") as medicao: ...; medicao.linhas = n
+        """
+        medicao = Medicao()
+        inicio = time.perf_counter()
+        try:
+            yield medicao
+        except BaseException:
+            self.incrementar("vr_etapa_erros_total", etapa=etapa, **rotulos)
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.observar("vr_etapa_duracao_segundos", duracao, etapa=etapa, **rotulos)
+            self.incrementar("vr_etapa_execucoes_total", etapa=etapa, **rotulos)
+            self.incrementar(
+                "vr_etapa_linhas_total", medicao.linhas, etapa=etapa, **rotulos
+            )
+            self.incrementar(
+                "vr_etapa_bytes_total", medicao.bytes, etapa=etapa, **rotulos
+            )
+            log(
+                "DEBUG",
+                "[metricas] %s %s: %.3f s, %d linhas, %d bytes",
+                etapa,
+                rotulos or "",
+                duracao,
+                medicao.linhas,
+                medicao.bytes,
+            )
+
+    @staticmethod
+    def _rotulos(rotulos, extra=()):
+        pares = list(rotulos) + list(extra)
+        if not pares:
+            return ""
+        texto = ",".join(
+            '%s="%s"' % (nome, str(valor).replace("\\", "\\\\").replace('"', '\\"'))
+            for nome, valor in pares
+        )
+        return "{" + texto + "}"
+
+    def exposicao(self, medidores=None):
+        """
+        Texto no formato de exposição do Prometheus; medidores é um dicionário
+        {grupo: {campo: valor}} de estatísticas exportadas como gauges
+        """
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(
+                (chave, (list(h[0]), h[1], h[2]))
+                for chave, h in self._histogramas.items()
+            )
+        linhas = []
+        declarados = set()
+
+        def declarar(nome, tipo):
+            if nome not in declarados:
+                declarados.add(nome)
+                if nome in self.AJUDA:
+                    linhas.append(f"# HELP {nome} {self.AJUDA[nome]}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+
+        for (nome, rotulos), (contagens, soma, total) in histogramas:
+            declarar(nome, "histogram")
+            for limite, contagem in zip(self.LIMITES_DURACAO, contagens):
+                linhas.append(
+                    f"{nome}_bucket{self._rotulos(rotulos, [('le', limite)])} {contagem}"
+                )
+            linhas.append(
+                f"{nome}_bucket{self._rotulos(rotulos, [('le', '+Inf')])} {total}"
+            )
+            linhas.append(f"{nome}_sum{self._rotulos(rotulos)} {soma}")
+            linhas.append(f"{nome}_count{self._rotulos(rotulos)} {total}")
+        for (nome, rotulos), valor in contadores:
+            declarar(nome, "counter")
+            linhas.append(f"{nome}{self._rotulos(rotulos)} {valor}")
+        for grupo, valores in (medidores or {}).items():
+            for campo, valor in valores.items():
+                if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                    continue
+                nome = f"vr_{grupo}_{campo}"
+                declarar(nome, "gauge")
+                linhas.append(f"{nome} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+# Métricas únicas do processo, expostas pelo Flask em /metrics
+METRICAS = Metricas()
+
+
+def _hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo, lendo em blocos
+    """
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _linhas_para_colunas(linhas):
+    """
+    Forma colunar compacta (n_linhas, colunas) das linhas de uma planilha, usada
+    no snapshot e para devolver planilhas lidas em outro processo
+    """
+    largura = max((len(linha) for linha in linhas), default=0)
+    colunas = [
+        tuple(linha[i] if i < len(linha) else None for linha in linhas)
+        for i in range(largura)
+    ]
+    return len(linhas), colunas
+
+
+def _colunas_para_linhas(n_linhas, colunas):
+    if not colunas:
+        return tuple(() for _ in range(n_linhas))
+    return tuple(zip(*colunas))
+
+
+def _ler_linhas_workbook(caminho):
+    """
+    Abre a planilha com openpyxl e devolve as linhas da primeira aba como tuplas
+    """
+    workbook = openpyxl.load_workbook(caminho, data_only=True)
+    sheet = workbook.active
+    return tuple(sheet.iter_rows(values_only=True))
+
+
+class CacheWorkbooks:
+    """
+    Cache LRU de planilhas já lidas, compartilhado por todo o processo.
+
+    Regra de invalidação: cada entrada guarda mtime, tamanho e SHA-256 do arquivo.
+    Se mtime e tamanho não mudaram, a entrada é reutilizada; se mudaram, o hash do
+    conteúdo é recalculado e a planilha só é relida quando o conteúdo for outro.
+    A memória é limitada pelo total de células guardadas (e pelo número de entradas).
+    """
+
+    def __init__(self, max_celulas=5_000_000, max_entradas=64):
+        self.max_celulas = max_celulas
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._total_celulas = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+        self.remocoes_lru = 0
+
+    def obter(self, caminho, carregar=_ler_linhas_workbook):
+        """
+        Retorna as linhas da planilha em `caminho`, lendo do disco só quando necessário
+        """
+        chave = os.path.abspath(caminho)
+        stat = os.stat(chave)
+        assinatura = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if entrada["assinatura"] == assinatura:
+                    self._entradas.move_to_end(chave)
+                    self.hits += 1
+                    return entrada["linhas"]
+                # Arquivo tocado: só relê se o conteúdo realmente mudou
+                if entrada["hash"] == _hash_arquivo(chave):
+                    entrada["assinatura"] = assinatura
+                    self._entradas.move_to_end(chave)
+                    self.hits += 1
+                    return entrada["linhas"]
+                self._remover(chave)
+                self.invalidacoes += 1
+            self.misses += 1
+
+        conteudo_hash = _hash_arquivo(chave)
+        with METRICAS.medir("carga_planilha") as medicao:
+            linhas = carregar(chave)
+            medicao.linhas = len(linhas)
+            medicao.bytes = stat.st_size
+        celulas = sum(len(linha) for linha in linhas)
+
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = {
+                "assinatura": assinatura,
+                "hash": conteudo_hash,
+                "linhas": linhas,
+                "celulas": celulas,
+            }
+            self._total_celulas += celulas
+            self._aplicar_limites()
+        return linhas
+
+    def obter_por_conteudo(self, chave, carregar):
+        """
+        Como obter, para entradas cuja chave já identifica o conteúdo (ex.: CRC e
+        tamanho de um membro de ZIP): a entrada nunca precisa ser revalidada
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                return entrada["linhas"]
+            self.misses += 1
+
+        with METRICAS.medir("carga_planilha", origem="zip") as medicao:
+            linhas = carregar()
+            medicao.linhas = len(linhas)
+        celulas = sum(len(linha) for linha in linhas)
+
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = {
+                "assinatura": None,
+                "hash": None,
+                "linhas": linhas,
+                "celulas": celulas,
+            }
+            self._total_celulas += celulas
+            self._aplicar_limites()
+        return linhas
+
+    def contem(self, chave):
+        with self._lock:
+            return chave in self._entradas
+
+    def valido(self, caminho):
+        """
+        True se a planilha está no cache com o mesmo mtime e tamanho (sem ler nada)
+        """
+        chave = os.path.abspath(caminho)
+        stat = os.stat(chave)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            return entrada is not None and entrada["assinatura"] == (
+                stat.st_mtime_ns,
+                stat.st_size,
+            )
+
+    def _remover(self, chave):
+        entrada = self._entradas.pop(chave)
+        self._total_celulas -= entrada["celulas"]
+
+    def _aplicar_limites(self):
+        # Remove as entradas menos usadas, mas nunca a que acabou de entrar
+        while len(self._entradas) > 1 and (
+            self._total_celulas > self.max_celulas
+            or len(self._entradas) > self.max_entradas
+        ):
+            chave_antiga = next(iter(self._entradas))
+            self._remover(chave_antiga)
+            self.remocoes_lru += 1
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._total_celulas = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidacoes": self.invalidacoes,
+                "remocoes_lru": self.remocoes_lru,
+                "entradas": len(self._entradas),
+                "celulas": self._total_celulas,
+            }
+
+
+# Cache único do processo: chat e consolidação compartilham as mesmas planilhas
+CACHE_WORKBOOKS = CacheWorkbooks()
+
+
+class SnapshotPlanilhas:
+    """
+    Snapshot colunar em disco das planilhas já lidas, para acelerar a partida a frio.
+
+    Cada planilha é gravada como um pickle com as colunas (n_linhas, colunas) e um
+    manifest.json guarda mtime, tamanho e SHA-256 do xlsx de origem. Na leitura o
+    pickle é desserializado inteiro em memória em vez de abrir o xlsx (o ganho vem
+    de pular o parser XML do openpyxl), e só as planilhas cujo arquivo de origem
+    mudou são reconstruídas.
+    """
+
+    VERSAO_FORMATO = 1
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.caminho_manifest = os.path.join(pasta, "manifest.json")
+        self._lock = threading.Lock()
+        self._manifest = self._carregar_manifest()
+
+    def _carregar_manifest(self):
+        try:
+            with open(self.caminho_manifest, "r", encoding="utf-8") as arquivo:
+                manifest = json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("versao") != self.VERSAO_FORMATO:
+            return {}
+        return manifest.get("planilhas", {})
+
+    def _salvar_manifest(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        temporario = self.caminho_manifest + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(
+                {"versao": self.VERSAO_FORMATO, "planilhas": self._manifest},
+                arquivo,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(temporario, self.caminho_manifest)
+
+    def carregar(self, caminho_origem, carregar=_ler_linhas_workbook):
+        """
+        Retorna as linhas da planilha, do snapshot se o arquivo de origem não mudou
+        """
+        chave = os.path.abspath(caminho_origem)
+        stat = os.stat(chave)
+
+        with self._lock:
+            entrada = self._manifest.get(chave)
+            valido = False
+            if entrada is not None:
+                if (entrada["mtime_ns"], entrada["tamanho"]) == (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    valido = True
+                elif entrada["hash"] == _hash_arquivo(chave):
+                    # Arquivo tocado, mas com o mesmo conteúdo
+                    entrada["mtime_ns"] = stat.st_mtime_ns
+                    entrada["tamanho"] = stat.st_size
+                    self._salvar_manifest()
+                    valido = True
+
+        if valido:
+            linhas = self._ler_snapshot(entrada["arquivo"])
+            if linhas is not None:
+                return linhas
+
+        conteudo_hash = _hash_arquivo(chave)
+        linhas = carregar(chave)
+        self._gravar(chave, stat, conteudo_hash, linhas)
+        return linhas
+
+    def _ler_snapshot(self, nome_snapshot):
+        caminho = os.path.join(self.pasta, nome_snapshot)
+        try:
+            with open(caminho, "rb") as arquivo:
+                conteudo = pickle.load(arquivo)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            return None
+        return _colunas_para_linhas(conteudo["n_linhas"], conteudo["colunas"])
+
+    def valido(self, caminho_origem):
+        """
+        True se há snapshot do arquivo com o mesmo mtime e tamanho
+        """
+        chave = os.path.abspath(caminho_origem)
+        stat = os.stat(chave)
+        with self._lock:
+            entrada = self._manifest.get(chave)
+        return entrada is not None and (entrada["mtime_ns"], entrada["tamanho"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        )
+
+    def _gravar(self, chave, stat, conteudo_hash, linhas):
+        n_linhas, colunas = _linhas_para_colunas(linhas)
+        nome_snapshot = hashlib.sha1(chave.encode("utf-8")).hexdigest() + ".bin"
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            caminho = os.path.join(self.pasta, nome_snapshot)
+            temporario = caminho + ".tmp"
+            with open(temporario, "wb") as arquivo:
+                pickle.dump(
+                    {"n_linhas": n_linhas, "colunas": colunas},
+                    arquivo,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temporario, caminho)
+            with self._lock:
+                self._manifest[chave] = {
+                    "arquivo": nome_snapshot,
+                    "hash": conteudo_hash,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "tamanho": stat.st_size,
+                }
+                self._salvar_manifest()
+        except OSError as e:
+            # Snapshot é só otimização: falha ao gravar não impede a leitura
+            print(f"Não foi possível gravar snapshot de {chave}: {e}")
+
+
+def _nome_membro_zip(info):
+    """
+    Nome do arquivo de um membro de ZIP. Sem a flag UTF-8 (0x800) o zipfile decodifica
+    como cp437; arquivos gerados no Windows em português vêm em UTF-8 sem a flag ou
+    em cp850 ("ADMISS╟O" -> "ADMISSÃO"). Escapes "#U00c3" também são convertidos.
+    """
+    nome = info.filename
+    if not info.flag_bits & 0x800:
+        bruto = nome.encode("cp437")
+        try:
+            nome = bruto.decode("utf-8")
+        except UnicodeDecodeError:
+            nome = bruto.decode("cp850")
+    nome = re.sub(r"#U([0-9a-fA-F]{4})", lambda m: chr(int(m.group(1), 16)), nome)
+    return unicodedata.normalize("NFC", nome.replace("\\", "/").rsplit("/", 1)[-1])
+
+
+def _ler_linhas_membro_zip(caminho_zip, nome_interno):
+    """
+    Linhas da primeira aba de uma planilha dentro do ZIP, descompactada em memória;
+    função de módulo para rodar num processo separado
+    """
+    with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+        conteudo = arquivo_zip.read(nome_interno)
+    workbook = openpyxl.load_workbook(BytesIO(conteudo), data_only=True)
+    return tuple(workbook.active.iter_rows(values_only=True))
+
+
+class FonteZip:
+    """
+    Planilhas lidas direto de um ZIP (ex.: "Desafio 4 - Dados.zip"), sem extrair
+    para o disco. O índice de membros é relido quando o ZIP muda; cada membro é
+    identificado por nome, CRC e tamanho, que servem de chave no cache de planilhas.
+    """
+
+    def __init__(self, caminho_zip):
+        self.caminho_zip = os.path.abspath(caminho_zip)
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._membros = {}
+
+    def membros(self):
+        """
+        Nome normalizado -> ZipInfo das planilhas do ZIP
+        """
+        stat = os.stat(self.caminho_zip)
+        assinatura = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if assinatura != self._assinatura:
+                with zipfile.ZipFile(self.caminho_zip) as arquivo_zip:
+                    self._membros = {
+                        _nome_membro_zip(info): info
+                        for info in arquivo_zip.infolist()
+                        if not info.is_dir()
+                        and not info.filename.startswith("__MACOSX/")
+                        and info.filename.lower().endswith((".xlsx", ".xlsm"))
+                    }
+                self._assinatura = assinatura
+            return self._membros
+
+    def _info(self, nome_arquivo):
+        return self.membros().get(unicodedata.normalize("NFC", nome_arquivo))
+
+    def contem(self, nome_arquivo):
+        return self._info(nome_arquivo) is not None
+
+    def chave(self, nome_arquivo):
+        """
+        Chave de cache do membro: muda só quando o conteúdo muda
+        """
+        info = self._info(nome_arquivo)
+        return (
+            "zip",
+            unicodedata.normalize("NFC", nome_arquivo),
+            info.CRC,
+            info.file_size,
+        )
+
+    def nome_membro(self, nome_arquivo):
+        return self._info(nome_arquivo).filename
+
+    def tamanho(self, nome_arquivo):
+        return self._info(nome_arquivo).file_size
+
+    def ler_linhas(self, nome_arquivo):
+        return _ler_linhas_membro_zip(self.caminho_zip, self.nome_membro(nome_arquivo))
+
+    def abrir(self, nome_arquivo):
+        """
+        Stream do membro descompactado sob demanda, para leitura em streaming
+        """
+        arquivo_zip = zipfile.ZipFile(self.caminho_zip)
+        try:
+            return arquivo_zip.open(self._info(nome_arquivo))
+        finally:
+            # O arquivo fica aberto até o stream do membro ser fechado
+            arquivo_zip.close()
+
+
+def _ler_planilha_compacta(caminho, nome_membro=None):
+    """
+    Lê uma planilha (arquivo ou membro de ZIP) e devolve a forma colunar compacta;
+    função de módulo para rodar no pool de processos da carga das bases
+    """
+    if nome_membro is not None:
+        linhas = _ler_linhas_membro_zip(caminho, nome_membro)
+    else:
+        linhas = _ler_linhas_workbook(caminho)
+    return _linhas_para_colunas(linhas)
+
+
+def _contexto_processos_carga():
+    """
+    Contexto dos processos da carga: forkserver onde existe, para não fazer fork
+    de um processo com threads (consultas, fila de consolidados) em andamento
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+def _extrair_paginas_pdf(caminho):
+    """
+    Texto de todas as páginas de um PDF; função de módulo para rodar num processo
+    separado
+    """
+    with open(caminho, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pagina.extract_text() or "" for pagina in pdf_reader.pages]
+
+
+class CachePaginasPdf:
+    """
+    Cache do texto extraído de cada página dos PDFs, em dois níveis.
+
+    No disco, o texto fica em <pasta>/<sha256 do PDF>/<página>.txt, então só um PDF
+    com conteúdo novo é reprocessado pelo PyPDF2. Em memória, um LRU limitado pelo
+    total de caracteres guarda as páginas lidas mais recentemente.
+
+    Com max_processos > 0, a extração do PyPDF2 (CPU) roda num pool de processos,
+    fora do GIL, para não travar as outras consultas em andamento.
+    """
+
+    def __init__(self, pasta, max_caracteres=20_000_000, max_processos=0):
+        self.pasta = pasta
+        self.max_caracteres = max_caracteres
+        self.max_processos = max_processos
+        self._executor = None
+        self._memoria = OrderedDict()
+        self._total_caracteres = 0
+        self._hashes = {}
+        self._lock = threading.RLock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+    def hash_pdf(self, caminho):
+        """
+        SHA-256 do PDF, recalculado só quando mtime ou tamanho mudam
+        """
+        chave = os.path.abspath(caminho)
+        stat = os.stat(chave)
+        assinatura = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            conhecido = self._hashes.get(chave)
+            if conhecido and conhecido[0] == assinatura:
+                return conhecido[1]
+        conteudo_hash = _hash_arquivo(chave)
+        with self._lock:
+            self._hashes[chave] = (assinatura, conteudo_hash)
+        return conteudo_hash
+
+    def _pasta_pdf(self, conteudo_hash):
+        return os.path.join(self.pasta, conteudo_hash)
+
+    def _numero_paginas_em_disco(self, conteudo_hash):
+        try:
+            with open(
+                os.path.join(self._pasta_pdf(conteudo_hash), "meta.json"),
+                "r",
+                encoding="utf-8",
+            ) as arquivo:
+                return json.load(arquivo)["paginas"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _gravar_em_disco(self, conteudo_hash, nome, conteudo):
+        pasta = self._pasta_pdf(conteudo_hash)
+        try:
+            os.makedirs(pasta, exist_ok=True)
+            caminho = os.path.join(pasta, nome)
+            with open(caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+                arquivo.write(conteudo)
+            os.replace(caminho + ".tmp", caminho)
+        except OSError as e:
+            print(f"Não foi possível gravar cache de PDF {nome}: {e}")
+
+    def _guardar_em_memoria(self, chave, texto):
+        with self._lock:
+            if chave in self._memoria:
+                return
+            self._memoria[chave] = texto
+            self._total_caracteres += len(texto)
+            while (
+                len(self._memoria) > 1 and self._total_caracteres > self.max_caracteres
+            ):
+                _, antigo = self._memoria.popitem(last=False)
+                self._total_caracteres -= len(antigo)
+
+    def _pagina_em_cache(self, conteudo_hash, numero):
+        chave = (conteudo_hash, numero)
+        with self._lock:
+            texto = self._memoria.get(chave)
+            if texto is not None:
+                self._memoria.move_to_end(chave)
+                self.hits_memoria += 1
+                return texto
+        try:
+            with open(
+                os.path.join(self._pasta_pdf(conteudo_hash), f"{numero}.txt"),
+                "r",
+                encoding="utf-8",
+            ) as arquivo:
+                texto = arquivo.read()
+        except OSError:
+            return None
+        with self._lock:
+            self.hits_disco += 1
+        self._guardar_em_memoria(chave, texto)
+        return texto
+
+    def paginas(self, caminho):
+        """
+        Lista com o texto de cada página do PDF; o PyPDF2 só é aberto se faltar
+        alguma página no cache
+        """
+        conteudo_hash = self.hash_pdf(caminho)
+        total = self._numero_paginas_em_disco(conteudo_hash)
+        textos = {}
+        if total is not None:
+            for numero in range(1, total + 1):
+                texto = self._pagina_em_cache(conteudo_hash, numero)
+                if texto is not None:
+                    textos[numero] = texto
+            if len(textos) == total:
+                return [textos[numero] for numero in range(1, total + 1)]
+
+        extraidas = self._extrair(caminho)
+        total = len(extraidas)
+        for numero, texto in enumerate(extraidas, 1):
+            if numero in textos:
+                continue
+            with self._lock:
+                self.misses += 1
+            textos[numero] = texto
+            self._gravar_em_disco(conteudo_hash, f"{numero}.txt", texto)
+            self._guardar_em_memoria((conteudo_hash, numero), texto)
+        self._gravar_em_disco(
+            conteudo_hash, "meta.json", json.dumps({"paginas": total})
+        )
+        return [textos[numero] for numero in range(1, total + 1)]
+
+    def _extrair(self, caminho):
+        with METRICAS.medir("extracao_pdf") as medicao:
+            paginas = self._extrair_paginas(caminho)
+            medicao.linhas = len(paginas)
+            medicao.bytes = os.path.getsize(caminho)
+        return paginas
+
+    def _extrair_paginas(self, caminho):
+        if self.max_processos <= 0:
+            return _extrair_paginas_pdf(caminho)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_processos)
+            executor = self._executor
+        try:
+            return executor.submit(_extrair_paginas_pdf, caminho).result()
+        except BrokenProcessPool as e:
+            # Pool morto não volta: descarta para o próximo PDF criar outro
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            print(f"Pool de processos do PDF quebrado, extraindo localmente: {e}")
+            return _extrair_paginas_pdf(caminho)
+        except (OSError, RuntimeError) as e:
+            # Pool indisponível (ex.: processo filho morto); extrai no próprio processo
+            print(f"Pool de processos do PDF indisponível, extraindo localmente: {e}")
+            return _extrair_paginas_pdf(caminho)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "paginas_em_memoria": len(self._memoria),
+                "caracteres_em_memoria": self._total_caracteres,
+            }
+
+    def fechar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _tokenizar(texto):
+    """
+    Palavras do texto em minúsculas e sem acentos
+    """
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.findall(r"[a-z0-9]+", texto)
+
+
+def _normalizar_cabecalho(header):
+    """
+    Cabeçalho em minúsculas, sem acentos e com separadores trocados por espaço
+    """
+    return " ".join(_tokenizar(header))
+
+
+class IndiceBM25:
+    """
+    Índice invertido BM25, em Python puro, sobre trechos dos PDFs de acordos coletivos.
+
+    Cada página é dividida em trechos de algumas centenas de palavras (com
+    sobreposição) e a pergunta recupera os k trechos mais relevantes, opcionalmente
+    só dos documentos de um sindicato. O índice é persistido em JSON com o hash de
+    cada PDF, e só os documentos alterados são fatiados novamente.
+    """
+
+    VERSAO_FORMATO = 1
+    STOPWORDS = frozenset(
+        "a o as os um uma uns umas de da do das dos em na no nas nos por pela pelo "
+        "pelas pelos para com sem sob e ou que se ao aos a as ate entre sobre como "
+        "mais menos muito ja nao sim ser sao foi esta este esse essa isso qual quais "
+        "quando onde quem seu sua seus suas lhe ele ela eles elas me meu minha".split()
+    )
+
+    def __init__(
+        self, caminho, palavras_por_trecho=180, sobreposicao=40, k1=1.5, b=0.75
+    ):
+        self.caminho = caminho
+        self.palavras_por_trecho = palavras_por_trecho
+        self.sobreposicao = sobreposicao
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._documentos = self._carregar()
+        self._montar_postings()
+
+    def _carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as arquivo:
+                conteudo = json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+        if conteudo.get("versao") != self.VERSAO_FORMATO:
+            return {}
+        return conteudo.get("documentos", {})
+
+    def _salvar(self):
+        try:
+            os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+            with open(self.caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+                json.dump(
+                    {"versao": self.VERSAO_FORMATO, "documentos": self._documentos},
+                    arquivo,
+                    ensure_ascii=False,
+                )
+            os.replace(self.caminho + ".tmp", self.caminho)
+        except OSError as e:
+            print(f"Não foi possível salvar o índice de PDFs: {e}")
+
+    def _termos(self, texto):
+        return [t for t in _tokenizar(texto) if t not in self.STOPWORDS]
+
+    def _fatiar(self, paginas):
+        trechos = []
+        passo = max(self.palavras_por_trecho - self.sobreposicao, 1)
+        for numero, texto in enumerate(paginas, 1):
+            palavras = texto.split()
+            for inicio in range(0, max(len(palavras), 1), passo):
+                pedaco = " ".join(palavras[inicio : inicio + self.palavras_por_trecho])
+                if pedaco.strip():
+                    trechos.append(
+                        {
+                            "pagina": numero,
+                            "texto": pedaco,
+                            "termos": dict(Counter(self._termos(pedaco))),
+                        }
+                    )
+                if inicio + self.palavras_por_trecho >= len(palavras):
+                    break
+        return trechos
+
+    def atualizar(self, documentos, obter_hash, obter_paginas):
+        """
+        Sincroniza o índice com a lista de (nome, caminho, sigla) de documentos.
+        Só os PDFs cujo hash mudou são reprocessados; retorna quantos foram.
+        """
+        with self._lock:
+            alterados = 0
+            nomes = set()
+            for nome, caminho, sigla in documentos:
+                nomes.add(nome)
+                conteudo_hash = obter_hash(caminho)
+                atual = self._documentos.get(nome)
+                if atual and atual["hash"] == conteudo_hash:
+                    atual["sigla"] = sigla
+                    continue
+                self._documentos[nome] = {
+                    "hash": conteudo_hash,
+                    "sigla": sigla,
+                    "trechos": self._fatiar(obter_paginas(caminho)),
+                }
+                alterados += 1
+            removidos = [nome for nome in self._documentos if nome not in nomes]
+            for nome in removidos:
+                del self._documentos[nome]
+            if alterados or removidos:
+                self._montar_postings()
+                self._salvar()
+            return alterados
+
+    def _montar_postings(self):
+        self._trechos = []
+        self._postings = {}
+        for nome, documento in self._documentos.items():
+            for trecho in documento["trechos"]:
+                indice = len(self._trechos)
+                tamanho = sum(trecho["termos"].values())
+                self._trechos.append(
+                    (nome, documento.get("sigla") or "", trecho, tamanho)
+                )
+                for termo, frequencia in trecho["termos"].items():
+                    self._postings.setdefault(termo, []).append((indice, frequencia))
+        total = len(self._trechos)
+        self._tamanho_medio = (
+            sum(tamanho for *_, tamanho in self._trechos) / total if total else 0.0
+        )
+
+    def buscar(self, pergunta, k=5, sigla=None):
+        """
+        Os k trechos mais relevantes para a pergunta; com sigla, só documentos daquele
+        sindicato (se houver algum indexado)
+        """
+        with self._lock:
+            total = len(self._trechos)
+            if not total:
+                return []
+            permitidos = None
+            if sigla and any(s == sigla for _, s, _, _ in self._trechos):
+                permitidos = sigla
+            pontuacao = {}
+            for termo in set(self._termos(pergunta)):
+                postings = self._postings.get(termo)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (total - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for indice, frequencia in postings:
+                    nome, sigla_trecho, _, tamanho = self._trechos[indice]
+                    if permitidos and sigla_trecho != permitidos:
+                        continue
+                    normalizacao = self.k1 * (
+                        1 - self.b + self.b * tamanho / (self._tamanho_medio or 1)
+                    )
+                    pontuacao[indice] = pontuacao.get(indice, 0.0) + idf * (
+                        frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+                    )
+            melhores = sorted(pontuacao.items(), key=lambda item: (-item[1], item[0]))[
+                :k
+            ]
+            return [
+                {
+                    "documento": self._trechos[indice][0],
+                    "sigla": self._trechos[indice][1],
+                    "pagina": self._trechos[indice][2]["pagina"],
+                    "texto": self._trechos[indice][2]["texto"],
+                    "score": round(score, 4),
+                }
+                for indice, score in melhores
+            ]
+
+
+class EsquemaPlanilha:
+    """
+    Mapeamento dos cabeçalhos de uma planilha para papéis semânticos (matrícula,
+    admissão, cargo, sindicato...), resolvido uma única vez por tupla de cabeçalhos.
+
+    Cada papel tem níveis de termos em ordem de preferência; vale o primeiro nível
+    com alguma coluna. Termos curtos como "id" só casam como palavra inteira, e
+    papéis ausentes ou ambíguos ficam registrados em `problemas`.
+    """
+
+    PAPEIS = {
+        "matricula": [
+            [r"\bmatricula\b"],
+            [r"\bcadastro\b", r"\bcod(igo)?\b", r"\bid\b"],
+        ],
+        "admissao": [[r"\badmissao\b"]],
+        "demissao": [[r"\bdemissao\b"], [r"\bdesligamento\b"]],
+        "cargo": [[r"\bcargo\b", r"\bfuncao\b"]],
+        "sindicato": [[r"\bsindic"]],
+        "situacao": [[r"\bsituacao\b"]],
+        "dias_ferias": [[r"\bdias\b.*\bferias\b"]],
+        "valor": [[r"\bvalor\b"]],
+    }
+    # Tipo das células de cada papel; as demais colunas ficam como texto
+    TIPOS_PAPEIS = {
+        "admissao": "data",
+        "demissao": "data",
+        "dias_ferias": "inteiro",
+        "valor": "decimal",
+    }
+
+    def __init__(self, headers):
+        self.headers = tuple(headers)
+        self._colunas = {}
+        self._indices = {}
+        self.problemas = []
+        normalizados = [_normalizar_cabecalho(header) for header in self.headers]
+        for papel, niveis in self.PAPEIS.items():
+            for termos in niveis:
+                candidatos = [
+                    i
+                    for i, normalizado in enumerate(normalizados)
+                    if any(re.search(termo, normalizado) for termo in termos)
+                ]
+                if candidatos:
+                    if len(candidatos) > 1:
+                        self.problemas.append(
+                            f"papel '{papel}' ambíguo: "
+                            f"{[self.headers[i] for i in candidatos]} "
+                            f"(usando '{self.headers[candidatos[0]]}')"
+                        )
+                    self._indices[papel] = candidatos[0]
+                    self._colunas[papel] = self.headers[candidatos[0]]
+                    break
+
+    def coluna(self, papel):
+        """
+        Nome da coluna que cumpre o papel, ou None
+        """
+        return self._colunas.get(papel)
+
+    def indice(self, papel):
+        """
+        Posição da coluna que cumpre o papel (para acesso direto a tuplas), ou None
+        """
+        return self._indices.get(papel)
+
+    def tipos(self):
+        """
+        Esquema de tipos por coluna ({coluna: tipo}) para a leitura das células
+        """
+        return {
+            coluna: self.TIPOS_PAPEIS[papel]
+            for papel, coluna in self._colunas.items()
+            if papel in self.TIPOS_PAPEIS
+        }
+
+    def valor(self, registro, papel, padrao=""):
+        coluna = self._colunas.get(papel)
+        if coluna is None:
+            return padrao
+        return registro.get(coluna, padrao)
+
+    def validar(self, obrigatorios=()):
+        """
+        Problemas do esquema, incluindo papéis obrigatórios ausentes
+        """
+        ausentes = [
+            f"papel '{papel}' ausente"
+            for papel in obrigatorios
+            if papel not in self._colunas
+        ]
+        return ausentes + self.problemas
+
+
+@lru_cache(maxsize=256)
+def _resolver_esquema_cache(headers):
+    return EsquemaPlanilha(headers)
+
+
+def resolver_esquema(headers):
+    """
+    Esquema de uma planilha, reaproveitado para cabeçalhos já vistos
+    """
+    return _resolver_esquema_cache(tuple(headers))
+
+
+TIPOS_CELULA = ("texto", "inteiro", "decimal", "data")
+FORMATOS_DATA_TEXTO = ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S")
+
+
+def coagir_celula(valor, tipo):
+    """
+    Converte uma célula lida pelo openpyxl para o tipo da coluna. Valores nativos
+    (int, float, datetime) passam direto; texto é interpretado ("35,50",
+    "07/04/2025"). Célula vazia vira "" em colunas de texto e None nas demais;
+    levanta ValueError se o valor não couber no tipo.
+    """
+    if tipo not in TIPOS_CELULA:
+        raise ValueError(f"tipo de coluna desconhecido: {tipo}")
+    if tipo == "texto":
+        return str(valor).strip() if valor is not None else ""
+    if isinstance(valor, str):
+        valor = valor.strip()
+        if not valor:
+            return None
+    if valor is None:
+        return None
+    if isinstance(valor, bool):
+        raise ValueError(f"valor lógico em coluna do tipo {tipo}: {valor!r}")
+
+    if tipo == "data":
+        if isinstance(valor, datetime):
+            return valor.date()
+        if isinstance(valor, date):
+            return valor
+        if isinstance(valor, (int, float)):
+            # Número de série do Excel numa célula sem formato de data
+            return from_excel(valor).date()
+        if not isinstance(valor, str):
+            raise ValueError(f"data inválida: {valor!r}")
+        for formato in FORMATOS_DATA_TEXTO:
+            try:
+                return datetime.strptime(valor.replace("T", " "), formato).date()
+            except ValueError:
+                pass
+        raise ValueError(f"data inválida: {valor!r}")
+
+    if isinstance(valor, str):
+        texto = valor.replace("R$", "").replace(" ", "")
+        if "," in texto:
+            texto = texto.replace(".", "").replace(",", ".")
+        try:
+            valor = float(texto) if tipo == "decimal" or "." in texto else int(texto)
+        except ValueError:
+            raise ValueError(f"número inválido: {valor!r}") from None
+    if not isinstance(valor, (int, float)):
+        raise ValueError(f"{tipo} inválido: {valor!r}")
+    if tipo == "decimal":
+        return float(valor)
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ValueError(f"inteiro inválido: {valor!r}")
+    return int(valor)
+
+
+class ClassificadorSindicato:
+    """
+    Classificador de sindicato montado uma única vez a partir da tabela de aliases.
+
+    Todas as variações de nome (e as siglas isoladas) ficam em uma só expressão
+    regular pré-compilada, e cada texto já classificado é guardado em um memo, de
+    modo que um valor repetido da coluna de sindicato custa uma consulta ao dicionário.
+    """
+
+    def __init__(self, sindicatos, max_memo=100_000):
+        self.sindicatos = [(sigla, list(nomes)) for sigla, nomes in sindicatos]
+        self.max_memo = max_memo
+        self._memo = {}
+        # Um lookahead opcional por sigla: um único match diz quais siglas aparecem
+        # no texto, por nome (grupos n*) ou como sigla isolada (grupos s*)
+        lookaheads = []
+        for i, (sigla, nomes) in enumerate(self.sindicatos):
+            alternativas = "|".join(re.escape(nome) for nome in nomes)
+            lookaheads.append(rf"(?=.*?(?P<n{i}>{alternativas}))?")
+        for i, (sigla, _) in enumerate(self.sindicatos):
+            lookaheads.append(rf"(?=.*?(?P<s{i}>\b{re.escape(sigla)}\b))?")
+        self._padrao = re.compile("".join(lookaheads), re.DOTALL)
+
+    @classmethod
+    def com_aliases_extras(cls, sindicatos, extras):
+        """
+        Acrescenta aliases vindos de configuração ({"SP": ["..."], "MG": [...]}).
+        Siglas novas entram depois das existentes, com menor precedência.
+        """
+        tabela = [(sigla, list(nomes)) for sigla, nomes in sindicatos]
+        posicoes = {sigla: i for i, (sigla, _) in enumerate(tabela)}
+        for sigla, nomes in (extras or {}).items():
+            sigla = str(sigla).upper().strip()
+            nomes = [str(nome).upper().strip() for nome in nomes if str(nome).strip()]
+            if sigla in posicoes:
+                tabela[posicoes[sigla]][1].extend(
+                    nome for nome in nomes if nome not in tabela[posicoes[sigla]][1]
+                )
+            else:
+                posicoes[sigla] = len(tabela)
+                tabela.append((sigla, nomes or [sigla]))
+        return cls(tabela)
+
+    def classificar_valor(self, valor):
+        """
+        Retorna (sigla encontrada por nome, sigla encontrada isolada) para um texto
+        """
+        texto = str(valor).upper().strip()
+        resultado = self._memo.get(texto)
+        if resultado is None:
+            resultado = self._classificar_texto(texto)
+            if len(self._memo) >= self.max_memo:
+                self._memo.clear()
+            self._memo[texto] = resultado
+        return resultado
+
+    def _classificar_texto(self, texto):
+        # Matrículas e outros números nunca contêm nome de sindicato
+        if not texto or texto.isdigit():
+            return ("", "")
+        match = self._padrao.match(texto)
+        por_nome = next(
+            (
+                sigla
+                for i, (sigla, _) in enumerate(self.sindicatos)
+                if match.group(f"n{i}") is not None
+            ),
+            "",
+        )
+        isolada = next(
+            (
+                sigla
+                for i, (sigla, _) in enumerate(self.sindicatos)
+                if match.group(f"s{i}") is not None
+            ),
+            "",
+        )
+        return (por_nome, isolada)
+
+    def detectar_em_texto(self, texto):
+        """
+        Sigla mencionada em texto livre (pergunta, nome de arquivo). Aqui aliases e
+        siglas só valem como palavras inteiras, para "SP" não casar com "ESPECIAL".
+        """
+        texto = str(texto).upper()
+        for sigla, nomes in self.sindicatos:
+            for nome in [sigla] + nomes:
+                if re.search(rf"(?<!\w){re.escape(nome)}(?!\w)", texto):
+                    return sigla
+        return ""
+
+    def sigla(self, valor):
+        if not valor:
+            return ""
+        por_nome, isolada = self.classificar_valor(valor)
+        return por_nome or isolada
+
+    def classificar_registro(self, registro, coluna_sindicato=None):
+        """
+        Sigla do sindicato de um registro. Se a coluna de sindicato for conhecida e
+        reconhecível, basta uma consulta ao memo; senão procura em todos os campos,
+        primeiro pelos nomes e depois pela sigla isolada.
+
+        A coluna de sindicato vem antes dos demais campos. Antes a varredura parava
+        no primeiro campo com um alias, e um cargo como "ASSISTENTE DE COMPRAS"
+        (contém "PR") classificava como PR quem é do SINDPPD RS.
+        """
+        if coluna_sindicato is not None:
+            sigla = self.sigla(registro.get(coluna_sindicato))
+            if sigla:
+                return sigla
+        classificacoes = [
+            self.classificar_valor(value) for value in registro.values() if value
+        ]
+        for por_nome, _ in classificacoes:
+            if por_nome:
+                return por_nome
+        for _, isolada in classificacoes:
+            if isolada:
+                return isolada
+        return ""
+
+
+class ConsultasLocais:
+    """
+    Responde localmente perguntas de contagem, agrupamento, filtro e busca por
+    matrícula sobre as bases, para que só a tabela calculada vá para o prompt final
+    (em vez da planilha inteira serializada).
+
+    Retorna None quando não reconhece a pergunta, e o fluxo segue pelo método antigo.
+    """
+
+    # Base -> (arquivo, prefixos de palavras que identificam a base na pergunta)
+    BASES = {
+        "ferias": ("FÉRIAS.xlsx", ["ferias"]),
+        "desligados": ("DESLIGADOS.xlsx", ["deslig", "demiss", "demit"]),
+        "admissoes": ("ADMISSÃO ABRIL.xlsx", ["admiss", "admit", "contratad"]),
+        "afastamentos": ("AFASTAMENTOS.xlsx", ["afast", "licenca"]),
+        "aprendiz": ("APRENDIZ.xlsx", ["aprendiz"]),
+        "estagio": ("ESTÁGIO.xlsx", ["estagi"]),
+        "exterior": ("EXTERIOR.xlsx", ["exterior"]),
+        "ativos": (
+            "ATIVOS.xlsx",
+            ["ativo", "colaborador", "funcionari", "empregad", "headcount"],
+        ),
+    }
+    CAMPOS_AGRUPAMENTO = {
+        "sindicato": ["sindicato", "sindicatos", "estado", "estados", "uf"],
+        "cargo": ["cargo", "cargos", "funcao", "funcoes"],
+        "situacao": ["situacao", "situacoes", "status"],
+    }
+    TERMOS_CONTAGEM = {"quantos", "quantas", "quantidade", "total", "numero", "contar"}
+    TERMOS_LISTAGEM = {
+        "quais",
+        "liste",
+        "listar",
+        "lista",
+        "mostre",
+        "mostrar",
+        "exiba",
+    }
+    LIMITE_LINHAS = 30
+
+    def __init__(self, leitor):
+        self.leitor = leitor
+
+    def responder(self, pergunta):
+        """
+        Retorna {"descricao": ..., "tabela": ...} ou None se a pergunta não for do tipo
+        que as consultas locais sabem responder
+        """
+        tokens = _tokenizar(pergunta)
+        conjunto = set(tokens)
+
+        matriculas = [
+            numero
+            for numero in re.findall(r"\b\d{4,}\b", pergunta)
+            if len(numero) >= 5 or conjunto & {"matricula", "matriculas"}
+        ]
+        if matriculas:
+            return self._buscar_matriculas(matriculas)
+
+        bases = self._identificar_bases(tokens)
+        if not bases:
+            return None
+        campo = self._identificar_agrupamento(tokens)
+        contagem = bool(conjunto & self.TERMOS_CONTAGEM)
+        listagem = bool(conjunto & self.TERMOS_LISTAGEM)
+        if not (campo or contagem or listagem):
+            return None
+
+        sigla = self.leitor.classificador_sindicato.detectar_em_texto(pergunta)
+        secoes = []
+        descricoes = []
+        for base in bases:
+            registros, esquema = self._carregar(base)
+            registros, filtros = self._filtrar(pergunta, registros, esquema, sigla)
+            rotulo = base + (f" [{', '.join(filtros)}]" if filtros else "")
+            if campo:
+                secoes.append(self._agrupar(rotulo, registros, esquema, campo))
+                descricoes.append(f"{base} agrupado por {campo}")
+            elif contagem:
+                secoes.append(
+                    f"=== CONSULTA LOCAL: {rotulo} ===\n"
+                    f"Total de registros: {len(registros)}\n"
+                )
+                descricoes.append(f"contagem de {base}")
+            else:
+                secoes.append(self._listar(rotulo, registros, esquema))
+                descricoes.append(f"listagem de {base}")
+        return {"descricao": "; ".join(descricoes), "tabela": "\n".join(secoes)}
+
+    def _identificar_bases(self, tokens):
+        # Bases específicas (férias, desligados...) têm precedência sobre "ativos",
+        # já que "funcionários em férias" fala da base de férias
+        encontradas = []
+        for base, (_, prefixos) in self.BASES.items():
+            if base == "ativos" and encontradas:
+                continue
+            if any(
+                token.startswith(prefixo) for token in tokens for prefixo in prefixos
+            ):
+                encontradas.append(base)
+        return encontradas
+
+    def _identificar_agrupamento(self, tokens):
+        for i, token in enumerate(tokens):
+            if token != "por":
+                continue
+            for seguinte in tokens[i + 1 : i + 3]:
+                for campo, termos in self.CAMPOS_AGRUPAMENTO.items():
+                    if seguinte in termos:
+                        return campo
+        return None
+
+    def _carregar(self, base):
+        dados = self.leitor.extrair_dados_estruturados(self.BASES[base][0])
+        return dados["dados"], resolver_esquema(dados["headers"])
+
+    def _ativos_por_matricula(self):
+        registros, esquema = self._carregar("ativos")
+        coluna = esquema.coluna("matricula")
+        if coluna is None:
+            return {}, esquema
+        return {
+            str(registro.get(coluna, "")).strip(): registro for registro in registros
+        }, esquema
+
+    def _valor_campo(self, registro, esquema, campo, ativos=None):
+        """
+        Valor do campo no registro; se a base não tem a coluna, busca no cadastro de
+        ativos pela matrícula
+        """
+        coluna = esquema.coluna(campo)
+        if coluna is None and ativos is not None:
+            ativos_map, esquema_ativos = ativos
+            registro = ativos_map.get(str(esquema.valor(registro, "matricula")).strip())
+            coluna = esquema_ativos.coluna(campo)
+            if registro is None or coluna is None:
+                return ""
+        valor = str(registro.get(coluna, "")).strip() if coluna else ""
+        if campo == "sindicato" and valor:
+            return self.leitor.classificador_sindicato.sigla(valor) or valor
+        return valor
+
+    def _filtrar(self, pergunta, registros, esquema, sigla):
+        filtros = []
+        ativos = None
+        if esquema.coluna("sindicato") is None or esquema.coluna("cargo") is None:
+            ativos = self._ativos_por_matricula()
+        if sigla:
+            registros = [
+                r
+                for r in registros
+                if self._valor_campo(r, esquema, "sindicato", ativos) == sigla
+            ]
+            filtros.append(f"sindicato={sigla}")
+
+        coluna_situacao = esquema.coluna("situacao")
+        if coluna_situacao is not None:
+            pergunta_normalizada = f" {_normalizar_cabecalho(pergunta)} "
+            situacoes = {str(r.get(coluna_situacao, "")).strip() for r in registros} - {
+                ""
+            }
+            escolhidas = {
+                situacao
+                for situacao in situacoes
+                if len(_normalizar_cabecalho(situacao)) >= 4
+                and f" {_normalizar_cabecalho(situacao)} " in pergunta_normalizada
+            }
+            if escolhidas:
+                registros = [
+                    r
+                    for r in registros
+                    if str(r.get(coluna_situacao, "")).strip() in escolhidas
+                ]
+                filtros.append(f"situação={'/'.join(sorted(escolhidas))}")
+        return registros, filtros
+
+    def _agrupar(self, rotulo, registros, esquema, campo):
+        ativos = self._ativos_por_matricula() if esquema.coluna(campo) is None else None
+        contagem = Counter(
+            self._valor_campo(r, esquema, campo, ativos) or "(não informado)"
+            for r in registros
+        )
+        linhas = [f"=== CONSULTA LOCAL: {rotulo} por {campo} ==="]
+        linhas.append(f"{campo} | quantidade")
+        for valor, quantidade in contagem.most_common():
+            linhas.append(f"{valor} | {quantidade}")
+        linhas.append(f"TOTAL | {len(registros)}")
+        return "\n".join(linhas) + "\n"
+
+    def _listar(self, rotulo, registros, esquema):
+        headers = list(esquema.headers)
+        linhas = [f"=== CONSULTA LOCAL: {rotulo} ==="]
+        linhas.append(f"Total de registros: {len(registros)}")
+        linhas.append(" | ".join(headers))
+        for registro in registros[: self.LIMITE_LINHAS]:
+            linhas.append(" | ".join(str(registro.get(h, "")) for h in headers))
+        if len(registros) > self.LIMITE_LINHAS:
+            linhas.append(
+                f"... mais {len(registros) - self.LIMITE_LINHAS} registros não listados"
+            )
+        return "\n".join(linhas) + "\n"
+
+    def _buscar_matriculas(self, matriculas):
+        procuradas = set(matriculas)
+        linhas = [f"=== CONSULTA LOCAL: matrícula {', '.join(matriculas)} ==="]
+        encontrados = 0
+        for base, (arquivo, _) in self.BASES.items():
+            registros, esquema = self._carregar(base)
+            coluna = esquema.coluna("matricula")
+            if coluna is None:
+                continue
+            for registro in registros:
+                if str(registro.get(coluna, "")).strip() in procuradas:
+                    encontrados += 1
+                    campos = ", ".join(
+                        f"{chave}: {valor}"
+                        for chave, valor in registro.items()
+                        if valor
+                    )
+                    linhas.append(f"[{arquivo}] {campos}")
+        if not encontrados:
+            linhas.append("Nenhum registro encontrado nas bases.")
+        return {
+            "descricao": f"busca por matrícula {', '.join(matriculas)}",
+            "tabela": "\n".join(linhas) + "\n",
+        }
+
+
+class RespostaModelo:
+    """
+    Resposta mínima no formato do Gemini (atributo text), usada pelo cache e pelo
+    modelo fake
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloFake:
+    """
+    Modelo local e determinístico com a mesma interface do Gemini
+    (generate_content(prompt) -> objeto com .text), para rodar e medir o agente
+    sem rede. Selecionado com MODELO_LLM=fake.
+    """
+
+    model_name = "fake-local"
+
+    def __init__(self, latencia_segundos=0.0):
+        self.latencia_segundos = latencia_segundos
+        self.chamadas = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.chamadas += 1
+        if self.latencia_segundos:
+            time.sleep(self.latencia_segundos)
+        texto = self._responder(prompt)
+        if stream:
+            # Pedaços de algumas palavras, como o streaming do Gemini
+            palavras = re.findall(r"\S+\s*", texto)
+            return [
+                RespostaModelo("".join(palavras[i : i + 8]))
+                for i in range(0, len(palavras), 8)
+            ]
+        return RespostaModelo(texto)
+
+    @staticmethod
+    def _responder(prompt):
+        if "Responda APENAS em três linhas" in prompt:
+            return "tipo: excel\nexcel: ler_todas_planilhas\npdf: ler_todos_pdfs"
+        if "RESPONDA APENAS COM JSON VÁLIDO" in prompt:
+            # Sem funcionários: o consolidado segue pelo processamento local
+            return '{"funcionarios": [], "totais": {}}'
+        dados = prompt.split("DADOS OBTIDOS:", 1)[-1]
+        dados = dados.split("Analise os dados", 1)[0].strip()
+        resumo = " ".join(dados.split())[:500]
+        return f"[Resposta do modelo local] {resumo}"
+
+
+class ModeloInstrumentado:
+    """
+    Envolve o modelo e registra em METRICAS a duração e os bytes (prompt +
+    resposta) de cada chamada, inclusive as em streaming
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+
+    def __getattr__(self, nome):
+        return getattr(self.model, nome)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._medir_stream(prompt, stream=True, **kwargs)
+        with METRICAS.medir("llm", modelo=self.model_name) as medicao:
+            response = self.model.generate_content(prompt, **kwargs)
+            medicao.bytes = len(str(prompt).encode("utf-8")) + len(
+                (getattr(response, "text", "") or "").encode("utf-8")
+            )
+        return response
+
+    def _medir_stream(self, prompt, **kwargs):
+        with METRICAS.medir("llm", modelo=self.model_name) as medicao:
+            medicao.bytes = len(str(prompt).encode("utf-8"))
+            for chunk in self.model.generate_content(prompt, **kwargs):
+                medicao.bytes += len((getattr(chunk, "text", "") or "").encode("utf-8"))
+                yield chunk
+
+
+class CacheModelo:
+    """
+    Envolve um modelo (Gemini ou ModeloFake) e guarda as respostas num SQLite,
+    com chave sha256(nome do modelo + prompt), validade (TTL) e limite de entradas
+    (remove as acessadas há mais tempo). Prompts repetidos não voltam ao modelo.
+    """
+
+    def __init__(self, model, caminho_db, ttl_segundos=24 * 3600, max_entradas=5000):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self.caminho_db = caminho_db
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirados = 0
+        self.remocoes = 0
+        pasta = os.path.dirname(caminho_db)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho_db, check_same_thread=False)
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            "chave TEXT PRIMARY KEY, modelo TEXT, texto TEXT, "
+            "criado_em REAL, acessado_em REAL)"
+        )
+        self._conexao.commit()
+
+    def _chave(self, prompt):
+        return hashlib.sha256(
+            f"{self.model_name}\0{prompt}".encode("utf-8")
+        ).hexdigest()
+
+    def _buscar(self, chave):
+        agora = time.time()
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT texto, criado_em FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                return None
+            texto, criado_em = linha
+            if self.ttl_segundos is not None and agora - criado_em > self.ttl_segundos:
+                self._conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._conexao.commit()
+                self.expirados += 1
+                return None
+            self._conexao.execute(
+                "UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave)
+            )
+            self._conexao.commit()
+            return texto
+
+    def _guardar(self, chave, texto):
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?)",
+                (chave, self.model_name, texto, agora, agora),
+            )
+            (total,) = self._conexao.execute(
+                "SELECT COUNT(*) FROM respostas"
+            ).fetchone()
+            excedente = total - self.max_entradas
+            if excedente > 0:
+                self._conexao.execute(
+                    "DELETE FROM respostas WHERE chave IN ("
+                    "SELECT chave FROM respostas ORDER BY acessado_em LIMIT ?)",
+                    (excedente,),
+                )
+                self.remocoes += excedente
+            self._conexao.commit()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            kwargs["stream"] = True
+        chave = self._chave(prompt)
+        try:
+            texto = self._buscar(chave)
+        except sqlite3.Error as e:
+            print(f"Cache do modelo indisponível: {e}")
+            return self.model.generate_content(prompt, **kwargs)
+        if texto is not None:
+            with self._lock:
+                self.hits += 1
+            return [RespostaModelo(texto)] if stream else RespostaModelo(texto)
+
+        response = self.model.generate_content(prompt, **kwargs)
+        with self._lock:
+            self.misses += 1
+        if stream:
+            return self._repassar_e_guardar(chave, response)
+        self._guardar_texto(chave, getattr(response, "text", None))
+        return response
+
+    def _repassar_e_guardar(self, chave, chunks):
+        # Repassa os pedaços sem esperar o fim; grava o texto completo ao terminar
+        partes = []
+        for chunk in chunks:
+            partes.append(getattr(chunk, "text", "") or "")
+            yield chunk
+        self._guardar_texto(chave, "".join(partes))
+
+    def _guardar_texto(self, chave, texto):
+        if not texto:
+            return
+        try:
+            self._guardar(chave, texto)
+        except sqlite3.Error as e:
+            print(f"Não foi possível gravar no cache do modelo: {e}")
+
+    def limpar(self):
+        with self._lock:
+            self._conexao.execute("DELETE FROM respostas")
+            self._conexao.commit()
+
+    def estatisticas(self):
+        with self._lock:
+            (entradas,) = self._conexao.execute(
+                "SELECT COUNT(*) FROM respostas"
+            ).fetchone()
+            return {
+                "modelo": self.model_name,
+                "entradas": entradas,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirados": self.expirados,
+                "remocoes": self.remocoes,
+            }
+
+
+class RoteadorPerguntas:
+    """
+    Escolhe localmente as fontes (Excel/PDF) e os métodos para uma pergunta, com
+    TF-IDF sobre as descrições do catálogo de métodos. Só quando a confiança é baixa
+    faz uma única chamada combinada ao modelo.
+    """
+
+    # Descrições usadas para montar o TF-IDF de cada método
+    CATALOGO_EXCEL = {
+        "ler_admissao_abril": "admissao admissoes admitidos admitido contratados "
+        "contratacao novos funcionarios abril data admissao",
+        "ler_afastamentos": "afastamentos afastados afastado licenca maternidade "
+        "auxilio doenca atestado inss",
+        "ler_aprendiz": "aprendiz aprendizes jovem aprendiz",
+        "ler_ativos": "ativos colaboradores funcionarios empregados headcount quadro "
+        "cargo cargos empresa situacao matricula",
+        "ler_base_dias_uteis": "dias uteis base dias uteis mes calendario "
+        "dias trabalhados",
+        "ler_base_sindicato_valor": "valor diario valores vr sindicato sindicatos "
+        "estado estados base sindicato valor",
+        "ler_desligados": "desligados desligamento desligamentos demissao demitidos "
+        "comunicado rescisao",
+        "ler_estagio": "estagio estagiarios estagiario",
+        "ler_exterior": "exterior fora pais expatriados",
+        "ler_ferias": "ferias dias ferias gozo",
+        "ler_vr_mensal": "vr mensal vale refeicao alimentacao consolidado custo "
+        "total empresa profissional desconto",
+    }
+    # Os PDFs cobrem vários assuntos; cada descrição vira um vetor próprio para não
+    # diluir a similaridade de uma pergunta sobre um único tema
+    CATALOGO_PDF = {
+        "ler_todos_pdfs": [
+            "convencao convencoes coletiva acordo cct documento documentos pdf "
+            "vigencia",
+            "clausula clausulas regra regras norma normas direitos prevista",
+            "piso salarial salario reajuste correcao",
+            "jornada hora horas extra extras adicional noturno banco",
+            "beneficio beneficios vale refeicao alimentacao plr auxilio creche",
+        ],
+    }
+    METODOS_EXCEL = list(CATALOGO_EXCEL) + ["ler_todas_planilhas"]
+    METODOS_PDF = [
+        f"ler_sindicato_pdf('{sigla}')" for sigla in ("RJ", "SP", "RS", "PR")
+    ]
+    METODOS_PDF.append("ler_todos_pdfs")
+
+    LIMIAR_FONTE = 0.12
+    MARGEM_METODO = 0.05
+
+    def __init__(self, classificador_sindicato=None):
+        self.classificador_sindicato = classificador_sindicato
+        descricoes = []
+        for metodo, textos in {**self.CATALOGO_EXCEL, **self.CATALOGO_PDF}.items():
+            for texto in [textos] if isinstance(textos, str) else textos:
+                descricoes.append((metodo, Counter(self._termos(texto))))
+        frequencia_documentos = Counter(
+            termo for _, termos in descricoes for termo in termos
+        )
+        self.idf = {
+            termo: math.log((1 + len(descricoes)) / (1 + df)) + 1
+            for termo, df in frequencia_documentos.items()
+        }
+        self.vetores = [(metodo, self._vetor(termos)) for metodo, termos in descricoes]
+        self.contadores = Counter()
+
+    @staticmethod
+    def _termos(texto):
+        # Radical de 5 letras aproxima plurais e derivações (desligados/desligamento)
+        return [
+            token[:5]
+            for token in _tokenizar(texto)
+            if token not in IndiceBM25.STOPWORDS and not token.isdigit()
+        ]
+
+    def _vetor(self, termos):
+        vetor = {
+            termo: (1 + math.log(freq)) * self.idf[termo]
+            for termo, freq in termos.items()
+            if termo in self.idf
+        }
+        norma = math.sqrt(sum(peso * peso for peso in vetor.values())) or 1.0
+        return {termo: peso / norma for termo, peso in vetor.items()}
+
+    def pontuar(self, pergunta):
+        """
+        Similaridade (cosseno) da pergunta com cada método do catálogo
+        """
+        consulta = self._vetor(Counter(self._termos(pergunta)))
+        pontuacoes = {}
+        for metodo, vetor in self.vetores:
+            score = sum(
+                peso * vetor.get(termo, 0.0) for termo, peso in consulta.items()
+            )
+            pontuacoes[metodo] = max(pontuacoes.get(metodo, 0.0), score)
+        return pontuacoes
+
+    def rotear(self, pergunta, model=None):
+        """
+        Retorna {"tipo", "metodo_excel", "metodo_pdf", "caminho", "confianca"}.
+        caminho: "local" (sem LLM), "llm" (uma chamada combinada) ou "padrao"
+        """
+        pontuacoes = self.pontuar(pergunta)
+        excel = sorted(((pontuacoes[m], m) for m in self.CATALOGO_EXCEL), reverse=True)
+        score_pdf = pontuacoes["ler_todos_pdfs"]
+        sigla = (
+            self.classificador_sindicato.detectar_em_texto(pergunta)
+            if self.classificador_sindicato
+            else None
+        )
+
+        tipo = []
+        if excel[0][0] >= self.LIMIAR_FONTE:
+            tipo.append("excel")
+        if score_pdf >= self.LIMIAR_FONTE:
+            tipo.append("pdf")
+        confianca = max(excel[0][0], score_pdf)
+
+        if tipo:
+            rota = {
+                "tipo": tipo,
+                "metodo_excel": (
+                    excel[0][1]
+                    if excel[0][0] - excel[1][0] >= self.MARGEM_METODO
+                    else "ler_todas_planilhas"
+                ),
+                "metodo_pdf": (
+                    f"ler_sindicato_pdf('{sigla}')" if sigla else "ler_todos_pdfs"
+                ),
+                "caminho": "local",
+                "confianca": round(confianca, 3),
+            }
+        else:
+            rota = self._rotear_com_modelo(pergunta, model)
+            rota["confianca"] = round(confianca, 3)
+        self.contadores[rota["caminho"]] += 1
+        return rota
+
+    def _rotear_com_modelo(self, pergunta, model):
+        """
+        Uma única chamada ao modelo escolhe as fontes e os dois métodos de uma vez
+        """
+        rota = {
+            "tipo": ["excel"],
+            "metodo_excel": "ler_todas_planilhas",
+            "metodo_pdf": "ler_todos_pdfs",
+            "caminho": "padrao",
+        }
+        if model is None:
+            return rota
+
+        prompt_roteamento = f"""
+        Você é um agente especialista em dados de RH e documentos sindicais. Baseado na pergunta do usuário, escolha as fontes de dados e os métodos.
+
+        MÉTODOS EXCEL DISPONÍVEIS:
+        {chr(10).join("- " + metodo for metodo in self.METODOS_EXCEL)}
+
+        MÉTODOS PDF DISPONÍVEIS:
+        {chr(10).join("- " + metodo for metodo in self.METODOS_PDF)}
+
+        PERGUNTA DO USUÁRIO: {pergunta}
+
+        Responda APENAS em três linhas, neste formato:
+        tipo: excel | pdf | excel,pdf
+        excel: <nome exato do método Excel>
+        pdf: <nome exato do método PDF>
+        """
+
+        try:
+            response = model.generate_content(prompt_roteamento)
+            texto = response.text.strip()
+        except Exception as e:
+            print(f"Roteamento pelo modelo falhou, usando padrão: {e}")
+            return rota
+
+        campos = dict(
+            (chave.strip().lower(), valor.strip())
+            for chave, valor in re.findall(
+                r"^\s*(tipo|excel|pdf)\s*:\s*(.+)$", texto, re.M | re.I
+            )
+        )
+        tipo = [
+            fonte
+            for fonte in ("excel", "pdf")
+            if fonte in campos.get("tipo", "").lower()
+        ]
+        rota["tipo"] = tipo or ["excel"]
+        if campos.get("excel") in self.METODOS_EXCEL:
+            rota["metodo_excel"] = campos["excel"]
+        if campos.get("pdf") in self.METODOS_PDF:
+            rota["metodo_pdf"] = campos["pdf"]
+        rota["caminho"] = "llm"
+        return rota
+
+    def estatisticas(self):
+        """
+        Quantas perguntas seguiram cada caminho de roteamento
+        """
+        return dict(self.contadores)
+
+
+class _ColunaCategorica:
+    """
+    Coluna com poucos valores distintos: cada valor é guardado uma vez e as linhas
+    guardam só o código (array de inteiros sem sinal)
+    """
+
+    __slots__ = ("categorias", "codigos")
+
+    def __init__(self, categorias, codigos):
+        self.categorias = categorias
+        self.codigos = codigos
+
+    def __getstate__(self):
+        return self.categorias, self.codigos
+
+    def __setstate__(self, estado):
+        self.categorias, self.codigos = estado
+
+
+class Registro(Mapping):
+    """
+    Linha de uma TabelaRegistros. Lê os valores direto das colunas da tabela, sem
+    dicionário próprio, e se comporta como o dicionário de strings de antes.
+    """
+
+    __slots__ = ("_tabela", "_indice")
+
+    def __init__(self, tabela, indice):
+        self._tabela = tabela
+        self._indice = indice
+
+    def __getitem__(self, chave):
+        return self._tabela._leitores[self._tabela._posicoes[chave]](self._indice)
+
+    def get(self, chave, padrao=None):
+        posicao = self._tabela._posicoes.get(chave)
+        if posicao is None:
+            return padrao
+        return self._tabela._leitores[posicao](self._indice)
+
+    def __iter__(self):
+        return iter(self._tabela._chaves)
+
+    def __len__(self):
+        return len(self._tabela._chaves)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TabelaRegistros(Sequence):
+    """
+    Registros de uma planilha guardados por coluna, no lugar da lista de
+    dicionários de strings. Colunas com poucos valores distintos (cargo, sindicato,
+    situação...) viram categorias com códigos em array; colunas só de inteiros
+    (matrícula) viram array("q"); o resto fica numa lista de strings já
+    deduplicadas. Cada item é um Registro, com a mesma interface de leitura do
+    dicionário; fatias devolvem dicionários comuns (amostras para o prompt).
+
+    Colunas com tipo no esquema (datas, inteiros, decimais) guardam os valores
+    nativos já convertidos por coagir_celula; células inválidas viram None e ficam
+    registradas em `problemas`.
+    """
+
+    # Coluna vira categórica se tiver até esta fração de valores distintos
+    FRACAO_CATEGORICA = 0.5
+    INTEIRO_CANONICO = re.compile(r"-?(?:0|[1-9]\d{0,17})")
+
+    def __init__(self, headers, colunas, total, problemas=()):
+        self.headers = list(headers)
+        self._colunas = colunas
+        self._total = total
+        self.problemas = list(problemas)
+        self._preparar()
+
+    def _preparar(self):
+        # Cabeçalhos repetidos: como no dicionário, vale a última coluna
+        self._posicoes = {header: i for i, header in enumerate(self.headers)}
+        self._chaves = list(self._posicoes)
+        self._leitores = [self._leitor(coluna) for coluna in self._colunas]
+
+    def __getstate__(self):
+        return self.headers, self._colunas, self._total, self.problemas
+
+    def __setstate__(self, estado):
+        self.headers, self._colunas, self._total, self.problemas = estado
+        self._preparar()
+
+    @staticmethod
+    def _leitor(coluna):
+        if isinstance(coluna, _ColunaCategorica):
+            categorias, codigos = coluna.categorias, coluna.codigos
+            return lambda i: categorias[codigos[i]]
+        if isinstance(coluna, array):
+            return lambda i: str(coluna[i])
+        return coluna.__getitem__
+
+    @classmethod
+    def de_linhas(cls, headers, linhas, tipos=None):
+        """
+        Monta a tabela a partir das linhas da planilha (tuplas de células), com a
+        mesma conversão de _linha_para_registro: colunas de texto passam por
+        str().strip() (None vira ""), as de `tipos` ({coluna: tipo}) por
+        coagir_celula; linhas vazias são ignoradas e colunas sem cabeçalho viram
+        Col_<i>
+        """
+        headers = list(headers)
+        tipos = tipos or {}
+        if not isinstance(linhas, list):
+            linhas = list(linhas)
+        # A conversão é feita coluna a coluna, que é onde os valores se repetem
+        celulas = list(itertools.zip_longest(*linhas))
+        textos = [
+            [str(cell).strip() if cell is not None else "" for cell in coluna]
+            for coluna in celulas
+        ]
+        preenchidas = [any(linha) for linha in zip(*textos)]
+        if not all(preenchidas):
+            celulas = [
+                list(itertools.compress(coluna, preenchidas)) for coluna in celulas
+            ]
+            textos = [
+                list(itertools.compress(coluna, preenchidas)) for coluna in textos
+            ]
+        total = sum(preenchidas)
+        headers.extend(f"Col_{i}" for i in range(len(headers), len(textos)))
+        textos.extend([""] * total for _ in range(len(textos), len(headers)))
+
+        colunas = []
+        problemas = []
+        for posicao, header in enumerate(headers):
+            tipo = tipos.get(header, "texto")
+            if tipo == "texto" or posicao >= len(celulas):
+                colunas.append(cls._compactar(textos[posicao]))
+                continue
+            valores, invalidos = cls._coagir_coluna(celulas[posicao], tipo)
+            if invalidos:
+                problemas.append(
+                    f"coluna '{header}' ({tipo}): {len(invalidos)} valor(es) "
+                    f"inválido(s), ex.: {invalidos[0]!r}"
+                )
+            colunas.append(cls._compactar(valores, texto=False))
+        return cls(headers, colunas, total, problemas)
+
+    @staticmethod
+    def _coagir_coluna(celulas, tipo):
+        """
+        Converte as células de uma coluna tipada; retorna (valores, inválidos)
+        """
+        valores = []
+        invalidos = []
+        convertidos = {}
+        for cell in celulas:
+            try:
+                # Datas e códigos se repetem: cada valor distinto é convertido uma vez
+                valor = convertidos[cell]
+            except KeyError:
+                try:
+                    valor = coagir_celula(cell, tipo)
+                except ValueError:
+                    invalidos.append(cell)
+                    valor = None
+                convertidos[cell] = valor
+            valores.append(valor)
+        return valores, invalidos
+
+    @classmethod
+    def _compactar(cls, valores, texto=True):
+        """
+        Escolhe a representação da coluna a partir dos seus valores (strings, ou
+        valores nativos já convertidos quando texto=False)
+        """
+        distintos = list(dict.fromkeys(valores))
+        if len(distintos) <= max(16, len(valores) * cls.FRACAO_CATEGORICA):
+            codigo = {valor: i for i, valor in enumerate(distintos)}
+            tipo = "H" if len(distintos) <= 0xFFFF else "I"
+            return _ColunaCategorica(
+                distintos, array(tipo, map(codigo.__getitem__, valores))
+            )
+        if texto and all(cls.INTEIRO_CANONICO.fullmatch(valor) for valor in distintos):
+            return array("q", map(int, valores))
+        # Valores iguais passam a apontar para o mesmo objeto
+        unicos = {valor: valor for valor in distintos}
+        return list(map(unicos.__getitem__, valores))
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [
+                dict(Registro(self, i)) for i in range(*indice.indices(self._total))
+            ]
+        if indice < 0:
+            indice += self._total
+        if not 0 <= indice < self._total:
+            raise IndexError("índice fora da tabela")
+        return Registro(self, indice)
+
+    def __iter__(self):
+        for i in range(self._total):
+            yield Registro(self, i)
+
+    def __repr__(self):
+        return f"TabelaRegistros({self._total} registros, colunas={self._chaves})"
+
+    def coluna(self, nome):
+        """
+        Valores de uma coluna como array NumPy de objetos (strings ou valores
+        nativos nas colunas tipadas)
+        """
+        coluna = self._colunas[self._posicoes[nome]]
+        if isinstance(coluna, _ColunaCategorica):
+            categorias = np.empty(len(coluna.categorias), dtype=object)
+            categorias[:] = coluna.categorias
+            return categorias[
+                np.frombuffer(coluna.codigos, dtype=coluna.codigos.typecode)
+            ]
+        if isinstance(coluna, array):
+            return np.frombuffer(coluna, dtype=np.int64).astype(str).astype(object)
+        valores = np.empty(len(coluna), dtype=object)
+        valores[:] = coluna
+        return valores
+
+    def para_dataframe(self):
+        """
+        DataFrame (dtype object) equivalente ao montado a partir da lista de
+        dicionários
         """
-        Extrai o sindicato do registro do funcionário de forma flexível, considerando variações de nomes e siglas.
-        Não cria novas colunas nem descarta registros.
+        return pd.DataFrame(
+            {chave: self.coluna(chave) for chave in self._chaves},
+            columns=self._chaves,
+            dtype=object,
+        )
+
+
+def registros_materializados(dados):
+    """
+    True quando os registros da base estão em memória (lista ou TabelaRegistros),
+    False para o gerador do modo streaming
+    """
+    return isinstance(dados, (list, TabelaRegistros))
+
+
+class DatasetCompetencia(Mapping):
+    """
+    Bases de uma competência, lidas uma vez e compartilhadas por todas as etapas da
+    consolidação. Funciona como um dicionário somente leitura (dataset["ativos"]),
+    e os mapas derivados (admissões, sindicatos, dias úteis, valores) são calculados
+    na primeira chamada e guardados.
+
+    Em streaming, a base de ativos é um iterador de uma passagem só; o mapa de
+    sindicatos é montado durante essa passagem, sem reler a planilha.
+    """
+
+    def __init__(self, competencia, bases):
+        self.competencia = competencia
+        self._bases = dict(bases)
+        self._mapas = {}
+        self._lock = threading.Lock()
+        self._sindicatos_streaming = None
+        ativos = self._bases.get("ativos")
+        if ativos is not None and not registros_materializados(ativos["dados"]):
+            self._sindicatos_streaming = {}
+            self._streaming_completo = False
+            ativos["dados"] = self._registrar_sindicatos(ativos, ativos["dados"])
+
+    def __getitem__(self, nome):
+        return self._bases[nome]
+
+    def __iter__(self):
+        return iter(self._bases)
+
+    def __len__(self):
+        return len(self._bases)
+
+    def _mapa(self, nome, calcular):
+        with self._lock:
+            if nome not in self._mapas:
+                self._mapas[nome] = calcular()
+            return self._mapas[nome]
+
+    def _colunas_sindicato(self, ativos):
+        esquema = LeitorPlanilhas._esquema(
+            ativos, "ativos", obrigatorios=("matricula", "sindicato")
+        )
+        return esquema.coluna("matricula"), esquema.coluna("sindicato")
+
+    def _registrar_sindicatos(self, ativos, registros):
+        coluna_matricula, coluna_sindicato = self._colunas_sindicato(ativos)
+        for row in registros:
+            if coluna_matricula is not None and coluna_sindicato is not None:
+                matricula = str(row.get(coluna_matricula) or "").strip()
+                sindicato_nome = row.get(coluna_sindicato)
+                if matricula and sindicato_nome:
+                    self._sindicatos_streaming[matricula] = str(sindicato_nome)
+            yield row
+        self._streaming_completo = True
+
+    def mapa_admissoes(self):
         """
-        # Lista de possíveis siglas e nomes de sindicatos
-        sindicatos = [
-            (
-                "SP",
+        Matrícula -> data de admissão (sem a hora)
+        """
+        return self._mapa("admissoes", self._calcular_admissoes)
+
+    def mapa_sindicatos(self):
+        """
+        Matrícula -> nome completo do sindicato, da base de ativos
+        """
+        return self._mapa("sindicatos", self._calcular_sindicatos)
+
+    def mapa_dias_uteis(self):
+        """
+        Sindicato -> dias úteis, da base de dias úteis
+        """
+        return self._mapa("dias_uteis", self._calcular_dias_uteis)
+
+    def mapa_valores_sindicato(self):
+        """
+        Sindicato/estado -> valor diário, da base sindicato x valor
+        """
+        return self._mapa("valores_sindicato", self._calcular_valores_sindicato)
+
+    def _calcular_admissoes(self):
+        dados_admissoes = self._bases["admissoes"]
+        admissoes_map = {}
+        esquema_admissoes = LeitorPlanilhas._esquema(
+            dados_admissoes, "admissões", obrigatorios=("matricula", "admissao")
+        )
+        coluna_matricula = esquema_admissoes.coluna("matricula")
+        coluna_admissao = esquema_admissoes.coluna("admissao")
+        for row in dados_admissoes["dados"]:
+            matricula = str(row.get(coluna_matricula) or "").strip()
+            # A coluna de admissão já chega como date (esquema de tipos)
+            data_admissao = row.get(coluna_admissao) or ""
+            if matricula:
+                admissoes_map[matricula] = data_admissao
+        return admissoes_map
+
+    def _calcular_sindicatos(self):
+        if self._sindicatos_streaming is not None:
+            # Termina a passagem pelos ativos se nenhuma etapa a consumiu inteira
+            if not self._streaming_completo:
+                for _ in self._bases["ativos"]["dados"]:
+                    pass
+            return self._sindicatos_streaming
+        dados_ativos = self._bases["ativos"]
+        sindicato_map = {}
+        coluna_matricula, coluna_sindicato = self._colunas_sindicato(dados_ativos)
+        if coluna_matricula is not None and coluna_sindicato is not None:
+            for row in dados_ativos["dados"]:
+                matricula = str(row.get(coluna_matricula) or "").strip()
+                sindicato_nome = row.get(coluna_sindicato)
+                if matricula and sindicato_nome:
+                    sindicato_map[matricula] = str(sindicato_nome)
+        return sindicato_map
+
+    def _calcular_dias_uteis(self):
+        dias_uteis_map = {}
+        if not self._base_dias_uteis_vale():
+            return dias_uteis_map
+        for row in self._bases["dias_uteis"]["dados"]:
+            for key, value in row.items():
+                if value and any(
+                    s in str(value).upper()
+                    for s in ["SP", "RJ", "RS", "PR", "SINDPD", "SITEPD"]
+                ):
+                    sindicato_nome = str(value).strip()
+                    # Encontrar valor de dias
+                    for k2, v2 in row.items():
+                        if k2 == key:
+                            continue
+                        try:
+                            dias = coagir_celula(v2, "inteiro")
+                        except ValueError:
+                            continue
+                        if dias is not None and dias >= 0:
+                            dias_uteis_map[sindicato_nome] = dias
+                            break
+                    break
+        return dias_uteis_map
+
+    def _base_dias_uteis_vale(self):
+        """
+        A base de dias úteis é de um período só ("DE 15/04 a 15/05"); para outra
+        competência os dias saem do calendário
+        """
+        if not self.competencia:
+            return True
+        titulo = " ".join(str(h) for h in self._bases["dias_uteis"]["headers"] if h)
+        periodo = re.search(
+            r"\d{1,2}/(\d{1,2})\s*A\s*\d{1,2}/(\d{1,2})", titulo.upper()
+        )
+        if periodo is None:
+            return True
+        try:
+            mes = int(normalizar_competencia(self.competencia)[:2])
+        except ValueError:
+            return True
+        if int(periodo.group(2)) == mes:
+            return True
+        print(
+            f"Base de dias úteis ({titulo.strip()}) não cobre {self.competencia}; "
+            "usando os dias úteis do calendário"
+        )
+        return False
+
+    def _calcular_valores_sindicato(self):
+        valor_sindicato_map = {}
+        for row in self._bases["base_sindicato"]["dados"]:
+            for key, value in row.items():
+                if value and any(
+                    s in str(value).upper()
+                    for s in ["SP", "RJ", "RS", "PR", "SINDPD", "SITEPD"]
+                ):
+                    sindicato_nome = str(value).strip()
+                    # Encontrar valor
+                    for k2, v2 in row.items():
+                        if k2 != key and v2:
+                            try:
+                                valor_sindicato_map[sindicato_nome] = coagir_celula(
+                                    v2, "decimal"
+                                )
+                            except ValueError:
+                                valor_sindicato_map[sindicato_nome] = v2
+                            break
+                    break
+        return valor_sindicato_map
+
+
+class _ExportadorCsv:
+    """
+    Grava as linhas do consolidado em CSV, lote a lote
+    """
+
+    def __init__(self, caminho, colunas):
+        self._arquivo = open(caminho, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._arquivo)
+        self._writer.writerow(colunas)
+
+    def escrever(self, lote):
+        self._writer.writerows(lote)
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class _ExportadorJsonl:
+    """
+    Grava as linhas do consolidado em JSON Lines (um objeto por funcionário)
+    """
+
+    def __init__(self, caminho, colunas):
+        self._arquivo = open(caminho, "w", encoding="utf-8")
+        self._colunas = colunas
+
+    def escrever(self, lote):
+        self._arquivo.writelines(
+            json.dumps(dict(zip(self._colunas, linha)), ensure_ascii=False, default=str)
+            + "\n"
+            for linha in lote
+        )
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class _ExportadorParquet:
+    """
+    Grava as linhas do consolidado em Parquet, um row group por lote (requer pyarrow)
+    """
+
+    NUMERICAS = {
+        "Dias",
+        "VALOR DIÁRIO VR",
+        "TOTAL",
+        "Custo empresa",
+        "Desconto profissional",
+    }
+
+    def __init__(self, caminho, colunas):
+        self._colunas = colunas
+        self._schema = pyarrow.schema(
+            [
+                (
+                    coluna,
+                    pyarrow.float64() if coluna in self.NUMERICAS else pyarrow.string(),
+                )
+                for coluna in colunas
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(caminho, self._schema)
+
+    def escrever(self, lote):
+        colunas = list(zip(*lote))
+        arrays = [
+            pyarrow.array(
                 [
-                    "SINDPD SP",
-                    "SINDPD-SP",
-                    "SINDPDSP",
-                    "SP",
-                    "SÃO PAULO",
-                    "SAO PAULO",
-                    "SINDICATO SP",
-                    "SINDICATO SÃO PAULO",
-                    "SINDICATO SAO PAULO",
-                    "SITEPD SP",
-                    "SITEPD-SP",
-                    "SITEPDSP",
+                    (
+                        float(v)
+                        if coluna in self.NUMERICAS
+                        else (None if v is None else str(v))
+                    )
+                    for v in valores
                 ],
-            ),
-            (
+                type=campo.type,
+            )
+            for coluna, campo, valores in zip(self._colunas, self._schema, colunas)
+        ]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def fechar(self):
+        self._writer.close()
+
+
+EXPORTADORES_CONSOLIDADO = {
+    "csv": _ExportadorCsv,
+    "jsonl": _ExportadorJsonl,
+    "parquet": _ExportadorParquet,
+}
+FORMATOS_CONSOLIDADO = ("xlsx", *EXPORTADORES_CONSOLIDADO)
+
+
+def validar_formatos_consolidado(formatos):
+    """
+    Tupla de formatos sem repetições; levanta ValueError se `formatos` não for uma
+    lista de nomes conhecidos (uma string "csv" não vira ("c", "s", "v"))
+    """
+    if not isinstance(formatos, (list, tuple)) or not formatos:
+        raise ValueError('formatos deve ser uma lista não vazia, ex.: ["xlsx", "csv"]')
+    desconhecidos = [
+        formato for formato in formatos if formato not in FORMATOS_CONSOLIDADO
+    ]
+    if desconhecidos:
+        raise ValueError(
+            f"Formatos desconhecidos: {desconhecidos} "
+            f"(disponíveis: {list(FORMATOS_CONSOLIDADO)})"
+        )
+    return tuple(dict.fromkeys(formatos))
+
+
+class FilaConsolidados:
+    """
+    Executa gerar_consolidado_vr em segundo plano, com no máximo max_workers
+    consolidações simultâneas. Cada envio vira um job com id, status e progresso;
+    envios para uma competência que já está na fila ou em execução reaproveitam o
+    job existente.
+    """
+
+    ATIVOS = ("pendente", "executando")
+
+    def __init__(self, leitor, max_workers=1, max_historico=100):
+        self.leitor = leitor
+        self.max_historico = max_historico
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="consolidado"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submeter(self, competencia=None, streaming=False, formatos=("xlsx",)):
+        """
+        Agenda a consolidação e retorna o job (novo ou o já ativo da competência).
+        Levanta ValueError para competência ou formatos inválidos.
+        """
+        competencia = normalizar_competencia(competencia)
+        formatos = validar_formatos_consolidado(formatos)
+        chave = f"{competencia}|{int(bool(streaming))}|{','.join(sorted(formatos))}"
+        with self._lock:
+            for job in self._jobs.values():
+                if job["chave"] == chave and job["status"] in self.ATIVOS:
+                    return dict(job, deduplicado=True)
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "chave": chave,
+                "competencia": competencia,
+                "streaming": bool(streaming),
+                "status": "pendente",
+                "progresso": 0,
+                "mensagem": "Aguardando na fila",
+                "criado_em": datetime.now().isoformat(timespec="seconds"),
+                "iniciado_em": None,
+                "concluido_em": None,
+                "formatos": list(formatos),
+                "arquivo": None,
+                "arquivos": {},
+                "resumo": None,
+                "erro": None,
+            }
+            self._jobs[job["id"]] = job
+            self._limpar_historico()
+            copia = dict(job, deduplicado=False)
+        self._executor.submit(
+            self._executar, job["id"], competencia, streaming, formatos
+        )
+        return copia
+
+    def _atualizar(self, job_id, **campos):
+        with self._lock:
+            self._jobs[job_id].update(campos)
+
+    def _executar(self, job_id, competencia, streaming, formatos):
+        self._atualizar(
+            job_id,
+            status="executando",
+            iniciado_em=datetime.now().isoformat(timespec="seconds"),
+        )
+
+        def progresso(percentual, mensagem):
+            self._atualizar(job_id, progresso=percentual, mensagem=mensagem)
+
+        try:
+            resumo, arquivos = self.leitor._gerar_consolidado(
+                competencia,
+                streaming=streaming,
+                progresso=progresso,
+                formatos=formatos,
+            )
+            if arquivos:
+                campos = {
+                    "status": "concluido",
+                    "progresso": 100,
+                    "arquivo": arquivos.get("xlsx") or next(iter(arquivos.values())),
+                    "arquivos": arquivos,
+                }
+            else:
+                campos = {"status": "erro", "erro": resumo}
+            self._atualizar(
+                job_id,
+                resumo=resumo,
+                mensagem="Consolidado gerado" if arquivos else resumo,
+                **campos,
+            )
+        except Exception as e:
+            print(f"Erro no job de consolidado {job_id}: {e}")
+            self._atualizar(job_id, status="erro", erro=str(e), mensagem=str(e))
+        finally:
+            self._atualizar(
+                job_id, concluido_em=datetime.now().isoformat(timespec="seconds")
+            )
+
+    def _limpar_historico(self):
+        # Remove os jobs finalizados mais antigos além do limite
+        finalizados = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] not in self.ATIVOS
+        ]
+        for job_id in finalizados[: max(0, len(self._jobs) - self.max_historico)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def listar(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def fechar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Leitores ainda abertos; os pools de cada um são encerrados na saída do processo
+_LEITORES_ABERTOS = weakref.WeakSet()
+
+
+@atexit.register
+def _fechar_leitores():
+    for leitor in list(_LEITORES_ABERTOS):
+        leitor.fechar()
+
+
+class LeitorPlanilhas:
+    # Lista de possíveis siglas e nomes de sindicatos
+    SINDICATOS = [
+        (
+            "SP",
+            [
+                "SINDPD SP",
+                "SINDPD-SP",
+                "SINDPDSP",
+                "SP",
+                "SÃO PAULO",
+                "SAO PAULO",
+                "SINDICATO SP",
+                "SINDICATO SÃO PAULO",
+                "SINDICATO SAO PAULO",
+                "SITEPD SP",
+                "SITEPD-SP",
+                "SITEPDSP",
+            ],
+        ),
+        (
+            "RJ",
+            [
+                "SINDPD RJ",
+                "SINDPD-RJ",
+                "SINDPDRJ",
                 "RJ",
-                [
-                    "SINDPD RJ",
-                    "SINDPD-RJ",
-                    "SINDPDRJ",
-                    "RJ",
-                    "RIO DE JANEIRO",
-                    "SINDICATO RJ",
-                    "SINDICATO RIO DE JANEIRO",
-                    "SITEPD RJ",
-                    "SITEPD-RJ",
-                    "SITEPDRJ",
-                ],
-            ),
-            (
+                "RIO DE JANEIRO",
+                "SINDICATO RJ",
+                "SINDICATO RIO DE JANEIRO",
+                "SITEPD RJ",
+                "SITEPD-RJ",
+                "SITEPDRJ",
+            ],
+        ),
+        (
+            "RS",
+            [
+                "SINDPPD RS",
+                "SINDPPD-RS",
+                "SINDPPDRS",
                 "RS",
-                [
-                    "SINDPPD RS",
-                    "SINDPPD-RS",
-                    "SINDPPDRS",
-                    "RS",
-                    "RIO GRANDE DO SUL",
-                    "SINDICATO RS",
-                    "SINDICATO RIO GRANDE DO SUL",
-                    "SITEPD RS",
-                    "SITEPD-RS",
-                    "SITEPDRS",
-                ],
-            ),
-            (
+                "RIO GRANDE DO SUL",
+                "SINDICATO RS",
+                "SINDICATO RIO GRANDE DO SUL",
+                "SITEPD RS",
+                "SITEPD-RS",
+                "SITEPDRS",
+            ],
+        ),
+        (
+            "PR",
+            [
+                "SITEPD PR",
+                "SITEPD-PR",
+                "SITEPDPR",
                 "PR",
-                [
-                    "SITEPD PR",
-                    "SITEPD-PR",
-                    "SITEPDPR",
-                    "PR",
-                    "PARANÁ",
-                    "PARANA",
-                    "SINDICATO PR",
-                    "SINDICATO PARANÁ",
-                    "SINDICATO PARANA",
-                ],
-            ),
-        ]
-        # Procurar em todos os campos do funcionário
-        for key, value in funcionario.items():
-            if not value:
-                continue
-            valor = str(value).upper().strip()
-            for sigla, nomes in sindicatos:
-                for nome in nomes:
-                    if nome in valor:
-                        return sigla
-        # Fallback: procurar sigla isolada (ex: "SP", "RJ", etc.)
-        for key, value in funcionario.items():
-            if not value:
-                continue
-            valor = str(value).upper().strip()
-            for sigla, _ in sindicatos:
-                if re.search(rf"\b{sigla}\b", valor):
-                    return sigla
-        # Se não encontrar, retorna string vazia
-        return ""
+                "PARANÁ",
+                "PARANA",
+                "SINDICATO PR",
+                "SINDICATO PARANÁ",
+                "SINDICATO PARANA",
+            ],
+        ),
+    ]
+
+    # Valor diário padrão do VR por sindicato
+    # Competência usada quando nenhuma é informada
+    COMPETENCIA_PADRAO = "05/2025"
+
+    COLUNAS_PLANILHA_VR = [
+        "Matricula",
+        "Admissão",
+        "Sindicato do Colaborador",
+        "Competência",
+        "Dias",
+        "VALOR DIÁRIO VR",
+        "TOTAL",
+        "Custo empresa",
+        "Desconto profissional",
+        "OBS GERAL",
+    ]
+    FONTE_CABECALHO = Font(bold=True, color="FFFFFF")
+    PREENCHIMENTO_CABECALHO = PatternFill(
+        start_color="366092", end_color="366092", fill_type="solid"
+    )
+    ALINHAMENTO_CABECALHO = Alignment(horizontal="center", vertical="center")
+    # Datas (admissão) saem como células de data do Excel, não como texto
+    FORMATO_DATA_PLANILHA = "dd/mm/yyyy"
+
+    # Bases usadas na consolidação: nome no dataset -> arquivo
+    BASES_CONSOLIDADO = {
+        "ativos": "ATIVOS.xlsx",
+        "ferias": "FÉRIAS.xlsx",
+        "desligados": "DESLIGADOS.xlsx",
+        "admissoes": "ADMISSÃO ABRIL.xlsx",
+        "base_sindicato": "Base sindicato x valor.xlsx",
+        "dias_uteis": "Base dias uteis.xlsx",
+        "afastamentos": "AFASTAMENTOS.xlsx",
+        "aprendiz": "APRENDIZ.xlsx",
+        "estagio": "ESTÁGIO.xlsx",
+        "exterior": "EXTERIOR.xlsx",
+    }
+    TAMANHO_LOTE_EXPORTACAO = 5000
+    # Linhas lidas antes da escrita write_only para estimar as larguras das colunas
+    LINHAS_AMOSTRA_LARGURA = 1000
+    # Bases de que a planilha VR MENSAL precisa para os mapas
+    BASES_PLANILHA_VR = ("ativos", "admissoes", "dias_uteis", "base_sindicato")
+
+    # Fontes de dados de uma pergunta, consultadas em paralelo
+    RAMOS_CONSULTA = ("excel", "pdf")
+
+    VALORES_SINDICATO = {"SP": 20.00, "RJ": 18.00, "RS": 16.00, "PR": 19.00}
+
+    def _extrair_sindicato(self, funcionario, coluna_sindicato=None):
+        """
+        Extrai o sindicato do registro do funcionário de forma flexível, considerando variações de nomes e siglas.
+        Não cria novas colunas nem descarta registros.
+        """
+        return self.classificador_sindicato.classificar_registro(
+            funcionario, coluna_sindicato
+        )
+
+    @staticmethod
+    def _esquema(base, nome_base, obrigatorios=("matricula",)):
+        """
+        Resolve o esquema da base uma vez e avisa logo de papéis ausentes ou ambíguos
+        """
+        esquema = resolver_esquema(base["headers"])
+        if base["headers"]:
+            for problema in esquema.validar(obrigatorios):
+                print(f"Esquema de {nome_base}: {problema}")
+        return esquema
 
     def __init__(
-        self, caminho_pasta="./", caminho_pasta_pdfs="./pdfs", api_key_gemini=None
+        self,
+        caminho_pasta="./",
+        caminho_pasta_pdfs="./pdfs",
+        api_key_gemini=None,
+        cache_workbooks=None,
+        caminho_cache=None,
+        usar_snapshot=True,
+        motor_processamento="python",
+        aliases_sindicato=None,
+        usar_indice_pdfs=True,
+        usar_consultas_locais=True,
+        max_threads_consulta=None,
+        max_consultas_simultaneas=4,
+        max_processos_pdf=0,
+        timeout_excel=60,
+        timeout_pdf=60,
+        modelo=None,
+        usar_cache_llm=True,
+        ttl_cache_llm=24 * 3600,
+        consolidado_em_segundo_plano=False,
+        max_jobs_consolidado=1,
+        escritor_planilha="write_only",
+        caminho_zip=None,
+        max_processos_carga=1,
     ):
         """
         Inicializa o leitor com o caminho da pasta onde estão as planilhas e PDFs
         """
         self.caminho_pasta = caminho_pasta
         self.caminho_pasta_pdfs = caminho_pasta_pdfs
+        # Planilhas dentro de um ZIP têm precedência sobre as de caminho_pasta
+        self.fonte_zip = FonteZip(caminho_zip) if caminho_zip else None
+        # Com max_processos_carga > 1 as bases da consolidação são lidas em paralelo
+        # num pool (criado sob demanda). Desligado por padrão: no benchmark "carga"
+        # o pool saiu mais lento que a leitura sequencial
+        self.max_processos_carga = max_processos_carga
+        self._executor_carga = None
+        self._lock_executor_carga = threading.Lock()
+        self.cache_workbooks = (
+            cache_workbooks if cache_workbooks is not None else CACHE_WORKBOOKS
+        )
+        self.caminho_cache = caminho_cache or os.path.join(os.getcwd(), ".cache")
+        self.motor_processamento = motor_processamento
+        # Escrita da VR MENSAL: "write_only" (padrão), "xlsxwriter" ou "openpyxl"
+        self.escritor_planilha = escritor_planilha
+        self.cache_pdfs = CachePaginasPdf(
+            os.path.join(self.caminho_cache, "pdf"), max_processos=max_processos_pdf
+        )
+        # Ramos Excel e PDF de uma pergunta rodam em paralelo neste pool: uma
+        # thread por ramo para cada pergunta simultânea, para um ramo lento não
+        # deixar na fila os ramos das perguntas seguintes
+        if max_threads_consulta is None:
+            max_threads_consulta = max_consultas_simultaneas * len(self.RAMOS_CONSULTA)
+        self._executor_consultas = ThreadPoolExecutor(
+            max_workers=max_threads_consulta, thread_name_prefix="consulta"
+        )
+        self.timeouts_ramos = {"excel": timeout_excel, "pdf": timeout_pdf}
+        # Consolidado pedido pelo chat vira job em segundo plano (servidor Flask)
+        self.fila_consolidados = (
+            FilaConsolidados(self, max_workers=max_jobs_consolidado)
+            if consolidado_em_segundo_plano
+            else None
+        )
+        _LEITORES_ABERTOS.add(self)
+        self.usar_indice_pdfs = usar_indice_pdfs
+        self.consultas_locais = ConsultasLocais(self) if usar_consultas_locais else None
+        self._indice_pdfs = None
+        self._lock_indice_pdfs = threading.Lock()
+        # Aliases extras de sindicato: parâmetro ou arquivo JSON em SINDICATOS_ALIASES
+        if aliases_sindicato is None and os.getenv("SINDICATOS_ALIASES"):
+            with open(os.getenv("SINDICATOS_ALIASES"), "r", encoding="utf-8") as f:
+                aliases_sindicato = json.load(f)
+        self.classificador_sindicato = ClassificadorSindicato.com_aliases_extras(
+            self.SINDICATOS, aliases_sindicato
+        )
+        self.roteador = RoteadorPerguntas(self.classificador_sindicato)
+        self.ultimo_roteamento = None
+        self.snapshot = (
+            SnapshotPlanilhas(os.path.join(self.caminho_cache, "snapshot"))
+            if usar_snapshot
+            else None
+        )
         self.planilhas = [
             "ADMISSÃO ABRIL.xlsx",
             "AFASTAMENTOS.xlsx",
@@ -126,49 +2851,258 @@ class LeitorPlanilhas:
             "VR MENSAL 05.2025.xlsx",
         ]
         self.pdfs = ["SINDPD RJ.pdf", "SINDPD SP.pdf", "SINDPD RS.pdf", "SITEPD PR.pdf"]
-        if api_key_gemini:
-            genai.configure(api_key=api_key_gemini)
-            self.model = genai.GenerativeModel("gemini-1.5-flash")
-        else:
-            self.model = None
+        # Configuração repassada aos processos do lote de competências
+        self._config_processo = {
+            "caminho_pasta": caminho_pasta,
+            "caminho_pasta_pdfs": caminho_pasta_pdfs,
+            "api_key_gemini": api_key_gemini,
+            "caminho_cache": self.caminho_cache,
+            "usar_snapshot": False,
+            "motor_processamento": motor_processamento,
+            "aliases_sindicato": aliases_sindicato,
+            "usar_indice_pdfs": False,
+            "usar_consultas_locais": False,
+            "usar_cache_llm": usar_cache_llm,
+            "ttl_cache_llm": ttl_cache_llm,
+            "escritor_planilha": escritor_planilha,
+            "caminho_zip": caminho_zip,
+            "max_processos_carga": 1,
+        }
+        # Um modelo injetado não é recriado em outro processo
+        self._modelo_injetado = modelo is not None
+        # Modelo: injetado, fake local (MODELO_LLM=fake) ou Gemini com a API key
+        if modelo is None:
+            if os.getenv("MODELO_LLM", "").lower() == "fake":
+                modelo = ModeloFake()
+            elif api_key_gemini:
+                genai.configure(api_key=api_key_gemini)
+                modelo = genai.GenerativeModel("gemini-1.5-flash")
+        if modelo is not None:
+            # Instrumentado por dentro do cache: só chamadas reais entram em "llm"
+            modelo = ModeloInstrumentado(modelo)
+        if modelo is not None and usar_cache_llm:
+            modelo = CacheModelo(
+                modelo,
+                os.path.join(self.caminho_cache, "llm", "respostas.sqlite3"),
+                ttl_segundos=ttl_cache_llm,
+            )
+        self.model = modelo
+
+    def estatisticas_caches(self):
+        """
+        Estatísticas dos caches e do roteador, exportadas como gauges em /metrics
+        """
+        estatisticas = {
+            "cache_planilhas": self.cache_workbooks.estatisticas(),
+            "cache_pdf": self.cache_pdfs.estatisticas(),
+            "roteamento": self.roteador.estatisticas(),
+        }
+        if isinstance(self.model, CacheModelo):
+            estatisticas["cache_llm"] = self.model.estatisticas()
+        return estatisticas
 
     def ler_planilha_como_string(self, nome_arquivo):
         """
         Lê uma planilha específica e retorna todos os valores como string
         """
         try:
-            caminho_completo = os.path.join(self.caminho_pasta, nome_arquivo)
-
-            # Carrega a planilha
-            workbook = openpyxl.load_workbook(caminho_completo, data_only=True)
-            sheet = workbook.active  # Pega a primeira aba
+            # Carrega a planilha (primeira aba) via cache
+            linhas = self._ler_linhas(nome_arquivo)
 
-            resultado = f"=== PLANILHA: {nome_arquivo} ===\n"
+            partes = [f"=== PLANILHA: {nome_arquivo} ===\n"]
 
             # Percorre todas as células com dados
-            for row in sheet.iter_rows(values_only=True):
+            for row in linhas:
                 # Filtra valores não vazios
                 valores_linha = [str(cell) if cell is not None else "" for cell in row]
                 # Remove linhas completamente vazias
                 if any(valor.strip() for valor in valores_linha if valor):
-                    resultado += " | ".join(valores_linha) + "\n"
+                    partes.append(" | ".join(valores_linha) + "\n")
 
-            resultado += "\n"
-            print(resultado)
+            partes.append("\n")
+            resultado = "".join(partes)
+            # Texto completo da planilha só em LOG_NIVEL=DEBUG
+            log("DEBUG", resultado)
             return resultado
 
         except Exception as e:
             return f"Erro ao ler {nome_arquivo}: {str(e)}\n\n"
 
-    def extrair_dados_estruturados(self, nome_arquivo):
+    def _ler_linhas(self, nome_arquivo):
+        """
+        Retorna as linhas (tuplas de valores) da primeira aba, usando o cache de planilhas
+        """
+        if self._no_zip(nome_arquivo):
+            return self.cache_workbooks.obter_por_conteudo(
+                self.fonte_zip.chave(nome_arquivo),
+                lambda: self.fonte_zip.ler_linhas(nome_arquivo),
+            )
+        caminho_completo = os.path.join(self.caminho_pasta, nome_arquivo)
+        if self.snapshot is not None:
+            return self.cache_workbooks.obter(caminho_completo, self.snapshot.carregar)
+        return self.cache_workbooks.obter(caminho_completo)
+
+    def _no_zip(self, nome_arquivo):
+        return self.fonte_zip is not None and self.fonte_zip.contem(nome_arquivo)
+
+    def pre_carregar_planilhas(self, nomes_arquivos):
         """
-        Extrai dados estruturados de uma planilha específica
+        Lê em paralelo, no pool de processos, as planilhas que ainda não estão no
+        cache nem no snapshot. Cada processo devolve a forma colunar compacta; as
+        maiores planilhas saem primeiro. Retorna {arquivo: linhas} das que foram
+        lidas: o cache pode descartá-las antes do uso (limite de células). As que
+        falharam são lidas (e reportadas) depois, normalmente, uma a uma.
         """
+        tarefas = {}
+        for nome in nomes_arquivos:
+            if self._no_zip(nome):
+                if not self.cache_workbooks.contem(self.fonte_zip.chave(nome)):
+                    tarefas[nome] = (
+                        self.fonte_zip.tamanho(nome),
+                        self.fonte_zip.caminho_zip,
+                        self.fonte_zip.nome_membro(nome),
+                    )
+                continue
+            caminho = os.path.join(self.caminho_pasta, nome)
+            if not os.path.exists(caminho) or self.cache_workbooks.valido(caminho):
+                continue
+            if self.snapshot is not None and self.snapshot.valido(caminho):
+                continue
+            tarefas[nome] = (os.path.getsize(caminho), caminho, None)
+        if self.max_processos_carga <= 1 or len(tarefas) < 2:
+            return {}
+
+        lidas = {}
+        erros = 0
+        with METRICAS.medir("carga_paralela") as medicao:
+            executor = self._obter_executor_carga()
+            futuros = {
+                nome: executor.submit(_ler_planilha_compacta, caminho, membro)
+                for nome, (_, caminho, membro) in sorted(
+                    tarefas.items(), key=lambda item: item[1][0], reverse=True
+                )
+            }
+            for nome, futuro in futuros.items():
+                try:
+                    linhas = _colunas_para_linhas(*futuro.result())
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self._descartar_executor_carga(executor)
+                    erros += 1
+                    print(f"Erro ao ler {nome} em paralelo: {e}")
+                    continue
+                self._guardar_linhas(nome, linhas)
+                lidas[nome] = linhas
+                medicao.linhas += len(linhas)
+                medicao.bytes += tarefas[nome][0]
+        print(
+            f"{len(tarefas) - erros} planilhas lidas em paralelo "
+            f"({self.max_processos_carga} processos)"
+        )
+        return lidas
+
+    def _obter_executor_carga(self):
+        with self._lock_executor_carga:
+            if self._executor_carga is None:
+                self._executor_carga = ProcessPoolExecutor(
+                    max_workers=self.max_processos_carga,
+                    mp_context=_contexto_processos_carga(),
+                )
+            return self._executor_carga
+
+    def _descartar_executor_carga(self, executor):
+        # Pool quebrado não volta: a próxima carga cria outro
+        with self._lock_executor_carga:
+            if self._executor_carga is executor:
+                self._executor_carga = None
+        executor.shutdown(wait=False)
+
+    def fechar(self):
+        """
+        Encerra os pools do leitor (carga das bases, consultas, PDFs e fila de
+        consolidados). Chamado também na saída do processo.
+        """
+        with self._lock_executor_carga:
+            executor, self._executor_carga = self._executor_carga, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        self._executor_consultas.shutdown(wait=False, cancel_futures=True)
+        self.cache_pdfs.fechar()
+        if self.fila_consolidados is not None:
+            self.fila_consolidados.fechar()
+
+    def _guardar_linhas(self, nome_arquivo, linhas):
+        """
+        Coloca no cache (e no snapshot) linhas lidas em outro processo
+        """
+        if self._no_zip(nome_arquivo):
+            self.cache_workbooks.obter_por_conteudo(
+                self.fonte_zip.chave(nome_arquivo), lambda: linhas
+            )
+            return
+        carregar = lambda chave: linhas
+        if self.snapshot is not None:
+            snapshot = self.snapshot
+            carregar = lambda chave, carregar=carregar: snapshot.carregar(
+                chave, carregar
+            )
+        self.cache_workbooks.obter(
+            os.path.join(self.caminho_pasta, nome_arquivo), carregar
+        )
+
+    @staticmethod
+    def _montar_headers(primeira_linha):
+        headers = []
+        for cell in primeira_linha:
+            headers.append(
+                str(cell).strip() if cell is not None else f"Col_{len(headers)}"
+            )
+        return headers
+
+    @staticmethod
+    def _linha_para_registro(headers, row, tipos=None):
+        """
+        Converte uma linha da planilha em dicionário; retorna None para linhas vazias.
+        Colunas de `tipos` ({coluna: tipo}) passam por coagir_celula.
+        """
+        if not any(cell is not None and str(cell).strip() for cell in row):
+            return None
+        linha_dict = {}
+        for i, cell in enumerate(row):
+            header_name = headers[i] if i < len(headers) else f"Col_{i}"
+            tipo = tipos.get(header_name) if tipos else None
+            if tipo is None:
+                linha_dict[header_name] = str(cell).strip() if cell is not None else ""
+                continue
+            try:
+                linha_dict[header_name] = coagir_celula(cell, tipo)
+            except ValueError as e:
+                log("AVISO", "Coluna '%s' (%s): %s", header_name, tipo, e)
+                linha_dict[header_name] = None
+        return linha_dict
+
+    def extrair_dados_estruturados(
+        self, nome_arquivo, streaming=False, materializar=None, linhas=None
+    ):
+        """
+        Extrai dados estruturados de uma planilha específica.
+
+        Com streaming=True a planilha é aberta em modo somente leitura do openpyxl e
+        os registros são gerados sob demanda: "dados" é um gerador e
+        "total_registros" fica None. materializar=True lê a planilha inteira mesmo
+        assim (padrão: só fora do streaming). linhas, se informado, são as linhas
+        já lidas (ex.: pela carga paralela).
+        """
+        if materializar is None:
+            materializar = not streaming
         try:
-            caminho_completo = os.path.join(self.caminho_pasta, nome_arquivo)
+            if self._no_zip(nome_arquivo):
+                caminho_completo = f"{self.fonte_zip.caminho_zip}:{nome_arquivo}"
+            else:
+                caminho_completo = os.path.join(self.caminho_pasta, nome_arquivo)
             print(f"Tentando abrir: {caminho_completo}")
 
-            if not os.path.exists(caminho_completo):
+            if not self._no_zip(nome_arquivo) and not os.path.exists(caminho_completo):
                 print(f"Arquivo não encontrado: {caminho_completo}")
                 return {
                     "headers": [],
@@ -177,10 +3111,18 @@ class LeitorPlanilhas:
                     "total_registros": 0,
                 }
 
-            workbook = openpyxl.load_workbook(caminho_completo, data_only=True)
-            sheet = workbook.active
+            if streaming:
+                origem = (
+                    self.fonte_zip.abrir(nome_arquivo)
+                    if self._no_zip(nome_arquivo)
+                    else caminho_completo
+                )
+                return self._extrair_dados_streaming(nome_arquivo, origem, materializar)
+
+            if linhas is None:
+                linhas = self._ler_linhas(nome_arquivo)
 
-            if sheet.max_row < 2:
+            if len(linhas) < 2:
                 print(f"Planilha {nome_arquivo} está vazia ou só tem cabeçalhos")
                 return {
                     "headers": [],
@@ -190,106 +3132,328 @@ class LeitorPlanilhas:
                 }
 
             # Obter cabeçalhos (primeira linha)
-            headers = []
-            primeira_linha = next(
-                sheet.iter_rows(min_row=1, max_row=1, values_only=True)
-            )
-            for cell in primeira_linha:
-                headers.append(
-                    str(cell).strip() if cell is not None else f"Col_{len(headers)}"
-                )
+            headers = self._montar_headers(linhas[0])
 
             print(f"Headers encontrados em {nome_arquivo}: {headers}")
 
-            # Extrair dados
-            dados = []
-            for row_num, row in enumerate(
-                sheet.iter_rows(min_row=2, values_only=True), 2
-            ):
-                if any(cell is not None and str(cell).strip() for cell in row):
-                    linha_dict = {}
-                    for i, cell in enumerate(row):
-                        header_name = headers[i] if i < len(headers) else f"Col_{i}"
-                        linha_dict[header_name] = (
-                            str(cell).strip() if cell is not None else ""
-                        )
-                    dados.append(linha_dict)
+            # Extrair dados, com datas e números convertidos pelo esquema de tipos
+            tipos = resolver_esquema(headers).tipos()
+            dados = TabelaRegistros.de_linhas(headers, linhas[1:], tipos)
+            for problema in dados.problemas:
+                print(f"Tipos de {nome_arquivo}: {problema}")
+
+            # Debug: mostrar primeiros registros
+            for indice, linha_dict in enumerate(dados[:3], 1):
+                print(f"Registro {indice} de {nome_arquivo}: {linha_dict}")
+
+            print(f"Total de registros extraídos de {nome_arquivo}: {len(dados)}")
+
+            return {
+                "headers": headers,
+                "dados": dados,
+                "total_registros": len(dados),
+                "tipos": tipos,
+            }
+
+        except Exception as e:
+            print(f"Erro ao processar {nome_arquivo}: {str(e)}")
+            return {"headers": [], "dados": [], "erro": str(e), "total_registros": 0}
 
-                    # Debug: mostrar primeiros registros
-                    if len(dados) <= 3:
-                        print(f"Registro {row_num} de {nome_arquivo}: {linha_dict}")
+    def _extrair_dados_streaming(self, nome_arquivo, origem, materializar):
+        """
+        Lê a planilha em modo somente leitura, sem carregar o documento inteiro.
+        origem é o caminho do arquivo ou um stream (membro de ZIP).
+        """
+        workbook = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+        linhas = workbook.active.iter_rows(values_only=True)
+        primeira_linha = next(linhas, None)
+        if primeira_linha is None:
+            workbook.close()
+            print(f"Planilha {nome_arquivo} está vazia ou só tem cabeçalhos")
+            return {
+                "headers": [],
+                "dados": [],
+                "erro": f"Planilha {nome_arquivo} está vazia",
+                "total_registros": 0,
+            }
 
+        headers = self._montar_headers(primeira_linha)
+        print(f"Headers encontrados em {nome_arquivo} (streaming): {headers}")
+        tipos = resolver_esquema(headers).tipos()
+        if materializar:
+            try:
+                dados = TabelaRegistros.de_linhas(headers, linhas, tipos)
+            finally:
+                workbook.close()
+            for problema in dados.problemas:
+                print(f"Tipos de {nome_arquivo}: {problema}")
             print(f"Total de registros extraídos de {nome_arquivo}: {len(dados)}")
+            return {
+                "headers": headers,
+                "dados": dados,
+                "total_registros": len(dados),
+                "tipos": tipos,
+            }
 
-            return {"headers": headers, "dados": dados, "total_registros": len(dados)}
+        registros = self._gerar_registros(workbook, linhas, headers, tipos)
+        return {
+            "headers": headers,
+            "dados": registros,
+            "total_registros": None,
+            "tipos": tipos,
+        }
+
+    @classmethod
+    def _gerar_registros(cls, workbook, linhas, headers, tipos=None):
+        try:
+            for row in linhas:
+                registro = cls._linha_para_registro(headers, row, tipos)
+                if registro is not None:
+                    yield registro
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _amostra_registros(base, quantidade=3):
+        """
+        Retorna os primeiros registros da base sem perder os demais quando "dados"
+        é um gerador (modo streaming)
+        """
+        dados = base["dados"]
+        if registros_materializados(dados):
+            return dados[:quantidade]
+        amostra = list(itertools.islice(dados, quantidade))
+        base["dados"] = itertools.chain(amostra, dados)
+        return amostra
+
+    def carregar_dataset(self, competencia=None, streaming=False, bases=None):
+        """
+        Lê as bases da consolidação (todas, ou só as de `bases`) e devolve o
+        DatasetCompetencia. Em streaming, ATIVOS é consumida registro a registro.
+        """
+        bases = bases or self.BASES_CONSOLIDADO.keys()
+        pre_carregadas = self.pre_carregar_planilhas(
+            [
+                self.BASES_CONSOLIDADO[nome]
+                for nome in bases
+                if not (streaming and nome == "ativos")
+            ]
+        )
+        dados = {}
+        for nome in bases:
+            arquivo = self.BASES_CONSOLIDADO[nome]
+            if nome == "ativos":
+                dados[nome] = self.extrair_dados_estruturados(
+                    arquivo,
+                    streaming=streaming,
+                    linhas=pre_carregadas.get(arquivo),
+                )
+            else:
+                dados[nome] = self.extrair_dados_estruturados(
+                    arquivo, linhas=pre_carregadas.get(arquivo)
+                )
+        return DatasetCompetencia(competencia, dados)
 
-        except Exception as e:
-            print(f"Erro ao processar {nome_arquivo}: {str(e)}")
-            return {"headers": [], "dados": [], "erro": str(e), "total_registros": 0}
+    def gerar_consolidado_vr(
+        self, competencia=None, streaming=False, progresso=None, formatos=("xlsx",)
+    ):
+        """
+        Gera planilha consolidada de Vale Refeição com dados REAIS seguindo as regras de negócio.
+        Com streaming=True a base de ativos é consumida registro a registro, sem
+        carregar a planilha inteira em memória. formatos escolhe os arquivos gerados:
+        xlsx, csv, jsonl e/ou parquet.
+        """
+        resumo, _ = self._gerar_consolidado(competencia, streaming, progresso, formatos)
+        return resumo
 
-    def gerar_consolidado_vr(self, competencia=None):
+    def gerar_consolidados_lote(
+        self, competencias, max_processos=None, formatos=("xlsx",), caminho_saida=None
+    ):
         """
-        Gera planilha consolidada de Vale Refeição com dados REAIS seguindo as regras de negócio
+        Gera o consolidado de várias competências ("01/2025", "01/2025-06/2025").
+        As bases são lidas uma vez; o processamento e a escrita de cada mês rodam
+        num pool de processos (max_processos, padrão: número de CPUs).
+        Retorna {"competencias": [...], "totais": {...}, "resumo": texto}.
         """
+        competencias = expandir_competencias(competencias)
         if not self.model:
-            return "Erro: API key do Gemini não configurada"
+            return {
+                "competencias": [],
+                "totais": {},
+                "resumo": "Erro: API key do Gemini não configurada",
+            }
 
-        print("Coletando dados estruturados das bases...")
+        inicio = time.perf_counter()
+        print(f"Lote de {len(competencias)} competências: {', '.join(competencias)}")
+        dados = dict(self.carregar_dataset(competencias[0]))
+
+        if max_processos is None:
+            max_processos = os.cpu_count() or 1
+        max_processos = min(max_processos, len(competencias))
+        if self._modelo_injetado and max_processos > 1:
+            print("Modelo injetado não vai para outros processos; lote sequencial")
+            max_processos = 1
+
+        resultados = {}
+        if max_processos <= 1:
+            for competencia in competencias:
+                resultados[competencia] = self._consolidar_competencia(
+                    competencia, dados, formatos, caminho_saida
+                )
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_processos,
+                initializer=_iniciar_processo_lote,
+                initargs=(self._config_processo, dados),
+            ) as executor:
+                futuros = {
+                    competencia: executor.submit(
+                        _consolidar_competencia_lote,
+                        competencia,
+                        formatos,
+                        caminho_saida,
+                    )
+                    for competencia in competencias
+                }
+                for competencia, futuro in futuros.items():
+                    try:
+                        resultados[competencia] = futuro.result()
+                    except Exception as e:
+                        resultados[competencia] = {
+                            "competencia": competencia,
+                            "erro": str(e),
+                        }
 
-        # Extrair dados estruturados de cada planilha
-        dados_ativos = self.extrair_dados_estruturados("ATIVOS.xlsx")
-        dados_ferias = self.extrair_dados_estruturados("FÉRIAS.xlsx")
-        dados_desligados = self.extrair_dados_estruturados("DESLIGADOS.xlsx")
-        dados_admissoes = self.extrair_dados_estruturados("ADMISSÃO ABRIL.xlsx")
-        dados_base_sindicato = self.extrair_dados_estruturados(
-            "Base sindicato x valor.xlsx"
-        )
-        dados_dias_uteis = self.extrair_dados_estruturados("Base dias uteis.xlsx")
-        dados_afastamentos = self.extrair_dados_estruturados("AFASTAMENTOS.xlsx")
-        dados_aprendiz = self.extrair_dados_estruturados("APRENDIZ.xlsx")
-        dados_estagio = self.extrair_dados_estruturados("ESTÁGIO.xlsx")
-        dados_exterior = self.extrair_dados_estruturados("EXTERIOR.xlsx")
-
-        # Detectar competência mais recente se não informada
-        if not competencia:
-            competencia = (
-                "05/2025"  # Padrão, mas pode ser extraído dos dados se necessário
-            )
-            # TODO: lógica para extrair competência mais recente das bases
+        lote = self._resumo_lote(
+            [resultados[competencia] for competencia in competencias],
+            time.perf_counter() - inicio,
+            max_processos,
+        )
+        print(lote["resumo"])
+        return lote
 
-        print("Dados estruturados coletados com sucesso!")
+    def _consolidar_competencia(self, competencia, dados, formatos, caminho_saida):
+        """
+        Uma competência do lote sobre as bases já lidas
+        """
+        inicio = time.perf_counter()
+        try:
+            dataset, dados_processados, competencia = self._preparar_consolidado(
+                competencia, dataset=DatasetCompetencia(competencia, dados)
+            )
+            _, arquivos = self._concluir_consolidado(
+                dataset,
+                dados_processados,
+                competencia,
+                formatos=formatos,
+                caminho_saida=caminho_saida,
+            )
+        except Exception as e:
+            print(f"Erro no consolidado de {competencia}: {e}")
+            return {"competencia": competencia, "erro": str(e)}
+        return {
+            "competencia": competencia,
+            "arquivos": arquivos,
+            "totais": dados_processados["totais"],
+            "tempo_s": round(time.perf_counter() - inicio, 3),
+        }
 
-        # Processar dados com agente especializado
-        print("Processando com agente especializado...")
-        dados_processados = self._processar_dados_reais_com_agente(
-            {
-                "ativos": dados_ativos,
-                "ferias": dados_ferias,
-                "desligados": dados_desligados,
-                "admissoes": dados_admissoes,
-                "base_sindicato": dados_base_sindicato,
-                "dias_uteis": dados_dias_uteis,
-                "afastamentos": dados_afastamentos,
-                "aprendiz": dados_aprendiz,
-                "estagio": dados_estagio,
-                "exterior": dados_exterior,
-            },
-            competencia=competencia,
+    @staticmethod
+    def _resumo_lote(resultados, tempo_total, processos):
+        totais = {"total_funcionarios": 0, "total_vr": 0.0, "total_empresa": 0.0}
+        linhas = []
+        for resultado in resultados:
+            if "erro" in resultado:
+                linhas.append(f"- {resultado['competencia']}: ERRO {resultado['erro']}")
+                continue
+            for chave in totais:
+                totais[chave] += resultado["totais"][chave]
+            linhas.append(
+                f"- {resultado['competencia']}: "
+                f"{resultado['totais']['total_funcionarios']} funcionários, "
+                f"R$ {resultado['totais']['total_vr']:,.2f} "
+                f"({', '.join(resultado['arquivos'].values())})"
+            )
+        totais["total_vr"] = round(totais["total_vr"], 2)
+        totais["total_empresa"] = round(totais["total_empresa"], 2)
+        erros = sum(1 for resultado in resultados if "erro" in resultado)
+        resumo = (
+            f"Lote de consolidados VR: {len(resultados) - erros} gerados, {erros} com erro "
+            f"({processos} processos, {tempo_total:.1f} s)\n" + "\n".join(linhas) + "\n"
+            f"Total de funcionários (soma dos meses): {totais['total_funcionarios']}\n"
+            f"Valor total VR: R$ {totais['total_vr']:,.2f}\n"
+            f"Custo empresa (80%): R$ {totais['total_empresa']:,.2f}\n"
         )
+        return {"competencias": resultados, "totais": totais, "resumo": resumo}
 
-        print(
-            f"Dados processados: {dados_processados['totais']['total_funcionarios']} funcionários"
+    def _gerar_consolidado(
+        self, competencia=None, streaming=False, progresso=None, formatos=("xlsx",)
+    ):
+        """
+        Corpo de gerar_consolidado_vr; retorna (resumo, {formato: caminho}) ou
+        (mensagem de erro, None).
+        progresso(percentual, mensagem), se informado, é chamado a cada etapa.
+        """
+        if progresso is None:
+            progresso = lambda percentual, mensagem: None
+        # "5/2025" vira "05/2025", como na fila e no lote (mesmo nome de arquivo)
+        try:
+            competencia = normalizar_competencia(competencia)
+        except ValueError as e:
+            return f"Erro: {e}", None
+        if not self.model:
+            return "Erro: API key do Gemini não configurada", None
+
+        dataset, dados_processados, competencia = self._preparar_consolidado(
+            competencia, streaming, progresso
+        )
+        return self._concluir_consolidado(
+            dataset, dados_processados, competencia, streaming, progresso, formatos
         )
 
+    def _concluir_consolidado(
+        self,
+        dataset,
+        dados_processados,
+        competencia,
+        streaming=False,
+        progresso=None,
+        formatos=("xlsx",),
+        caminho_saida=None,
+    ):
+        """
+        Grava as saídas de uma competência já processada e monta o resumo;
+        retorna (resumo, {formato: caminho})
+        """
+        if progresso is None:
+            progresso = lambda percentual, mensagem: None
+        dados_ativos = dataset["ativos"]
+        dados_ferias = dataset["ferias"]
+        dados_desligados = dataset["desligados"]
+        dados_admissoes = dataset["admissoes"]
+
         # Gerar planilha Excel
         print("Gerando planilha consolidada...")
-        nome_arquivo = self._gerar_planilha_excel(
-            dados_processados, competencia=competencia
+        progresso(80, "Gerando planilha consolidada")
+        arquivos = self._gerar_saidas(
+            dados_processados,
+            competencia=competencia,
+            streaming=streaming,
+            caminho_saida=caminho_saida,
+            dataset=dataset,
+            formatos=formatos,
+        )
+        nome_arquivo = arquivos.get("xlsx") or ", ".join(arquivos.values())
+        exportacoes = "".join(
+            f"Exportação {formato}: {caminho}\n"
+            for formato, caminho in arquivos.items()
+            if formato != "xlsx"
         )
 
         resumo = (
             "Planilha consolidada VR gerada!\n"
             f"Arquivo salvo em: {nome_arquivo}\n"
+            f"{exportacoes}"
             f"Funcionários processados: {dados_processados['totais']['total_funcionarios']}\n"
             f"Valor total VR: R$ {dados_processados['totais']['total_vr']:,.2f}\n"
             f"Custo empresa (80%): R$ {dados_processados['totais']['total_empresa']:,.2f}\n"
@@ -300,10 +3464,46 @@ class LeitorPlanilhas:
             f"- Desligamentos: {dados_desligados['total_registros']} registros\n"
             f"- Admissões: {dados_admissoes['total_registros']} registros\n"
             "- Exclusões aplicadas: Diretores, Estagiários, Aprendizes, Afastados, Exterior\n"
-            "\nPrimeiros funcionários processados:\n"
         )
+        resumo += "\nPrimeiros funcionários processados:\n"
         print(resumo)
-        return resumo
+        return resumo, arquivos
+
+    def _preparar_consolidado(
+        self, competencia=None, streaming=False, progresso=None, dataset=None
+    ):
+        """
+        Carrega o dataset (ou usa o já carregado) e processa os funcionários;
+        retorna (dataset, dados_processados, competência). Levanta ValueError para
+        competência inválida.
+        """
+        if progresso is None:
+            progresso = lambda percentual, mensagem: None
+
+        print("Coletando dados estruturados das bases...")
+        progresso(10, "Coletando dados estruturados das bases")
+
+        # Sem competência informada vale COMPETENCIA_PADRAO
+        # TODO: lógica para extrair competência mais recente das bases
+        competencia = normalizar_competencia(competencia)
+
+        # Cada base é lida uma única vez e o mesmo dataset passa por todas as etapas
+        if dataset is None:
+            dataset = self.carregar_dataset(competencia, streaming=streaming)
+
+        print("Dados estruturados coletados com sucesso!")
+
+        # Processar dados com agente especializado
+        print("Processando com agente especializado...")
+        progresso(40, "Processando com agente especializado")
+        dados_processados = self._processar_dados_reais_com_agente(
+            dataset, competencia=competencia
+        )
+
+        print(
+            f"Dados processados: {dados_processados['totais']['total_funcionarios']} funcionários"
+        )
+        return dataset, dados_processados, competencia
 
     def _processar_dados_reais_com_agente(self, dados_estruturados, competencia=None):
         """
@@ -312,13 +3512,13 @@ class LeitorPlanilhas:
 
         # Criar resumo dos dados para o prompt
         resumo_dados = {
-            "ativos_sample": (
-                dados_estruturados["ativos"]["dados"][:3]
-                if dados_estruturados["ativos"]["dados"]
-                else []
-            ),
+            "ativos_sample": self._amostra_registros(dados_estruturados["ativos"]),
             "headers_ativos": dados_estruturados["ativos"]["headers"],
-            "total_ativos": dados_estruturados["ativos"]["total_registros"],
+            "total_ativos": (
+                f"{dados_estruturados['ativos']['total_registros']} registros"
+                if dados_estruturados["ativos"]["total_registros"] is not None
+                else "total desconhecido, leitura em streaming"
+            ),
             "ferias_sample": (
                 dados_estruturados["ferias"]["dados"][:3]
                 if dados_estruturados["ferias"]["dados"]
@@ -326,7 +3526,10 @@ class LeitorPlanilhas:
             ),
             "headers_ferias": dados_estruturados["ferias"]["headers"],
             "total_ferias": dados_estruturados["ferias"]["total_registros"],
-            "base_sindicato": dados_estruturados["base_sindicato"]["dados"],
+            "base_sindicato": [
+                dict(registro)
+                for registro in dados_estruturados["base_sindicato"]["dados"]
+            ],
             "headers_sindicato": dados_estruturados["base_sindicato"]["headers"],
             "total_exclusoes": (
                 dados_estruturados["aprendiz"]["total_registros"]
@@ -336,24 +3539,27 @@ class LeitorPlanilhas:
             ),
         }
 
+        competencia = competencia or self.COMPETENCIA_PADRAO
+        inicio_periodo, fim_periodo = periodo_competencia(competencia)
+
         prompt_processamento = f"""
         Você é um especialista em RH e processamento de folha de pagamento. Processe os dados REAIS fornecidos para gerar planilha consolidada de Vale Refeição.
 
-        COMPETÊNCIA: {competencia if competencia else '05/2025'}
+        COMPETÊNCIA: {competencia}
 
         DADOS REAIS DISPONÍVEIS:
 
-        **FUNCIONÁRIOS ATIVOS ({resumo_dados['total_ativos']} registros):**
+        **FUNCIONÁRIOS ATIVOS ({resumo_dados['total_ativos']}):**
         Headers: {resumo_dados['headers_ativos']}
-        Amostra: {json.dumps(resumo_dados['ativos_sample'], indent=2, ensure_ascii=False)}
+        Amostra: {json.dumps(resumo_dados['ativos_sample'], indent=2, ensure_ascii=False, default=str)}
 
         **FUNCIONÁRIOS EM FÉRIAS ({resumo_dados['total_ferias']} registros):**
         Headers: {resumo_dados['headers_ferias']}
-        Amostra: {json.dumps(resumo_dados['ferias_sample'], indent=2, ensure_ascii=False)}
+        Amostra: {json.dumps(resumo_dados['ferias_sample'], indent=2, ensure_ascii=False, default=str)}
 
         **BASE SINDICATO X VALOR:**
         Headers: {resumo_dados['headers_sindicato']}
-        Dados completos: {json.dumps(resumo_dados['base_sindicato'], indent=2, ensure_ascii=False)}
+        Dados completos: {json.dumps(resumo_dados['base_sindicato'], indent=2, ensure_ascii=False, default=str)}
 
         **EXCLUSÕES APLICADAS:**
         - Aprendizes: {dados_estruturados['aprendiz']['total_registros']} registros
@@ -369,7 +3575,7 @@ class LeitorPlanilhas:
            - Considerar funcionários em férias como elegíveis
 
         2. **CÁLCULO DE DIAS ÚTEIS:**
-           - Padrão: Dias úteis entre 15/04/2025 e 15/05/2025
+           - Padrão: Dias úteis entre {inicio_periodo:%d/%m/%Y} e {fim_periodo:%d/%m/%Y}
            - Sindicatos de PR e SP definiram 22 dias úteis
            - Sindicatos de RS e RJ definiram 21 dias úteis
            - Reduzir por férias proporcionalmente
@@ -431,23 +3637,56 @@ class LeitorPlanilhas:
                 dados_processados = json.loads(resposta_limpa)
                 if len(dados_processados.get("funcionarios", [])) < 5:
                     print("IA retornou poucos dados, processando localmente...")
-                    return self._processar_dados_localmente(dados_estruturados)
+                    return self._processar_dados_localmente(
+                        dados_estruturados, competencia=competencia
+                    )
                 return dados_processados
             except Exception as e:
                 print(f"Erro na IA, processando localmente: {e}")
-                return self._processar_dados_localmente(dados_estruturados)
+                return self._processar_dados_localmente(
+                    dados_estruturados, competencia=competencia
+                )
         else:
             print("IA não configurada, processando localmente...")
-            return self._processar_dados_localmente(dados_estruturados)
+            return self._processar_dados_localmente(
+                dados_estruturados, competencia=competencia
+            )
 
-    def _processar_dados_localmente(self, dados_estruturados):
+    def _processar_dados_localmente(
+        self, dados_estruturados, motor=None, competencia=None
+    ):
         """
-        Fallback: processa dados localmente quando a IA falha
+        Fallback: processa dados localmente quando a IA falha.
+        O motor ("python" ou "pandas") vem de motor_processamento se não informado;
+        os dois produzem o mesmo resultado. A competência (a do dataset se não
+        informada) define os dias úteis padrão e o rótulo de cada funcionário.
         """
-        print("Processando dados localmente...")
+        motor = motor or self.motor_processamento
+        competencia = (
+            competencia
+            or getattr(dados_estruturados, "competencia", None)
+            or self.COMPETENCIA_PADRAO
+        )
+        dias_uteis = dias_uteis_competencia(competencia)
+        with METRICAS.medir("processamento_local", motor=motor) as medicao:
+            if motor == "pandas":
+                resultado = self._processar_dados_localmente_pandas(
+                    dados_estruturados, competencia, dias_uteis
+                )
+            else:
+                resultado = self._processar_dados_localmente_python(
+                    dados_estruturados, competencia, dias_uteis
+                )
+            medicao.linhas = len(resultado["funcionarios"])
+        return resultado
 
-        # Valores por sindicato
-        valores_sindicato = {"SP": 20.00, "RJ": 18.00, "RS": 16.00, "PR": 19.00}
+    def _processar_dados_localmente_python(
+        self, dados_estruturados, competencia, dias_uteis
+    ):
+        """
+        Motor python: um laço por funcionário
+        """
+        print("Processando dados localmente...")
 
         # Obter matrículas para exclusão
         matriculas_exclusao = set()
@@ -462,15 +3701,21 @@ class LeitorPlanilhas:
             print(
                 f"Processando exclusões de {nome_base}: {dados['total_registros']} registros"
             )
+            coluna_matricula = self._esquema(dados, nome_base).coluna("matricula")
+            if coluna_matricula is None:
+                continue
             for registro in dados["dados"]:
-                for key, value in registro.items():
-                    if value and (
-                        "matricula" in key.lower() or "matrícula" in key.lower()
-                    ):
-                        matricula_limpa = str(value).strip().upper()
-                        if matricula_limpa:
-                            matriculas_exclusao.add(matricula_limpa)
-                            print(f"Exclusão adicionada: {matricula_limpa}")
+                value = registro.get(coluna_matricula)
+                if value:
+                    matricula_limpa = str(value).strip().upper()
+                    if matricula_limpa:
+                        matriculas_exclusao.add(matricula_limpa)
+                        log_amostrado(
+                            "DEBUG",
+                            len(matriculas_exclusao),
+                            "Exclusão adicionada: %s",
+                            matricula_limpa,
+                        )
 
         print(f"Total de matrículas para exclusão: {len(matriculas_exclusao)}")
         print(
@@ -482,96 +3727,53 @@ class LeitorPlanilhas:
         total_empresa = 0
 
         # Processar funcionários ativos
-        print(
-            f"Processando funcionários ativos: {dados_estruturados['ativos']['total_registros']} registros"
-        )
+        if dados_estruturados["ativos"]["total_registros"] is None:
+            print("Processando funcionários ativos em streaming...")
+        else:
+            print(
+                f"Processando funcionários ativos: {dados_estruturados['ativos']['total_registros']} registros"
+            )
 
+        # Colunas resolvidas uma vez; o laço acessa cada campo diretamente
+        esquema = self._esquema(dados_estruturados["ativos"], "ativos")
+        coluna_matricula = esquema.coluna("matricula")
+        coluna_cargo = esquema.coluna("cargo")
+        coluna_sindicato = esquema.coluna("sindicato")
+        coluna_admissao = esquema.coluna("admissao")
+
+        total_lidos = 0
         for i, funcionario in enumerate(dados_estruturados["ativos"]["dados"]):
+            total_lidos = i + 1
 
             try:
-                # Extrair dados básicos - buscar em todas as colunas
                 matricula = ""
-
-                sindicato = self._extrair_sindicato(funcionario)
-
-                # Buscar matrícula
-                for key, value in funcionario.items():
-                    if value and str(value).strip():
-                        key_lower = key.lower()
-                        value_str = str(value).strip()
-                        if (
-                            "matricula" in key_lower
-                            or "matrícula" in key_lower
-                            or "codigo" in key_lower
-                            or "id" in key_lower
-                            or "cod" in key_lower
-                            or "cadastro" in key_lower
-                        ):
-                            if value_str and not matricula:
-                                matricula = value_str.upper()
-
-                # Debug: mostrar primeiros registros processados
-                if i < 5:
-                    print(
-                        f"Funcionário {i}: Matrícula='{matricula}', Sindicato='{sindicato}'"
+                if coluna_matricula is not None:
+                    matricula = (
+                        str(funcionario.get(coluna_matricula, "")).strip().upper()
                     )
 
-                # Validar dados mínimos
-                if not matricula:
-                    print(f"Dados insuficientes - Matrícula: '{matricula}'")
-                    continue
-
-                # Verificar se é diretor (excluir)
-                eh_diretor = False
-                for key, value in funcionario.items():
-                    if value and any(
-                        termo in str(value).upper()
-                        for termo in ["DIRETOR", "DIRETORA", "PRESIDENTE", "CEO"]
-                    ):
-                        if any(
-                            termo in key.upper()
-                            for termo in ["CARGO", "FUNCAO", "CARGO"]
-                        ):
-                            eh_diretor = True
-                            break
-                if eh_diretor:
-                    print(f"Diretor excluído: {matricula}")
-                    continue
-
-                # Pular se for exclusão
-                if matricula.upper() in matriculas_exclusao:
-                    print(f"Funcionário excluído: {matricula}")
-                    continue
-
-                # Calcular valores
-                dias_uteis = 22  # Padrão
-                valor_dia = valores_sindicato.get(sindicato, 20.00)
-                valor_total = round(dias_uteis * valor_dia, 2)
-                valor_empresa = round(valor_total * 0.8, 2)
-                valor_funcionario = round(valor_total * 0.2, 2)
-
-                funcionarios.append(
-                    {
-                        "matricula": matricula,
-                        "admissao": funcionario.get("Admissão", ""),
-                        "sindicato": sindicato,
-                        "competencia": "05/2025",  # ou variável se disponível
-                        "dias_uteis": dias_uteis,
-                        "valor_diario_vr": valor_dia,
-                        "valor_vr_total": valor_total,
-                        "valor_empresa": valor_empresa,
-                        "valor_funcionario": valor_funcionario,
-                        "observacoes": "Processado com dados reais",
-                    }
+                resultado = self._calcular_funcionario_local(
+                    i,
+                    funcionario,
+                    matricula,
+                    matriculas_exclusao,
+                    coluna_cargo,
+                    coluna_sindicato,
+                    coluna_admissao,
+                    competencia,
+                    dias_uteis,
                 )
+                if resultado is None:
+                    continue
 
-                total_vr += valor_total
-                total_empresa += valor_empresa
+                funcionarios.append(resultado)
+                total_vr += resultado["valor_vr_total"]
+                total_empresa += resultado["valor_empresa"]
 
                 if len(funcionarios) <= 3:
                     # print(f"Funcionário processado: {matricula} - {nome} - {sindicato} - R$ {valor_total}")
                     print(
-                        f"Funcionário processado: {matricula} - {sindicato} - R$ {valor_total}"
+                        f"Funcionário processado: {matricula} - {resultado['sindicato']} - R$ {resultado['valor_vr_total']}"
                     )
 
             except Exception as e:
@@ -580,41 +3782,130 @@ class LeitorPlanilhas:
 
         print(f"Total de funcionários processados: {len(funcionarios)}")
 
+        # Em streaming a contagem de ativos só é conhecida depois da leitura
+        if dados_estruturados["ativos"]["total_registros"] is None:
+            dados_estruturados["ativos"]["total_registros"] = total_lidos
+
         # Se ainda não encontrou funcionários, tentar outra abordagem
-        if len(funcionarios) == 0:
-            print("Nenhum funcionário encontrado, tentando abordagem mais flexível...")
-
-            # Mostrar estrutura dos dados para debug
-            if dados_estruturados["ativos"]["dados"]:
-                primeiro_registro = dados_estruturados["ativos"]["dados"][0]
-                print(f"Estrutura do primeiro registro: {primeiro_registro}")
-                print(f"Headers disponíveis: {dados_estruturados['ativos']['headers']}")
-
-            # Tentar processar pelo menos alguns registros usando qualquer campo disponível
-            for i, funcionario in enumerate(dados_estruturados["ativos"]["dados"][:10]):
-                values = list(funcionario.values())
-                if len(values) >= 2:  # Pelo menos 2 campos
-                    matricula = f"MAT_{i + 1:03d}"  # Matrícula sequencial
-                    # nome = str(values[1]) if len(str(values[1])) > 2 else f"Funcionário {i + 1}"
-
-                    funcionarios.append(
-                        {
-                            "matricula": matricula,
-                            "admissao": "",
-                            "sindicato": "SP",
-                            "competencia": "05/2025",
-                            "dias_uteis": 22,
-                            "valor_diario_vr": 20.00,
-                            "valor_vr_total": 440.00,
-                            "valor_empresa": 352.00,
-                            "valor_funcionario": 88.00,
-                            "observacoes": "Processado com estrutura flexível",
-                        }
-                    )
+        # (precisa reler os registros, o que não é possível em streaming)
+        if len(funcionarios) == 0 and registros_materializados(
+            dados_estruturados["ativos"]["dados"]
+        ):
+            for funcionario in self._processar_estrutura_flexivel(
+                dados_estruturados["ativos"], competencia, dias_uteis
+            ):
+                funcionarios.append(funcionario)
+                total_vr += funcionario["valor_vr_total"]
+                total_empresa += funcionario["valor_empresa"]
+
+        return self._montar_resultado_local(funcionarios, total_vr, total_empresa)
+
+    def _calcular_funcionario_local(
+        self,
+        i,
+        funcionario,
+        matricula,
+        matriculas_exclusao,
+        coluna_cargo,
+        coluna_sindicato,
+        coluna_admissao,
+        competencia,
+        dias_uteis,
+    ):
+        """
+        Aplica as regras a um funcionário ativo; None quando ele não recebe VR
+        """
+        # Extrair dados básicos pelas colunas do esquema
+        sindicato = self._extrair_sindicato(funcionario, coluna_sindicato)
+
+        # Debug: mostrar primeiros registros processados
+        if i < 5:
+            print(f"Funcionário {i}: Matrícula='{matricula}', Sindicato='{sindicato}'")
 
-                    total_vr += 440.00
-                    total_empresa += 352.00
+        # Validar dados mínimos
+        if not matricula:
+            log_amostrado(
+                "DEBUG", i, "Dados insuficientes - Matrícula: '%s'", matricula
+            )
+            return None
+
+        # Verificar se é diretor (excluir)
+        eh_diretor = coluna_cargo is not None and any(
+            termo in str(funcionario.get(coluna_cargo, "")).upper()
+            for termo in ["DIRETOR", "DIRETORA", "PRESIDENTE", "CEO"]
+        )
+        if eh_diretor:
+            log_amostrado("DEBUG", i, "Diretor excluído: %s", matricula)
+            return None
+
+        # Pular se for exclusão
+        if matricula.upper() in matriculas_exclusao:
+            log_amostrado("DEBUG", i, "Funcionário excluído: %s", matricula)
+            return None
+
+        # Calcular valores
+        valor_dia = self.VALORES_SINDICATO.get(sindicato, 20.00)
+        valor_total = round(dias_uteis * valor_dia, 2)
+        valor_empresa = round(valor_total * 0.8, 2)
+        valor_funcionario = round(valor_total * 0.2, 2)
+
+        return {
+            "matricula": matricula,
+            "admissao": (
+                funcionario.get(coluna_admissao, "")
+                if coluna_admissao is not None
+                else ""
+            ),
+            "sindicato": sindicato,
+            "competencia": competencia,
+            "dias_uteis": dias_uteis,
+            "valor_diario_vr": valor_dia,
+            "valor_vr_total": valor_total,
+            "valor_empresa": valor_empresa,
+            "valor_funcionario": valor_funcionario,
+            "observacoes": "Processado com dados reais",
+        }
+
+    def _processar_estrutura_flexivel(self, dados_ativos, competencia, dias_uteis):
+        """
+        Último recurso quando nenhum funcionário foi identificado: gera registros com
+        matrícula sequencial a partir dos primeiros registros disponíveis
+        """
+        print("Nenhum funcionário encontrado, tentando abordagem mais flexível...")
+
+        # Mostrar estrutura dos dados para debug
+        if dados_ativos["dados"]:
+            primeiro_registro = dados_ativos["dados"][0]
+            print(f"Estrutura do primeiro registro: {primeiro_registro}")
+            print(f"Headers disponíveis: {dados_ativos['headers']}")
+
+        funcionarios = []
+        # Tentar processar pelo menos alguns registros usando qualquer campo disponível
+        for i, funcionario in enumerate(dados_ativos["dados"][:10]):
+            values = list(funcionario.values())
+            if len(values) >= 2:  # Pelo menos 2 campos
+                matricula = f"MAT_{i + 1:03d}"  # Matrícula sequencial
+                valor_total = round(dias_uteis * 20.00, 2)
+                # nome = str(values[1]) if len(str(values[1])) > 2 else f"Funcionário {i + 1}"
+
+                funcionarios.append(
+                    {
+                        "matricula": matricula,
+                        "admissao": "",
+                        "sindicato": "SP",
+                        "competencia": competencia,
+                        "dias_uteis": dias_uteis,
+                        "valor_diario_vr": 20.00,
+                        "valor_vr_total": valor_total,
+                        "valor_empresa": round(valor_total * 0.8, 2),
+                        "valor_funcionario": round(valor_total * 0.2, 2),
+                        "observacoes": "Processado com estrutura flexível",
+                    }
+                )
+        return funcionarios
 
+    @staticmethod
+    def _montar_resultado_local(funcionarios, total_vr, total_empresa):
         return {
             "funcionarios": funcionarios,
             "totais": {
@@ -625,128 +3916,349 @@ class LeitorPlanilhas:
             },
         }
 
-    def _gerar_planilha_excel(self, dados_processados, competencia=None):
+    def _processar_dados_localmente_pandas(
+        self, dados_estruturados, competencia, dias_uteis
+    ):
+        """
+        Mesmo processamento de _processar_dados_localmente, feito com operações
+        vetorizadas do pandas sobre colunas inteiras em vez de um laço por funcionário.
+        Em modo streaming a base de ativos é materializada antes do processamento.
+        """
+        print("Processando dados localmente (motor pandas)...")
+
+        # Matrículas para exclusão: colunas de matrícula de cada base de exclusão
+        colunas_exclusao = []
+        for nome_base in ["aprendiz", "estagio", "afastamentos", "exterior"]:
+            dados = dados_estruturados[nome_base]
+            print(
+                f"Processando exclusões de {nome_base}: {dados['total_registros']} registros"
+            )
+            coluna_matricula = self._esquema(dados, nome_base).coluna("matricula")
+            df_exclusao = self._dataframe_registros(dados["dados"])
+            if coluna_matricula in df_exclusao.columns:
+                colunas_exclusao.append(
+                    df_exclusao[coluna_matricula].astype(str).str.strip().str.upper()
+                )
+        if colunas_exclusao:
+            exclusoes = pd.concat(colunas_exclusao, ignore_index=True)
+            matriculas_exclusao = pd.unique(exclusoes[exclusoes != ""])
+        else:
+            matriculas_exclusao = []
+        print(f"Total de matrículas para exclusão: {len(matriculas_exclusao)}")
+
+        registros = dados_estruturados["ativos"]["dados"]
+        if not registros_materializados(registros):
+            registros = list(registros)
+            dados_estruturados["ativos"]["total_registros"] = len(registros)
+        df = self._dataframe_registros(registros)
+        print(f"Processando funcionários ativos: {len(df)} registros")
+
+        funcionarios = []
+        total_vr = 0
+        total_empresa = 0
+
+        if len(df):
+            esquema = self._esquema(dados_estruturados["ativos"], "ativos")
+            coluna_matricula = esquema.coluna("matricula")
+            coluna_cargo = esquema.coluna("cargo")
+            coluna_admissao = esquema.coluna("admissao")
+
+            # Cada coluna usada é fatorada uma vez; o trabalho com strings é feito só
+            # nos valores distintos e o resultado é espalhado para as linhas com NumPy
+            fatorada = {}
+            vazio = np.full(len(df), "", dtype=object)
+
+            def por_valor(coluna, funcao):
+                if coluna is None or coluna not in df.columns:
+                    return vazio
+                if coluna not in fatorada:
+                    fatorada[coluna] = pd.factorize(df[coluna])
+                codigos, unicos = fatorada[coluna]
+                return np.asarray([funcao(v) for v in unicos], dtype=object)[codigos]
+
+            matricula = por_valor(coluna_matricula, lambda v: str(v).strip().upper())
+
+            sindicato = self._extrair_sindicato_vetorizado(
+                df.columns, por_valor, esquema.coluna("sindicato")
+            )
+
+            # Diretores: termo de diretoria na coluna de cargo/função
+            eh_diretor = por_valor(
+                coluna_cargo,
+                lambda v: any(
+                    termo in str(v).upper()
+                    for termo in ["DIRETOR", "DIRETORA", "PRESIDENTE", "CEO"]
+                ),
+            ).astype(bool)
+
+            tem_matricula = matricula != ""
+            elegiveis = (
+                tem_matricula
+                & ~eh_diretor
+                & ~pd.Series(matricula).isin(matriculas_exclusao).to_numpy()
+            )
+            print(
+                f"Sem matrícula: {int((~tem_matricula).sum())}, "
+                f"diretores: {int((eh_diretor & tem_matricula).sum())}, "
+                f"elegíveis: {int(elegiveis.sum())}"
+            )
+
+            admissao = (
+                df[coluna_admissao].to_numpy(dtype=object)
+                if coluna_admissao in df.columns
+                else vazio
+            )
+            matriculas = matricula[elegiveis].tolist()
+            admissoes = admissao[elegiveis].tolist()
+            siglas = sindicato[elegiveis].tolist()
+
+            # Poucos sindicatos distintos: calcula os valores uma vez por sigla
+            valores = {}
+            for sigla in set(siglas):
+                valor_dia = self.VALORES_SINDICATO.get(sigla, 20.00)
+                valor_total = round(dias_uteis * valor_dia, 2)
+                valores[sigla] = (
+                    valor_dia,
+                    valor_total,
+                    round(valor_total * 0.8, 2),
+                    round(valor_total * 0.2, 2),
+                )
+
+            funcionarios = [
+                {
+                    "matricula": mat,
+                    "admissao": adm,
+                    "sindicato": sigla,
+                    "competencia": competencia,
+                    "dias_uteis": dias_uteis,
+                    "valor_diario_vr": valores[sigla][0],
+                    "valor_vr_total": valores[sigla][1],
+                    "valor_empresa": valores[sigla][2],
+                    "valor_funcionario": valores[sigla][3],
+                    "observacoes": "Processado com dados reais",
+                }
+                for mat, adm, sigla in zip(matriculas, admissoes, siglas)
+            ]
+            # Soma na mesma ordem do laço Python para manter os totais idênticos
+            total_vr = sum([valores[sigla][1] for sigla in siglas], total_vr)
+            total_empresa = sum([valores[sigla][2] for sigla in siglas], total_empresa)
+
+        print(f"Total de funcionários processados: {len(funcionarios)}")
+
+        if len(funcionarios) == 0:
+            for funcionario in self._processar_estrutura_flexivel(
+                {
+                    "dados": registros,
+                    "headers": dados_estruturados["ativos"]["headers"],
+                },
+                competencia,
+                dias_uteis,
+            ):
+                funcionarios.append(funcionario)
+                total_vr += funcionario["valor_vr_total"]
+                total_empresa += funcionario["valor_empresa"]
+
+        return self._montar_resultado_local(funcionarios, total_vr, total_empresa)
+
+    @staticmethod
+    def _dataframe_registros(registros):
+        """
+        Monta um DataFrame de texto a partir da lista de registros; chaves ausentes
+        viram string vazia, como no acesso por dicionário
+        """
+        if not registros:
+            return pd.DataFrame()
+        if isinstance(registros, TabelaRegistros):
+            return registros.para_dataframe()
+        return pd.DataFrame(list(registros), dtype=object).fillna("")
+
+    def _extrair_sindicato_vetorizado(self, colunas, por_valor, coluna_sindicato=None):
+        """
+        Versão vetorizada de _extrair_sindicato: mesma precedência (coluna de
+        sindicato; depois todas as colunas pelos nomes e, por fim, pela sigla
+        isolada), com o classificador aplicado só aos valores distintos
+        """
+        classificador = self.classificador_sindicato
+        resultado = None
+        if coluna_sindicato is not None and coluna_sindicato in colunas:
+            resultado = por_valor(coluna_sindicato, classificador.sigla)
+            if (resultado != "").all():
+                return resultado
+
+        for etapa in (0, 1):
+            # A primeira coluna com correspondência vence: percorre de trás pra frente
+            encontrado = None
+            for coluna in reversed(list(colunas)):
+                siglas = por_valor(
+                    coluna,
+                    lambda v: classificador.classificar_valor(v)[etapa] if v else "",
+                )
+                encontrado = (
+                    siglas
+                    if encontrado is None
+                    else np.where(siglas != "", siglas, encontrado)
+                )
+            resultado = (
+                encontrado
+                if resultado is None
+                else np.where(resultado != "", resultado, encontrado)
+            )
+        return resultado
+
+    def _gerar_planilha_excel(
+        self,
+        dados_processados,
+        competencia=None,
+        streaming=False,
+        caminho_saida=None,
+        dataset=None,
+    ):
         """
         Gera arquivo Excel com as colunas solicitadas pelo usuário.
         """
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        if ws is None:
-            ws = wb.create_sheet(title="VR MENSAL")
-        ws.title = "VR MENSAL"
+        return self._gerar_saidas(
+            dados_processados,
+            competencia=competencia,
+            streaming=streaming,
+            caminho_saida=caminho_saida,
+            dataset=dataset,
+        )["xlsx"]
+
+    def _gerar_saidas(
+        self,
+        dados_processados,
+        competencia=None,
+        streaming=False,
+        caminho_saida=None,
+        dataset=None,
+        formatos=("xlsx",),
+    ):
+        """
+        Grava o consolidado em cada formato pedido (xlsx, csv, jsonl, parquet) numa
+        única passagem pelas linhas; csv/jsonl/parquet são gravados em lotes de
+        TAMANHO_LOTE_EXPORTACAO linhas. Retorna {formato: caminho}.
+        """
+        headers = self.COLUNAS_PLANILHA_VR
+        competencia_val, linhas = self._linhas_consolidado(
+            dados_processados, competencia, streaming, dataset
+        )
+        nome_base = f"VR MENSAL {str(competencia_val).replace('/', '-')}"
 
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(
-            start_color="366092", end_color="366092", fill_type="solid"
-        )
-        center_align = Alignment(horizontal="center", vertical="center")
-        headers = [
-            "Matricula",
-            "Admissão",
-            "Sindicato do Colaborador",
-            "Competência",
-            "Dias",
-            "VALOR DIÁRIO VR",
-            "TOTAL",
-            "Custo empresa",
-            "Desconto profissional",
-            "OBS GERAL",
-        ]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = center_align
+        arquivos = {}
+        exportadores = []
+        try:
+            for formato in formatos:
+                if formato == "xlsx":
+                    continue
+                if formato not in EXPORTADORES_CONSOLIDADO:
+                    print(f"Formato de exportação desconhecido: {formato}")
+                    continue
+                if formato == "parquet" and pyarrow is None:
+                    print("pyarrow não instalado, exportação parquet ignorada")
+                    continue
+                caminho = self._caminho_arquivo_saida(
+                    f"{nome_base}.{formato}", caminho_saida
+                )
+                exportadores.append(EXPORTADORES_CONSOLIDADO[formato](caminho, headers))
+                arquivos[formato] = caminho
 
-        # Preparar mapas de matrícula para admissão - CORRIGIDO
-        dados_admissoes = self.extrair_dados_estruturados("ADMISSÃO ABRIL.xlsx")
-        admissoes_map = {}
-        for row in dados_admissoes["dados"]:
-            matricula = ""
-            data_admissao = ""
-            # Buscar matrícula em qualquer coluna
-            for key, value in row.items():
-                if value and any(
-                    term in key.lower()
-                    for term in ["matricula", "matrícula", "codigo", "id", "cadastro"]
-                ):
-                    matricula = str(value).strip()
-                    break
-            # Buscar data de admissão em qualquer coluna
-            for key, value in row.items():
-                if value and any(
-                    term in key.lower()
-                    for term in ["data", "admissao", "admissão", "dt", "date"]
-                ):
-                    data_str = str(value)
-                    # Remover hora se existir
-                    if " " in data_str:
-                        data_str = data_str.split(" ")[0]
-                    elif "T" in data_str:
-                        data_str = data_str.split("T")[0]
-                    data_admissao = data_str
-                    break
-            if matricula:
-                admissoes_map[matricula] = data_admissao
+            linhas = self._repassar_em_lotes(linhas, exportadores)
+            if "xlsx" in formatos:
+                save_path = self._caminho_arquivo_saida(
+                    f"{nome_base}.xlsx", caminho_saida
+                )
+                self._escrever_xlsx(save_path, headers, linhas)
+                arquivos["xlsx"] = save_path
+                print(f"Planilha salva em: {save_path}")
+            else:
+                for _ in linhas:
+                    pass
+        finally:
+            for exportador in exportadores:
+                exportador.fechar()
 
-        # Preparar outros mapas
-        dados_ativos = self.extrair_dados_estruturados("ATIVOS.xlsx")
-        sindicato_map = {}
-        for row in dados_ativos["dados"]:
-            for key, value in row.items():
-                if value and any(
-                    term in key.lower()
-                    for term in ["matricula", "matrícula", "codigo", "id"]
-                ):
-                    matricula = str(value).strip()
-                    # Buscar sindicato
-                    for k2, v2 in row.items():
-                        if v2 and any(
-                            s in str(v2).upper()
-                            for s in ["SP", "RJ", "RS", "PR", "SINDPD", "SITEPD"]
-                        ):
-                            sindicato_map[matricula] = str(v2)
-                            break
-                    break
+        for formato, caminho in arquivos.items():
+            if formato != "xlsx":
+                print(f"Exportação {formato} salva em: {caminho}")
+        print(
+            f"Total de registros processados: {len(dados_processados['funcionarios'])}"
+        )
+        return arquivos
 
-        dados_dias_uteis = self.extrair_dados_estruturados("Base dias uteis.xlsx")
-        dias_uteis_map = {}
-        for row in dados_dias_uteis["dados"]:
-            for key, value in row.items():
-                if value and any(
-                    s in str(value).upper()
-                    for s in ["SP", "RJ", "RS", "PR", "SINDPD", "SITEPD"]
-                ):
-                    sindicato_nome = str(value).strip()
-                    # Encontrar valor de dias
-                    for k2, v2 in row.items():
-                        if k2 != key and v2 and str(v2).strip().isdigit():
-                            dias_uteis_map[sindicato_nome] = int(str(v2).strip())
-                            break
-                    break
+    def _repassar_em_lotes(self, linhas, exportadores):
+        """
+        Repassa as linhas adiante e entrega cada lote completo aos exportadores
+        """
+        lote = []
+        for linha in linhas:
+            yield linha
+            if exportadores:
+                lote.append(linha)
+                if len(lote) >= self.TAMANHO_LOTE_EXPORTACAO:
+                    for exportador in exportadores:
+                        exportador.escrever(lote)
+                    lote = []
+        if lote:
+            for exportador in exportadores:
+                exportador.escrever(lote)
+
+    @staticmethod
+    def _caminho_arquivo_saida(filename, caminho_saida=None):
+        if caminho_saida:
+            return os.path.join(caminho_saida, filename)
+        data_dir = os.path.join(os.getcwd(), "data")
+        if os.path.isdir(data_dir):
+            return os.path.join(data_dir, filename)
+        return os.path.join(os.getcwd(), filename)
+
+    def _escrever_xlsx(self, save_path, headers, linhas):
+        escritor = self.escritor_planilha
+        if escritor == "xlsxwriter" and xlsxwriter is None:
+            print("xlsxwriter não instalado, usando openpyxl write_only")
+            escritor = "write_only"
+        with METRICAS.medir("escrita_xlsx", escritor=escritor) as medicao:
+            linhas = self._contar_linhas(linhas, medicao)
+            if escritor == "xlsxwriter":
+                self._escrever_planilha_xlsxwriter(save_path, headers, linhas)
+            elif escritor == "write_only":
+                self._escrever_planilha_write_only(save_path, headers, linhas)
+            else:
+                self._escrever_planilha_openpyxl(save_path, headers, linhas)
+            medicao.bytes = os.path.getsize(save_path)
 
-        dados_valor_sindicato = self.extrair_dados_estruturados(
-            "Base sindicato x valor.xlsx"
+    @staticmethod
+    def _contar_linhas(linhas, medicao):
+        for linha in linhas:
+            medicao.linhas += 1
+            yield linha
+
+    def consolidado_tabela(self, competencia=None, streaming=False):
+        """
+        Consolidado como DataFrame em memória (colunas de COLUNAS_PLANILHA_VR), para
+        quem só precisa dos dados, sem gravar e reler arquivos
+        """
+        dataset, dados_processados, competencia = self._preparar_consolidado(
+            competencia, streaming
         )
-        valor_sindicato_map = {}
-        for row in dados_valor_sindicato["dados"]:
-            for key, value in row.items():
-                if value and any(
-                    s in str(value).upper()
-                    for s in ["SP", "RJ", "RS", "PR", "SINDPD", "SITEPD"]
-                ):
-                    sindicato_nome = str(value).strip()
-                    # Encontrar valor
-                    for k2, v2 in row.items():
-                        if k2 != key and v2:
-                            try:
-                                valor_sindicato_map[sindicato_nome] = float(
-                                    str(v2).replace(",", ".")
-                                )
-                            except:
-                                valor_sindicato_map[sindicato_nome] = v2
-                            break
-                    break
+        _, linhas = self._linhas_consolidado(
+            dados_processados, competencia, streaming, dataset
+        )
+        return pd.DataFrame.from_records(list(linhas), columns=self.COLUNAS_PLANILHA_VR)
+
+    def _linhas_consolidado(self, dados_processados, competencia, streaming, dataset):
+        """
+        Monta os mapas do dataset e retorna (competência, gerador de linhas).
+        Os mapas de admissão, sindicato, dias úteis e valor vêm do dataset da
+        competência; sem dataset, só as bases necessárias são carregadas.
+        """
+        if dataset is None:
+            dataset = self.carregar_dataset(
+                competencia, streaming=streaming, bases=self.BASES_PLANILHA_VR
+            )
+        admissoes_map = dataset.mapa_admissoes()
+        sindicato_map = dataset.mapa_sindicatos()
+        dias_uteis_map = dataset.mapa_dias_uteis()
+        valor_sindicato_map = dataset.mapa_valores_sindicato()
 
         # DEBUG: Mostrar mapas carregados
         print("=== DEBUG: MAPAS CARREGADOS ===")
@@ -758,10 +4270,33 @@ class LeitorPlanilhas:
 
         competencia_val = (
             competencia
-            if competencia
-            else dados_processados.get("competencia", "05/2025")
+            or getattr(dataset, "competencia", None)
+            or dados_processados.get("competencia", self.COMPETENCIA_PADRAO)
         )
 
+        linhas = self._linhas_planilha_vr(
+            dados_processados,
+            competencia_val,
+            admissoes_map,
+            sindicato_map,
+            dias_uteis_map,
+            valor_sindicato_map,
+        )
+        return competencia_val, linhas
+
+    def _linhas_planilha_vr(
+        self,
+        dados_processados,
+        competencia_val,
+        admissoes_map,
+        sindicato_map,
+        dias_uteis_map,
+        valor_sindicato_map,
+    ):
+        """
+        Gera as linhas (listas na ordem de COLUNAS_PLANILHA_VR) da planilha VR MENSAL
+        """
+        dias_padrao = dias_uteis_competencia(competencia_val)
         # Processar TODOS os funcionários, não apenas alguns
         for row_idx, funcionario in enumerate(dados_processados["funcionarios"], 2):
             matricula = str(funcionario.get("matricula", "")).strip()
@@ -790,7 +4325,7 @@ class LeitorPlanilhas:
                         dias = dias_uteis_map[key]
                         break
             if dias is None:
-                dias = funcionario.get("dias_uteis", 22)
+                dias = funcionario.get("dias_uteis", dias_padrao)
 
             # Buscar valor diário
             valor_diario = None
@@ -825,24 +4360,131 @@ class LeitorPlanilhas:
             elif "diretor" in obs_geral.lower() or "confiança" in obs_geral.lower():
                 obs_geral = "Cargo de confiança - não possui direito ao VR"
 
-            # Preencher planilha
-            ws.cell(row=row_idx, column=1, value=matricula)
-            ws.cell(row=row_idx, column=2, value=admissao)
-            ws.cell(row=row_idx, column=3, value=sindicato_full)
-            ws.cell(row=row_idx, column=4, value=competencia_str)
-            ws.cell(row=row_idx, column=5, value=dias_num)
-            ws.cell(row=row_idx, column=6, value=valor_diario_num)
-            ws.cell(row=row_idx, column=7, value=total)
-            ws.cell(row=row_idx, column=8, value=custo_empresa)
-            ws.cell(row=row_idx, column=9, value=desconto_profissional)
-            ws.cell(row=row_idx, column=10, value=obs_geral)
-
             # Debug apenas dos primeiros registros
             if row_idx <= 5:
                 print(
                     f"Processado: {matricula} - {sigla} - {dias_num}d - R${valor_diario_num} - Total: R${total}"
                 )
 
+            yield [
+                matricula,
+                admissao,
+                sindicato_full,
+                competencia_str,
+                dias_num,
+                valor_diario_num,
+                total,
+                custo_empresa,
+                desconto_profissional,
+                obs_geral,
+            ]
+
+    @staticmethod
+    def _largura_coluna(max_length):
+        return (max_length + 2) * 1.2
+
+    def _escrever_planilha_write_only(self, save_path, headers, linhas):
+        """
+        Escrita rápida com openpyxl write_only: linhas inteiras via append direto do
+        gerador e estilo do cabeçalho aplicado uma vez. As larguras precisam estar
+        definidas antes da 1ª linha, então saem das primeiras LINHAS_AMOSTRA_LARGURA
+        linhas (só essa amostra fica em memória)
+        """
+        linhas = iter(linhas)
+        amostra = list(itertools.islice(linhas, self.LINHAS_AMOSTRA_LARGURA))
+        larguras = [len(str(header)) for header in headers]
+        for linha in amostra:
+            for i, valor in enumerate(linha):
+                tamanho = len(str(valor))
+                if tamanho > larguras[i]:
+                    larguras[i] = tamanho
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title="VR MENSAL")
+        # No modo write_only as larguras precisam estar definidas antes da 1ª linha
+        for i, largura in enumerate(larguras, 1):
+            ws.column_dimensions[get_column_letter(i)].width = self._largura_coluna(
+                largura
+            )
+        cabecalho = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = self.FONTE_CABECALHO
+            cell.fill = self.PREENCHIMENTO_CABECALHO
+            cell.alignment = self.ALINHAMENTO_CABECALHO
+            cabecalho.append(cell)
+        ws.append(cabecalho)
+        for linha in itertools.chain(amostra, linhas):
+            ws.append(
+                [
+                    self._celula_data(ws, valor) if isinstance(valor, date) else valor
+                    for valor in linha
+                ]
+            )
+        wb.save(save_path)
+
+    def _celula_data(self, ws, valor):
+        cell = WriteOnlyCell(ws, value=valor)
+        cell.number_format = self.FORMATO_DATA_PLANILHA
+        return cell
+
+    def _escrever_planilha_xlsxwriter(self, save_path, headers, linhas):
+        """
+        Escrita com xlsxwriter em constant_memory: cada linha vai direto para o
+        arquivo e as larguras são aplicadas no fim
+        """
+        wb = xlsxwriter.Workbook(
+            save_path,
+            {
+                "constant_memory": True,
+                "default_date_format": self.FORMATO_DATA_PLANILHA,
+            },
+        )
+        ws = wb.add_worksheet("VR MENSAL")
+        formato_cabecalho = wb.add_format(
+            {
+                "bold": True,
+                "font_color": "#FFFFFF",
+                "bg_color": "#366092",
+                "align": "center",
+                "valign": "vcenter",
+            }
+        )
+        ws.write_row(0, 0, headers, formato_cabecalho)
+        larguras = [len(str(header)) for header in headers]
+        for row_idx, linha in enumerate(linhas, 1):
+            ws.write_row(row_idx, 0, linha)
+            for i, valor in enumerate(linha):
+                tamanho = len(str(valor))
+                if tamanho > larguras[i]:
+                    larguras[i] = tamanho
+        for i, largura in enumerate(larguras):
+            ws.set_column(i, i, self._largura_coluna(largura))
+        wb.close()
+
+    def _escrever_planilha_openpyxl(self, save_path, headers, linhas):
+        """
+        Escrita original, célula a célula, com as larguras calculadas relendo a
+        planilha; mantida para comparação no benchmark
+        """
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        if ws is None:
+            ws = wb.create_sheet(title="VR MENSAL")
+        ws.title = "VR MENSAL"
+
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=1, column=col, value=header)
+            cell.font = self.FONTE_CABECALHO
+            cell.fill = self.PREENCHIMENTO_CABECALHO
+            cell.alignment = self.ALINHAMENTO_CABECALHO
+
+        for row_idx, linha in enumerate(linhas, 2):
+            for col, valor in enumerate(linha, 1):
+                cell = ws.cell(row=row_idx, column=col, value=valor)
+                if isinstance(valor, date):
+                    cell.number_format = self.FORMATO_DATA_PLANILHA
+
         # Ajustar larguras das colunas
         for col in ws.columns:
             max_length = 0
@@ -859,24 +4501,10 @@ class LeitorPlanilhas:
                 except:
                     pass
             if column:
-                adjusted_width = (max_length + 2) * 1.2
+                adjusted_width = self._largura_coluna(max_length)
                 ws.column_dimensions[column].width = adjusted_width
 
-        # Salvar arquivo
-        competencia_str = str(competencia_val).replace("/", "-")
-        filename = f"VR MENSAL {competencia_str}.xlsx"
-        data_dir = os.path.join(os.getcwd(), "data")
-        if os.path.isdir(data_dir):
-            save_path = os.path.join(data_dir, filename)
-        else:
-            save_path = os.path.join(os.getcwd(), filename)
-
         wb.save(save_path)
-        print(f"Planilha salva em: {save_path}")
-        print(
-            f"Total de registros processados: {len(dados_processados['funcionarios'])}"
-        )
-        return save_path
 
     def ler_admissao_abril(self):
         return self.ler_planilha_como_string("ADMISSÃO ABRIL.xlsx")
@@ -920,13 +4548,12 @@ class LeitorPlanilhas:
 
             resultado = f"=== PDF: {nome_arquivo} ===\n"
 
-            with open(caminho_completo, "rb") as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-
-                for num_pagina, page in enumerate(pdf_reader.pages, 1):
-                    texto_pagina = page.extract_text()
-                    resultado += f"\n--- Página {num_pagina} ---\n"
-                    resultado += texto_pagina + "\n"
+            # Texto por página vem do cache (memória/disco) quando o PDF não mudou
+            for num_pagina, texto_pagina in enumerate(
+                self.cache_pdfs.paginas(caminho_completo), 1
+            ):
+                resultado += f"\n--- Página {num_pagina} ---\n"
+                resultado += texto_pagina + "\n"
 
             resultado += "\n"
             return resultado
@@ -947,6 +4574,52 @@ class LeitorPlanilhas:
                 return self.ler_pdf_como_string(nome)
         return f"PDF do sindicato '{sigla}' não encontrado. Disponíveis: {arquivos}"
 
+    def indice_pdfs(self):
+        """
+        Índice BM25 dos PDFs em caminho_pasta_pdfs, criado na primeira consulta e
+        atualizado incrementalmente quando algum PDF muda
+        """
+        with self._lock_indice_pdfs:
+            if self._indice_pdfs is None:
+                self._indice_pdfs = IndiceBM25(
+                    os.path.join(self.caminho_cache, "indice", "pdfs_bm25.json")
+                )
+        documentos = [
+            (
+                nome,
+                os.path.join(self.caminho_pasta_pdfs, nome),
+                self.classificador_sindicato.detectar_em_texto(
+                    os.path.splitext(nome)[0]
+                ),
+            )
+            for nome in sorted(os.listdir(self.caminho_pasta_pdfs))
+            if nome.lower().endswith(".pdf")
+        ]
+        alterados = self._indice_pdfs.atualizar(
+            documentos, self.cache_pdfs.hash_pdf, self.cache_pdfs.paginas
+        )
+        if alterados:
+            print(
+                f"Índice de PDFs atualizado: {alterados} documento(s) reprocessado(s)"
+            )
+        return self._indice_pdfs
+
+    def buscar_trechos_pdf(self, pergunta, sigla=None, k=6):
+        """
+        Trechos dos PDFs mais relevantes para a pergunta, formatados para o prompt
+        """
+        sigla = sigla or self.classificador_sindicato.detectar_em_texto(pergunta)
+        trechos = self.indice_pdfs().buscar(pergunta, k=k, sigla=sigla or None)
+        if not trechos:
+            return ""
+        resultado = "=== TRECHOS RELEVANTES DOS PDFS ===\n"
+        for trecho in trechos:
+            resultado += (
+                f"\n--- {trecho['documento']}, página {trecho['pagina']} ---\n"
+                f"{trecho['texto']}\n"
+            )
+        return resultado + "\n"
+
     def ler_todos_pdfs(self):
         """
         Lê todos os PDFs de uma vez
@@ -962,8 +4635,27 @@ class LeitorPlanilhas:
         """
         Método principal que coordena todo o fluxo
         """
+        for evento in self.processar_pergunta_usuario_stream(
+            pergunta_usuario, stream_modelo=False
+        ):
+            if evento["evento"] == "fim":
+                return evento["resposta"]
+
+    def processar_pergunta_usuario_stream(self, pergunta_usuario, stream_modelo=True):
+        """
+        Mesmo fluxo de processar_pergunta_usuario, como gerador de eventos:
+        {"evento": "progresso", "etapa", "mensagem"}, {"evento": "token", "texto"} e,
+        por último, {"evento": "fim", "resposta", "roteamento", "metricas"}.
+        Com stream_modelo=True a resposta final chega em pedaços, conforme o modelo
+        gera o texto.
+        """
+        inicio = time.perf_counter()
+        self.ultimo_roteamento = None
         if not self.model:
-            return "Erro: API key do Gemini não configurada"
+            resposta = "Erro: API key do Gemini não configurada"
+            yield {"evento": "token", "texto": resposta}
+            yield self._evento_fim(resposta, inicio, None)
+            return
 
         # Verificar se é solicitação de consolidado VR
         if any(
@@ -976,166 +4668,237 @@ class LeitorPlanilhas:
                 "gerar planilha",
             ]
         ):
-            return self.gerar_consolidado_vr()
-
-        tipo_dados = self._determinar_tipo_dados(pergunta_usuario)
-
-        dados_completos = ""
-        metodos_usados = []
-
-        if "excel" in tipo_dados:
-            metodo_excel = self._escolher_metodo_excel(pergunta_usuario)
-            dados_excel = self._executar_metodo(metodo_excel)
-            dados_completos += dados_excel
-            metodos_usados.append(f"Excel: {metodo_excel}")
+            yield {
+                "evento": "progresso",
+                "etapa": "consolidado",
+                "mensagem": "Gerando consolidado de VR",
+            }
+            competencia = re.search(r"\b(\d{2})[/.-](\d{4})\b", pergunta_usuario)
+            competencia = (
+                f"{competencia.group(1)}/{competencia.group(2)}"
+                if competencia
+                else None
+            )
+            if self.fila_consolidados is not None:
+                try:
+                    job = self.fila_consolidados.submeter(competencia)
+                except ValueError as e:
+                    resposta = str(e)
+                else:
+                    yield {"evento": "job", "job": job}
+                    resposta = (
+                        f"Consolidado de VR "
+                        f"{'já está' if job['deduplicado'] else 'foi'} "
+                        f"enviado para processamento (job {job['id']}). "
+                        f"Acompanhe em /consolidado/{job['id']}."
+                    )
+            else:
+                resposta = self.gerar_consolidado_vr(competencia)
+            yield {"evento": "token", "texto": resposta}
+            yield self._evento_fim(resposta, inicio, None)
+            return
+
+        yield {
+            "evento": "progresso",
+            "etapa": "roteamento",
+            "mensagem": "Escolhendo as fontes de dados",
+        }
+        inicio_roteamento = time.perf_counter()
+        rota = self.roteador.rotear(pergunta_usuario, self.model)
+        rota["tempo_roteamento_ms"] = round(
+            (time.perf_counter() - inicio_roteamento) * 1000, 1
+        )
+        self.ultimo_roteamento = rota
+        print(
+            f"Roteamento {rota['caminho']} (confiança {rota['confianca']}, "
+            f"{rota['tempo_roteamento_ms']} ms): {', '.join(rota['tipo'])}"
+        )
+        tipo_dados = rota["tipo"]
 
-        if "pdf" in tipo_dados:
-            metodo_pdf = self._escolher_metodo_pdf(pergunta_usuario)
-            dados_pdf = self._executar_metodo_pdf(metodo_pdf)
-            dados_completos += "\n" + dados_pdf
-            metodos_usados.append(f"PDF: {metodo_pdf}")
+        yield {
+            "evento": "progresso",
+            "etapa": "dados",
+            "mensagem": f"Buscando dados: {', '.join(tipo_dados).upper()}",
+        }
 
-        resposta_final = self._gerar_resposta_final(
-            pergunta_usuario, metodos_usados, dados_completos
+        ramos = {"excel": self._ramo_excel, "pdf": self._ramo_pdf}
+        resultados = self._executar_ramos(
+            [(nome, ramos[nome]) for nome in self.RAMOS_CONSULTA if nome in tipo_dados],
+            pergunta_usuario,
+            rota,
         )
 
-        return resposta_final
+        # Montagem sempre na ordem Excel, PDF, independente de qual terminou antes
+        dados_completos = ""
+        metodos_usados = []
+        for nome, (dados, metodo) in resultados:
+            dados_completos += dados if nome == "excel" else "\n" + dados
+            metodos_usados.append(metodo)
+
+        yield {
+            "evento": "progresso",
+            "etapa": "resposta",
+            "mensagem": "Gerando resposta",
+        }
+        partes = []
+        primeiro_token = None
+        if stream_modelo:
+            pedacos = self._gerar_resposta_final_stream(
+                pergunta_usuario, metodos_usados, dados_completos
+            )
+        else:
+            pedacos = [
+                self._gerar_resposta_final(
+                    pergunta_usuario, metodos_usados, dados_completos
+                )
+            ]
+        for pedaco in pedacos:
+            if primeiro_token is None:
+                primeiro_token = time.perf_counter()
+            partes.append(pedaco)
+            yield {"evento": "token", "texto": pedaco}
+
+        resposta_final = "".join(partes).strip()
+        yield self._evento_fim(resposta_final, inicio, primeiro_token)
+
+    def _evento_fim(self, resposta, inicio, primeiro_token):
+        fim = time.perf_counter()
+        metricas = {
+            "primeiro_token_ms": (
+                round((primeiro_token - inicio) * 1000, 1) if primeiro_token else None
+            ),
+            "total_ms": round((fim - inicio) * 1000, 1),
+        }
+        return {
+            "evento": "fim",
+            "resposta": resposta,
+            "roteamento": self.ultimo_roteamento,
+            "metricas": metricas,
+        }
 
-    def _determinar_tipo_dados(self, pergunta_usuario):
+    def _executar_metodo_pdf(self, nome_metodo, pergunta=None):
         """
-        Determina se a pergunta precisa de dados do Excel, PDF ou ambos
+        Executa o método PDF escolhido e retorna os dados. Com a pergunta, envia só
+        os trechos mais relevantes (índice BM25) em vez do texto inteiro dos PDFs.
         """
-        prompt_tipo = f"""
-        Analise a pergunta do usuário e determine que tipo de dados são necessários:
-
-        PERGUNTA: {pergunta_usuario}
-
-        Responda APENAS com uma das opções:
-        - excel (se precisar apenas de dados das planilhas Excel)
-        - pdf (se precisar apenas de dados dos PDFs de sindicatos)  
-        - excel,pdf (se precisar de ambos os tipos de dados)
-
-        RESPOSTA:
-        """
-
         try:
-            response = self.model.generate_content(prompt_tipo)
-            tipo = response.text.strip().lower()
-
-            if "excel,pdf" in tipo or "pdf,excel" in tipo:
-                return ["excel", "pdf"]
-            elif "pdf" in tipo:
-                return ["pdf"]
-            else:
-                return ["excel"]  # Padrão
-
+            sigla = None
+            if nome_metodo.startswith("ler_sindicato_pdf"):
+                # Extrai a sigla entre aspas simples
+                match = re.search(r"ler_sindicato_pdf\('([A-Z]{2})'\)", nome_metodo)
+                if not match:
+                    return f"Método PDF inválido: {nome_metodo}"
+                sigla = match.group(1)
+            if pergunta and self.usar_indice_pdfs:
+                try:
+                    trechos = self.buscar_trechos_pdf(pergunta, sigla=sigla)
+                    if trechos:
+                        return trechos
+                except Exception as e:
+                    print(f"Busca no índice de PDFs falhou, lendo PDFs inteiros: {e}")
+            if sigla:
+                return self.ler_sindicato_pdf(sigla)
+            metodo = getattr(self, nome_metodo)
+            return metodo()
         except Exception as e:
-            return ["excel"]  # Fallback
+            return f"Erro ao executar PDF {nome_metodo}: {str(e)}"
 
-    def _escolher_metodo_excel(self, pergunta_usuario):
+    def _ramo_excel(self, pergunta_usuario, rota):
         """
-        Agente 1 para Excel: Escolhe qual método executar baseado na pergunta do usuário
+        Dados das planilhas para a pergunta: (dados, descrição do método usado)
         """
-        prompt_escolha = f"""
-        Você é um agente especialista em análise de dados de RH. Baseado na pergunta do usuário, escolha APENAS UM dos métodos de planilhas Excel disponíveis:
-
-        MÉTODOS EXCEL DISPONÍVEIS:
-        - ler_admissao_abril
-        - ler_afastamentos  
-        - ler_aprendiz
-        - ler_ativos
-        - ler_base_dias_uteis
-        - ler_base_sindicato_valor
-        - ler_desligados
-        - ler_estagio
-        - ler_exterior
-        - ler_ferias
-        - ler_vr_mensal
-        - ler_todas_planilhas
-
-        PERGUNTA DO USUÁRIO: {pergunta_usuario}
-
-        RESPONDA APENAS COM O NOME EXATO DO MÉTODO:
+        # Contagens, agrupamentos e buscas são calculados localmente; só a
+        # tabela resultante vai para o prompt
+        consulta = self._executar_consulta_local(pergunta_usuario)
+        if consulta:
+            return consulta["tabela"], f"Consulta local: {consulta['descricao']}"
+        metodo_excel = rota["metodo_excel"]
+        return self._executar_metodo(metodo_excel), f"Excel: {metodo_excel}"
+
+    def _ramo_pdf(self, pergunta_usuario, rota):
         """
-
-        try:
-            response = self.model.generate_content(prompt_escolha)
-            metodo = response.text.strip()
-
-            metodos_excel_validos = [
-                "ler_admissao_abril",
-                "ler_afastamentos",
-                "ler_aprendiz",
-                "ler_ativos",
-                "ler_base_dias_uteis",
-                "ler_base_sindicato_valor",
-                "ler_desligados",
-                "ler_estagio",
-                "ler_exterior",
-                "ler_ferias",
-                "ler_vr_mensal",
-                "ler_todas_planilhas",
-            ]
-
-            return metodo if metodo in metodos_excel_validos else "ler_todas_planilhas"
-
-        except Exception as e:
-            return "ler_todas_planilhas"
-
-    def _escolher_metodo_pdf(self, pergunta_usuario):
+        Dados dos PDFs para a pergunta: (dados, descrição do método usado)
         """
-        Agente 1 para PDF: Escolhe qual método PDF executar baseado na pergunta do usuário
+        metodo_pdf = rota["metodo_pdf"]
+        return (
+            self._executar_metodo_pdf(metodo_pdf, pergunta_usuario),
+            f"PDF: {metodo_pdf}",
+        )
+
+    def _executar_ramos(self, ramos, pergunta_usuario, rota):
         """
-        prompt_escolha_pdf = f"""
-        Você é um agente especialista em documentos sindicais. Baseado na pergunta do usuário, escolha APENAS UM dos métodos de PDFs disponíveis:
+        Executa os ramos (Excel/PDF) em paralelo, cada um com seu timeout. Um ramo que
+        estoura o tempo ou falha vira uma mensagem e os demais seguem (resultado
+        parcial). Retorna [(nome, (dados, método))] na ordem de entrada.
 
-        MÉTODOS PDF DISPONÍVEIS:
-        - ler_sindicato_pdf('RJ') (Sindicato RJ)
-        - ler_sindicato_pdf('SP') (Sindicato SP)
-        - ler_sindicato_pdf('RS') (Sindicato RS)
-        - ler_sindicato_pdf('PR') (Sindicato PR)
-        - ler_todos_pdfs (Todos os documentos sindicais)
+        O timeout de um ramo conta a partir de quando ele começa a rodar; a espera
+        por uma thread livre do pool tem o mesmo limite, e um ramo que não chegou a
+        começar é cancelado.
+        """
+        if len(ramos) == 1:
+            nome, funcao = ramos[0]
+            return [(nome, funcao(pergunta_usuario, rota))]
 
-        PERGUNTA DO USUÁRIO: {pergunta_usuario}
+        inicios = {}
+        futuros = []
+        for nome, funcao in ramos:
+            iniciado = threading.Event()
 
-        RESPONDA APENAS COM O NOME EXATO DO MÉTODO:
-        """
+            def rodar(nome=nome, funcao=funcao, iniciado=iniciado):
+                inicios[nome] = time.perf_counter()
+                iniciado.set()
+                return funcao(pergunta_usuario, rota)
 
-        try:
-            response = self.model.generate_content(prompt_escolha_pdf)
-            metodo = response.text.strip()
-
-            metodos_pdf_validos = [
-                "ler_sindicato_pdf('RJ')",
-                "ler_sindicato_pdf('SP')",
-                "ler_sindicato_pdf('RS')",
-                "ler_sindicato_pdf('PR')",
-                "ler_todos_pdfs",
-            ]
-            return metodo if metodo in metodos_pdf_validos else "ler_todos_pdfs"
+            futuros.append((nome, iniciado, self._executor_consultas.submit(rodar)))
 
-        except Exception as e:
-            return "ler_todos_pdfs"
+        resultados = []
+        for nome, iniciado, futuro in futuros:
+            timeout = self.timeouts_ramos.get(nome)
+            try:
+                if timeout is None:
+                    resultados.append((nome, futuro.result()))
+                    continue
+                if not iniciado.wait(timeout) and futuro.cancel():
+                    raise FuturesTimeoutError()
+                iniciado.wait()
+                restante = max(0.0, timeout - (time.perf_counter() - inicios[nome]))
+                resultados.append((nome, futuro.result(timeout=restante)))
+            except FuturesTimeoutError:
+                print(f"Ramo {nome} excedeu {timeout}s; seguindo sem esses dados")
+                resultados.append(
+                    (
+                        nome,
+                        (
+                            f"[Dados de {nome} indisponíveis: tempo limite de "
+                            f"{timeout}s excedido]\n",
+                            f"{nome.upper()}: tempo esgotado",
+                        ),
+                    )
+                )
+            except Exception as e:
+                print(f"Ramo {nome} falhou: {e}")
+                resultados.append(
+                    (
+                        nome,
+                        (
+                            f"[Dados de {nome} indisponíveis: {e}]\n",
+                            f"{nome.upper()}: erro",
+                        ),
+                    )
+                )
+        return resultados
 
-    def _executar_metodo_pdf(self, nome_metodo):
+    def _executar_consulta_local(self, pergunta_usuario):
         """
-        Executa o método PDF escolhido e retorna os dados
+        Tenta responder a pergunta com as consultas locais; None se não souber
         """
+        if self.consultas_locais is None:
+            return None
         try:
-            if nome_metodo.startswith("ler_sindicato_pdf"):
-                # Extrai a sigla entre aspas simples
-                import re
-
-                match = re.search(r"ler_sindicato_pdf\('([A-Z]{2})'\)", nome_metodo)
-                if match:
-                    sigla = match.group(1)
-                    return self.ler_sindicato_pdf(sigla)
-                else:
-                    return f"Método PDF inválido: {nome_metodo}"
-            metodo = getattr(self, nome_metodo)
-            return metodo()
+            return self.consultas_locais.responder(pergunta_usuario)
         except Exception as e:
-            return f"Erro ao executar PDF {nome_metodo}: {str(e)}"
+            print(f"Consulta local falhou, usando leitura da planilha: {e}")
+            return None
 
     def _executar_metodo(self, nome_metodo):
         """
@@ -1151,7 +4914,35 @@ class LeitorPlanilhas:
         """
         Agente 2: Gera resposta final baseado nos dados e contexto
         """
-        prompt_resposta = f"""
+        prompt_resposta = self._prompt_resposta_final(
+            pergunta_original, metodos_usados, dados
+        )
+
+        try:
+            response = self.model.generate_content(prompt_resposta)
+            return response.text.strip()
+        except Exception as e:
+            return f"Erro ao gerar resposta: {str(e)}"
+
+    def _gerar_resposta_final_stream(self, pergunta_original, metodos_usados, dados):
+        """
+        Versão em streaming do agente 2: gera os pedaços de texto conforme o modelo
+        os produz
+        """
+        prompt_resposta = self._prompt_resposta_final(
+            pergunta_original, metodos_usados, dados
+        )
+
+        try:
+            for chunk in self.model.generate_content(prompt_resposta, stream=True):
+                texto = getattr(chunk, "text", "")
+                if texto:
+                    yield texto
+        except Exception as e:
+            yield f"Erro ao gerar resposta: {str(e)}"
+
+    def _prompt_resposta_final(self, pergunta_original, metodos_usados, dados):
+        return f"""
         Você é um especialista em dados de RH e documentos sindicais. Responda à pergunta do usuário usando os dados fornecidos.
 
         CONTEXTO: O usuário perguntou "{pergunta_original}" e com base nisso foram escolhidos os métodos: {', '.join(metodos_usados)} para buscar os dados relevantes.
@@ -1162,12 +4953,6 @@ class LeitorPlanilhas:
         Analise os dados e forneça uma resposta clara, objetiva e útil para a pergunta do usuário. Se os dados incluem planilhas e PDFs, considere ambas as fontes na sua resposta.
         """
 
-        try:
-            response = self.model.generate_content(prompt_resposta)
-            return response.text.strip()
-        except Exception as e:
-            return f"Erro ao gerar resposta: {str(e)}"
-
     def ler_todas_planilhas(self):
         """
         Lê todas as planilhas de uma vez e retorna uma string única com todos os dados
@@ -1180,6 +4965,121 @@ class LeitorPlanilhas:
         return resultado_completo
 
 
+def normalizar_competencia(competencia):
+    """
+    Competência como "MM/AAAA"; vazia vira LeitorPlanilhas.COMPETENCIA_PADRAO.
+    Levanta ValueError se não for um único mês válido
+    """
+    if not competencia:
+        return LeitorPlanilhas.COMPETENCIA_PADRAO
+    meses = expandir_competencias([competencia])
+    if len(meses) != 1:
+        raise ValueError(f"Competência inválida: {competencia!r}")
+    return meses[0]
+
+
+def periodo_competencia(competencia):
+    """
+    Período de apuração de uma competência: de 15 do mês anterior a 15 do mês
+    """
+    mes, ano = (int(parte) for parte in normalizar_competencia(competencia).split("/"))
+    inicio = date(ano - 1, 12, 15) if mes == 1 else date(ano, mes - 1, 15)
+    return inicio, date(ano, mes, 15)
+
+
+def dias_uteis_competencia(competencia):
+    """
+    Dias úteis (segunda a sexta) do período de apuração da competência
+    """
+    inicio, fim = periodo_competencia(competencia)
+    return int(np.busday_count(inicio, fim))
+
+
+def expandir_competencias(competencias):
+    """
+    Lista de competências "MM/AAAA" a partir de itens avulsos e intervalos
+    ("01/2025-06/2025" ou "01/2025..06/2025"), sem repetições e em ordem
+    """
+    if isinstance(competencias, str):
+        competencias = re.split(r"[,\s]+", competencias.strip())
+    meses = set()
+    for item in competencias:
+        limites = re.fullmatch(
+            r"(\d{1,2})[/.-](\d{4})(?:\s*(?:-|\.\.)\s*(\d{1,2})[/.-](\d{4}))?",
+            str(item).strip(),
+        )
+        if limites is None:
+            raise ValueError(f"Competência inválida: {item!r}")
+        mes, ano = int(limites.group(1)), int(limites.group(2))
+        mes_fim, ano_fim = (
+            (int(limites.group(3)), int(limites.group(4)))
+            if limites.group(3)
+            else (mes, ano)
+        )
+        if not (1 <= mes <= 12 and 1 <= mes_fim <= 12):
+            raise ValueError(f"Competência inválida: {item!r}")
+        for indice in range(ano * 12 + mes - 1, ano_fim * 12 + mes_fim):
+            meses.add(indice)
+    if not meses:
+        raise ValueError("Nenhuma competência informada")
+    return [f"{indice % 12 + 1:02d}/{indice // 12}" for indice in sorted(meses)]
+
+
+# Leitor de cada processo do lote de competências, criado uma vez por processo
+_LEITOR_LOTE = None
+_DADOS_LOTE = None
+
+
+def _iniciar_processo_lote(config, dados):
+    global _LEITOR_LOTE, _DADOS_LOTE
+    _LEITOR_LOTE = LeitorPlanilhas(**config)
+    _DADOS_LOTE = dados
+
+
+def _consolidar_competencia_lote(competencia, formatos, caminho_saida):
+    return _LEITOR_LOTE._consolidar_competencia(
+        competencia, _DADOS_LOTE, formatos, caminho_saida
+    )
+
+
+def _executar_lote_cli(argumentos):
+    """
+    python app.py lote 01/2025-06/2025 [--processos N] [--formatos xlsx csv]
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py lote", description="Gera o consolidado VR de várias competências"
+    )
+    parser.add_argument("competencias", nargs="+")
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--formatos", nargs="+", default=["xlsx"])
+    parser.add_argument("--saida", default=None)
+    parser.add_argument("--pasta", default="./bases")
+    parser.add_argument("--zip", default=os.getenv("BASES_ZIP"))
+    parser.add_argument("--resumo-json", default=None)
+    args = parser.parse_args(argumentos)
+
+    leitor = LeitorPlanilhas(
+        caminho_pasta=args.pasta,
+        caminho_pasta_pdfs="./documents",
+        api_key_gemini=os.getenv("GOOGLE_API_KEY"),
+        usar_consultas_locais=False,
+        caminho_zip=args.zip,
+    )
+    lote = leitor.gerar_consolidados_lote(
+        args.competencias,
+        max_processos=args.processos,
+        formatos=tuple(args.formatos),
+        caminho_saida=args.saida,
+    )
+    if args.resumo_json:
+        with open(args.resumo_json, "w", encoding="utf-8") as arquivo:
+            json.dump(lote, arquivo, ensure_ascii=False, indent=2)
+    return 1 if any("erro" in r for r in lote["competencias"]) else 0
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["lote"]:
+    sys.exit(_executar_lote_cli(sys.argv[2:]))
+
 if __name__ == "__main__":
     # Verificar API key
     API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -1188,6 +5088,9 @@ if __name__ == "__main__":
         caminho_pasta="./bases",
         caminho_pasta_pdfs="./documents",
         api_key_gemini=API_KEY,
+        consolidado_em_segundo_plano=True,
+        # Ex.: BASES_ZIP="./data/Desafio 4 - Dados.zip" lê as planilhas do ZIP
+        caminho_zip=os.getenv("BASES_ZIP"),
     )
 
     app = Flask(__name__)
@@ -1463,10 +5366,11 @@ if __name__ == "__main__":
                 messageInput.value = '';
 
                 sendButton.disabled = true;
+                loading.textContent = 'Processando sua pergunta com dados reais';
                 loading.style.display = 'block';
 
                 try {
-                    const response = await fetch('/chat', {
+                    const response = await fetch('/chat/stream', {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
@@ -1474,13 +5378,10 @@ if __name__ == "__main__":
                         body: JSON.stringify({ message: message })
                     });
 
-                    const data = await response.json();
-
-                    if (data.success) {
-                        addMessage(data.response, 'bot');
-                    } else {
-                        addMessage('Desculpe, ocorreu um erro: ' + data.error, 'bot');
+                    if (!response.ok || !response.body) {
+                        throw new Error('Streaming indisponível');
                     }
+                    await readStream(response.body.getReader());
 
                 } catch (error) {
                     console.error('Erro:', error);
@@ -1491,6 +5392,77 @@ if __name__ == "__main__":
                 }
             }
 
+            // Lê os eventos SSE do /chat/stream e atualiza a mensagem a cada pedaço
+            async function readStream(reader) {
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let text = '';
+                let messageDiv = null;
+
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+
+                    const blocks = buffer.split('\\n\\n');
+                    buffer = blocks.pop();
+                    for (const block of blocks) {
+                        const dataLine = block.split('\\n').find(l => l.startsWith('data: '));
+                        if (!dataLine) continue;
+                        const evento = JSON.parse(dataLine.slice(6));
+
+                        if (evento.evento === 'progresso') {
+                            loading.textContent = evento.mensagem;
+                        } else if (evento.evento === 'token') {
+                            loading.style.display = 'none';
+                            text += evento.texto;
+                            if (!messageDiv) {
+                                messageDiv = addMessage(text, 'bot');
+                            } else {
+                                setMessageText(messageDiv, text);
+                            }
+                        } else if (evento.evento === 'fim') {
+                            if (messageDiv) setMessageText(messageDiv, evento.resposta);
+                            console.log('Métricas do chat:', evento.metricas);
+                        } else if (evento.evento === 'job') {
+                            watchJob(evento.job.id);
+                        } else if (evento.evento === 'erro') {
+                            addMessage('Desculpe, ocorreu um erro: ' + evento.erro, 'bot');
+                        }
+                    }
+                }
+            }
+
+            // Acompanha um job de consolidado até terminar e mostra o link de download
+            function watchJob(jobId) {
+                const statusDiv = addMessage('Consolidado na fila...', 'bot');
+                const timer = setInterval(async () => {
+                    try {
+                        const response = await fetch(`/consolidado/${jobId}`);
+                        const data = await response.json();
+                        if (!data.success) throw new Error(data.error);
+                        const job = data.job;
+                        if (job.status === 'concluido') {
+                            clearInterval(timer);
+                            statusDiv.innerHTML = `Consolidado pronto: <a href="/consolidado/${jobId}/download">baixar planilha</a>`;
+                        } else if (job.status === 'erro') {
+                            clearInterval(timer);
+                            setMessageText(statusDiv, 'Erro no consolidado: ' + job.erro);
+                        } else {
+                            setMessageText(statusDiv, `Consolidado: ${job.mensagem} (${job.progresso}%)`);
+                        }
+                    } catch (error) {
+                        clearInterval(timer);
+                        setMessageText(statusDiv, 'Não foi possível acompanhar o consolidado.');
+                    }
+                }, 2000);
+            }
+
+            function setMessageText(messageDiv, text) {
+                messageDiv.innerHTML = text.replace(/\\n/g, '<br>');
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }
+
             function addMessage(text, sender) {
                 const messageDiv = document.createElement('div');
                 messageDiv.className = `message ${sender}-message`;
@@ -1500,6 +5472,7 @@ if __name__ == "__main__":
 
                 messagesContainer.appendChild(messageDiv);
                 messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                return messageDiv;
             }
 
             window.onload = function() {
@@ -1529,11 +5502,111 @@ if __name__ == "__main__":
 
             resposta = leitor.processar_pergunta_usuario(pergunta)
 
-            return jsonify({"success": True, "response": resposta})
+            return jsonify(
+                {
+                    "success": True,
+                    "response": resposta,
+                    "roteamento": leitor.ultimo_roteamento,
+                }
+            )
 
         except Exception as e:
             return jsonify({"success": False, "error": str(e)})
 
+    @app.route("/chat/stream", methods=["POST"])
+    def chat_stream():
+        """
+        Mesma pergunta do /chat, respondida como Server-Sent Events: progresso das
+        etapas, pedaços da resposta conforme o modelo gera e um evento final
+        """
+        data = request.get_json(silent=True) or {}
+        pergunta = data.get("message", "")
+        inicio = time.perf_counter()
+
+        def _sse(evento):
+            return (
+                f"event: {evento['evento']}\n"
+                f"data: {json.dumps(evento, ensure_ascii=False, default=str)}\n\n"
+            )
+
+        def gerar():
+            if not pergunta:
+                yield _sse({"evento": "erro", "erro": "Pergunta não fornecida"})
+                return
+            primeiro_byte = None
+            try:
+                for evento in leitor.processar_pergunta_usuario_stream(pergunta):
+                    if primeiro_byte is None:
+                        primeiro_byte = time.perf_counter()
+                    if evento["evento"] == "fim":
+                        evento["metricas"]["ttfb_ms"] = round(
+                            (primeiro_byte - inicio) * 1000, 1
+                        )
+                        print(f"Chat em streaming: {evento['metricas']}")
+                    yield _sse(evento)
+            except Exception as e:
+                yield _sse({"evento": "erro", "erro": str(e)})
+
+        return Response(
+            stream_with_context(gerar()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/consolidado", methods=["POST"])
+    def consolidado_submeter():
+        data = request.get_json(silent=True) or {}
+        streaming = data.get("streaming", False)
+        if not isinstance(streaming, bool):
+            return (
+                jsonify({"success": False, "error": "streaming deve ser booleano"}),
+                400,
+            )
+        try:
+            job = leitor.fila_consolidados.submeter(
+                data.get("competencia"),
+                streaming=streaming,
+                formatos=data.get("formatos", ["xlsx"]),
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        return jsonify({"success": True, "job": job}), 202
+
+    @app.route("/consolidado/<job_id>", methods=["GET"])
+    def consolidado_status(job_id):
+        job = leitor.fila_consolidados.status(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": "Job não encontrado"}), 404
+        return jsonify({"success": True, "job": job})
+
+    @app.route("/consolidado/<job_id>/download", methods=["GET"])
+    def consolidado_download(job_id):
+        job = leitor.fila_consolidados.status(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": "Job não encontrado"}), 404
+        if job["status"] != "concluido":
+            return (
+                jsonify({"success": False, "error": f"Job {job['status']}"}),
+                409,
+            )
+        formato = request.args.get("formato")
+        arquivo = job["arquivos"].get(formato) if formato else job["arquivo"]
+        if arquivo is None:
+            return (
+                jsonify({"success": False, "error": f"Formato {formato} não gerado"}),
+                404,
+            )
+        return send_from_directory(
+            os.path.dirname(arquivo), os.path.basename(arquivo), as_attachment=True
+        )
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(
+            METRICAS.exposicao(leitor.estatisticas_caches()),
+            mimetype="text/plain; version=0.0.4",
+        )
+
     import webbrowser
     import threading
 
@@ -0,0 +1,743 @@
+"""
+Benchmarks do agente VR/VA.
+
+Uso:
+    python benchmark.py snapshot [--pasta ./bases] [--repeticoes 5]
+    python benchmark.py escrita [--pasta ./bases] [--linhas 10000 100000]
+    python benchmark.py carga [--pasta ./bases] [--processos 4] [--repeticoes 3]
+    python benchmark.py bases --destino ./bases_100k [--funcionarios 100000]
+    python benchmark.py pipeline [--tamanhos 1000 100000] [--saida-json resultados.json]
+        [--comparar resultados_anteriores.json]
+    python benchmark.py memoria [--linhas 100000 1000000] [--saida-json memoria.json]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+import openpyxl
+
+import app
+from app import CacheWorkbooks, LeitorPlanilhas, ModeloFake, TabelaRegistros
+
+
+def _partida_a_frio(pasta, caminho_cache, usar_snapshot):
+    """
+    Simula uma partida a frio: cache em memória vazio e leitura de todas as planilhas
+    """
+    leitor = LeitorPlanilhas(
+        caminho_pasta=pasta,
+        cache_workbooks=CacheWorkbooks(),
+        caminho_cache=caminho_cache,
+        usar_snapshot=usar_snapshot,
+    )
+    planilhas = [p for p in leitor.planilhas if os.path.exists(os.path.join(pasta, p))]
+    inicio = time.perf_counter()
+    for planilha in planilhas:
+        leitor._ler_linhas(planilha)
+    return time.perf_counter() - inicio
+
+
+def benchmark_snapshot(pasta, repeticoes):
+    """
+    Compara a partida a frio lendo os xlsx com openpyxl e lendo o snapshot colunar
+    """
+    caminho_cache = tempfile.mkdtemp(prefix="benchmark_snapshot_")
+    try:
+        sem_snapshot = [
+            _partida_a_frio(pasta, caminho_cache, usar_snapshot=False)
+            for _ in range(repeticoes)
+        ]
+        # Primeira leitura com snapshot grava os arquivos; as seguintes só os desserializam
+        construcao = _partida_a_frio(pasta, caminho_cache, usar_snapshot=True)
+        com_snapshot = [
+            _partida_a_frio(pasta, caminho_cache, usar_snapshot=True)
+            for _ in range(repeticoes)
+        ]
+    finally:
+        shutil.rmtree(caminho_cache, ignore_errors=True)
+
+    resultado = {
+        "sem_snapshot_s": statistics.median(sem_snapshot),
+        "construcao_snapshot_s": construcao,
+        "com_snapshot_s": statistics.median(com_snapshot),
+    }
+    print(f"Partida a frio em {pasta} (mediana de {repeticoes} execuções)")
+    print(f"  openpyxl (sem snapshot): {resultado['sem_snapshot_s'] * 1000:9.1f} ms")
+    print(
+        f"  construção do snapshot:  {resultado['construcao_snapshot_s'] * 1000:9.1f} ms"
+    )
+    print(f"  com snapshot (pickle):   {resultado['com_snapshot_s'] * 1000:9.1f} ms")
+    print(
+        f"  ganho: {resultado['sem_snapshot_s'] / max(resultado['com_snapshot_s'], 1e-9):.1f}x"
+    )
+    return resultado
+
+
+def _funcionarios_sinteticos(quantidade):
+    siglas = ["SP", "RJ", "RS", "PR"]
+    return {
+        "funcionarios": [
+            {
+                "matricula": str(100000 + i),
+                "sindicato": siglas[i % 4],
+                "dias_uteis": 22,
+                "status": "ATIVO",
+                "observacoes": "Processado localmente",
+            }
+            for i in range(quantidade)
+        ],
+        "totais": {},
+    }
+
+
+def _escrever(leitor, dados, pasta_saida):
+    # Os prints de debug do gerador não entram na medição do terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        leitor._gerar_planilha_excel(
+            dados, competencia="05/2025", caminho_saida=pasta_saida
+        )
+
+
+def benchmark_escrita(pasta, quantidades):
+    """
+    Tempo e pico de memória (tracemalloc) da escrita da VR MENSAL em cada escritor
+    """
+    escritores = ["openpyxl", "write_only"]
+    if app.xlsxwriter is not None:
+        escritores.append("xlsxwriter")
+    pasta_saida = tempfile.mkdtemp(prefix="benchmark_escrita_")
+    resultados = []
+    try:
+        for quantidade in quantidades:
+            dados = _funcionarios_sinteticos(quantidade)
+            for escritor in escritores:
+                leitor = LeitorPlanilhas(
+                    caminho_pasta=pasta, escritor_planilha=escritor
+                )
+                # Aquece o cache das bases para medir só a escrita
+                _escrever(leitor, _funcionarios_sinteticos(10), pasta_saida)
+
+                inicio = time.perf_counter()
+                _escrever(leitor, dados, pasta_saida)
+                tempo = time.perf_counter() - inicio
+
+                tracemalloc.start()
+                _escrever(leitor, dados, pasta_saida)
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                resultados.append(
+                    {
+                        "linhas": quantidade,
+                        "escritor": escritor,
+                        "tempo_s": tempo,
+                        "pico_mb": pico / (1024 * 1024),
+                    }
+                )
+    finally:
+        shutil.rmtree(pasta_saida, ignore_errors=True)
+
+    print(f"{'linhas':>8}  {'escritor':<11} {'tempo (s)':>10} {'pico (MB)':>10}")
+    for r in resultados:
+        print(
+            f"{r['linhas']:>8}  {r['escritor']:<11} {r['tempo_s']:>10.2f} "
+            f"{r['pico_mb']:>10.1f}"
+        )
+    return resultados
+
+
+def benchmark_carga(pasta, processos, repeticoes):
+    """
+    Leitura das dez bases da consolidação: sequencial, em paralelo no pool de
+    processos e só a maior planilha (o limite inferior do paralelo)
+    """
+    arquivos = list(LeitorPlanilhas.BASES_CONSOLIDADO.values())
+
+    def carregar(max_processos):
+        caminho_cache = tempfile.mkdtemp(prefix="benchmark_carga_")
+        leitor = LeitorPlanilhas(
+            caminho_pasta=pasta,
+            cache_workbooks=CacheWorkbooks(),
+            caminho_cache=caminho_cache,
+            usar_snapshot=False,
+            max_processos_carga=max_processos,
+        )
+        try:
+            # O pool sobe antes da medição, como num servidor já em execução
+            if max_processos > 1:
+                leitor._obter_executor_carga().submit(int).result()
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                leitor.carregar_dataset("05/2025")
+                return time.perf_counter() - inicio
+        finally:
+            leitor.fechar()
+            shutil.rmtree(caminho_cache, ignore_errors=True)
+
+    maior = max(arquivos, key=lambda nome: os.path.getsize(os.path.join(pasta, nome)))
+    tempos_maior = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        app._ler_linhas_workbook(os.path.join(pasta, maior))
+        tempos_maior.append(time.perf_counter() - inicio)
+
+    resultado = {
+        "sequencial_s": statistics.median(carregar(1) for _ in range(repeticoes)),
+        "paralelo_s": statistics.median(carregar(processos) for _ in range(repeticoes)),
+        "maior_planilha_s": statistics.median(tempos_maior),
+    }
+    print(
+        f"Carga das bases em {pasta} (mediana de {repeticoes}, {os.cpu_count()} CPUs)"
+    )
+    print(f"  sequencial:             {resultado['sequencial_s'] * 1000:9.1f} ms")
+    print(
+        f"  paralelo ({processos} processos): {resultado['paralelo_s'] * 1000:9.1f} ms"
+    )
+    print(f"  só {maior}: {resultado['maior_planilha_s'] * 1000:9.1f} ms")
+    return resultado
+
+
+# Fração dos funcionários em cada situação nas bases sintéticas
+PROPORCOES_PADRAO = {
+    "ferias": 0.04,
+    "afastamentos": 0.01,
+    "desligados": 0.03,
+    "admissoes": 0.045,
+    "aprendiz": 0.018,
+    "estagio": 0.015,
+    "exterior": 0.002,
+}
+# Bases pequenas de parâmetros: copiadas do modelo sem alteração
+BASES_COPIADAS = [
+    "Base dias uteis.xlsx",
+    "Base sindicato x valor.xlsx",
+    "VR MENSAL 05.2025.xlsx",
+]
+
+
+def _cabecalho_e_aba(caminho):
+    wb = openpyxl.load_workbook(caminho, read_only=True)
+    try:
+        ws = wb.active
+        return next(ws.iter_rows(max_row=1, values_only=True)), ws.title
+    finally:
+        wb.close()
+
+
+def _escrever_base(caminho_modelo, caminho_destino, linhas):
+    """
+    Grava linhas (dict cabeçalho normalizado -> valor) com o mesmo cabeçalho e aba
+    do arquivo modelo
+    """
+    cabecalho, aba = _cabecalho_e_aba(caminho_modelo)
+    chaves = [str(c).strip().upper() if c is not None else None for c in cabecalho]
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(aba)
+    ws.append(list(cabecalho))
+    for linha in linhas:
+        ws.append([linha.get(chave) if chave else None for chave in chaves])
+    wb.save(caminho_destino)
+
+
+def _amostras_ativos(pasta_modelo):
+    """
+    Cargos e sindicatos (com o peso de cada um) da base ATIVOS real
+    """
+    wb = openpyxl.load_workbook(
+        os.path.join(pasta_modelo, "ATIVOS.xlsx"), read_only=True
+    )
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        cabecalho = [str(c).strip().upper() for c in next(linhas)]
+        cargo = cabecalho.index("TITULO DO CARGO")
+        sindicato = cabecalho.index("SINDICATO")
+        cargos, sindicatos = [], []
+        for linha in linhas:
+            if linha[cargo]:
+                cargos.append(linha[cargo])
+            if linha[sindicato]:
+                sindicatos.append(linha[sindicato])
+    finally:
+        wb.close()
+    return cargos, sindicatos
+
+
+def gerar_bases_sinteticas(
+    destino, funcionarios, pasta_modelo="./bases", proporcoes=None, semente=42
+):
+    """
+    Grava em destino as bases da consolidação com os cabeçalhos de pasta_modelo e
+    `funcionarios` ativos; férias, afastamentos, desligamentos etc. seguem
+    proporcoes (fração dos ativos). Mesma semente, mesmas bases.
+    """
+    proporcoes = {**PROPORCOES_PADRAO, **(proporcoes or {})}
+    aleatorio = random.Random(semente)
+    cargos, sindicatos = _amostras_ativos(pasta_modelo)
+    os.makedirs(destino, exist_ok=True)
+    for nome in BASES_COPIADAS:
+        shutil.copyfile(os.path.join(pasta_modelo, nome), os.path.join(destino, nome))
+
+    situacoes_afastamento = ["Licença Maternidade", "Auxílio Doença", "Atestado"]
+    inicio_maio = datetime(2025, 5, 1)
+    inicio_abril = datetime(2025, 4, 1)
+    primeira_matricula = 10_000
+    subconjuntos = {nome: [] for nome in proporcoes}
+
+    def ativos():
+        for i in range(funcionarios):
+            matricula = primeira_matricula + i
+            cargo = aleatorio.choice(cargos)
+            situacao = "Trabalhando"
+            sorteio = aleatorio.random()
+            if sorteio < proporcoes["ferias"]:
+                situacao = "Férias"
+                subconjuntos["ferias"].append(
+                    {
+                        "MATRICULA": matricula,
+                        "DESC. SITUACAO": situacao,
+                        "DIAS DE FÉRIAS": aleatorio.choice([10, 15, 20, 30]),
+                    }
+                )
+            elif sorteio < proporcoes["ferias"] + proporcoes["afastamentos"]:
+                situacao = aleatorio.choice(situacoes_afastamento)
+                subconjuntos["afastamentos"].append(
+                    {"MATRICULA": matricula, "DESC. SITUACAO": situacao}
+                )
+            if aleatorio.random() < proporcoes["desligados"]:
+                subconjuntos["desligados"].append(
+                    {
+                        "MATRICULA": matricula,
+                        "DATA DEMISSÃO": inicio_maio
+                        + timedelta(days=aleatorio.randrange(31)),
+                        "COMUNICADO DE DESLIGAMENTO": "OK",
+                    }
+                )
+            # Admissões são as matrículas mais novas
+            if i >= funcionarios * (1 - proporcoes["admissoes"]):
+                subconjuntos["admissoes"].append(
+                    {
+                        "MATRICULA": matricula,
+                        "DATA ADMISSAO": inicio_abril
+                        + timedelta(days=aleatorio.randrange(30)),
+                        "CARGO": cargo,
+                    }
+                )
+            sorteio = aleatorio.random()
+            if sorteio < proporcoes["aprendiz"]:
+                cargo = "APRENDIZ"
+                subconjuntos["aprendiz"].append(
+                    {"MATRICULA": matricula, "TITULO DO CARGO": cargo}
+                )
+            elif sorteio < proporcoes["aprendiz"] + proporcoes["estagio"]:
+                cargo = "ESTAGIARIO"
+                subconjuntos["estagio"].append(
+                    {"MATRICULA": matricula, "TITULO DO CARGO": cargo}
+                )
+            if aleatorio.random() < proporcoes["exterior"]:
+                subconjuntos["exterior"].append(
+                    {
+                        "CADASTRO": matricula,
+                        "VALOR": round(aleatorio.uniform(20, 700), 2),
+                    }
+                )
+            yield {
+                "MATRICULA": matricula,
+                "EMPRESA": 1410,
+                "TITULO DO CARGO": cargo,
+                "DESC. SITUACAO": situacao,
+                "SINDICATO": aleatorio.choice(sindicatos),
+            }
+
+    # ATIVOS é gravada em streaming; as demais bases saem das amostras coletadas
+    _escrever_base(
+        os.path.join(pasta_modelo, "ATIVOS.xlsx"),
+        os.path.join(destino, "ATIVOS.xlsx"),
+        ativos(),
+    )
+    arquivos = {
+        "ferias": "FÉRIAS.xlsx",
+        "afastamentos": "AFASTAMENTOS.xlsx",
+        "desligados": "DESLIGADOS.xlsx",
+        "admissoes": "ADMISSÃO ABRIL.xlsx",
+        "aprendiz": "APRENDIZ.xlsx",
+        "estagio": "ESTÁGIO.xlsx",
+        "exterior": "EXTERIOR.xlsx",
+    }
+    for nome, arquivo in arquivos.items():
+        _escrever_base(
+            os.path.join(pasta_modelo, arquivo),
+            os.path.join(destino, arquivo),
+            subconjuntos[nome],
+        )
+    return {nome: len(linhas) for nome, linhas in subconjuntos.items()}
+
+
+def _medir(funcao):
+    """
+    Executa funcao duas vezes: uma cronometrada e outra sob tracemalloc.
+    Retorna (resultado da primeira, tempo em s, pico em MB).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempo = time.perf_counter() - inicio
+
+        tracemalloc.start()
+        try:
+            funcao()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return resultado, tempo, pico / (1024 * 1024)
+
+
+def _metadados():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def benchmark_pipeline(pasta_modelo, tamanhos, motores, semente, proporcoes=None):
+    """
+    Tempo e pico de memória de cada etapa do pipeline sobre bases sintéticas:
+    extração das bases, processamento local (por motor), escrita da VR MENSAL e
+    o consolidado completo, com o ModeloFake no lugar do Gemini
+    """
+    resultados = []
+    for tamanho in tamanhos:
+        pasta = tempfile.mkdtemp(prefix=f"benchmark_pipeline_{tamanho}_")
+        try:
+            pasta_bases = os.path.join(pasta, "bases")
+            inicio = time.perf_counter()
+            contagens = gerar_bases_sinteticas(
+                pasta_bases, tamanho, pasta_modelo, proporcoes, semente
+            )
+            resultados.append(
+                {
+                    "funcionarios": tamanho,
+                    "etapa": "gerar_bases",
+                    "tempo_s": time.perf_counter() - inicio,
+                    "pico_mb": None,
+                    "bases": contagens,
+                }
+            )
+
+            leitor = LeitorPlanilhas(
+                caminho_pasta=pasta_bases,
+                caminho_cache=os.path.join(pasta, "cache"),
+                usar_snapshot=False,
+                usar_indice_pdfs=False,
+                usar_consultas_locais=False,
+                modelo=ModeloFake(),
+                usar_cache_llm=False,
+            )
+            saida = os.path.join(pasta, "saida")
+            os.makedirs(saida)
+
+            def extrair():
+                # Cache de planilhas vazio: cada medição lê os xlsx do disco
+                leitor.cache_workbooks = CacheWorkbooks()
+                return leitor.carregar_dataset("05/2025")
+
+            etapas = [("extrair_dados_estruturados", extrair)]
+            dataset, _, _ = _medir(extrair)
+            for motor in motores:
+                etapas.append(
+                    (
+                        f"processar_dados_localmente[{motor}]",
+                        lambda motor=motor: leitor._processar_dados_localmente(
+                            dataset, motor=motor
+                        ),
+                    )
+                )
+            with contextlib.redirect_stdout(io.StringIO()):
+                dados_processados = leitor._processar_dados_localmente(dataset)
+            etapas.append(
+                (
+                    "gerar_planilha_excel",
+                    lambda: leitor._gerar_planilha_excel(
+                        dados_processados,
+                        competencia="05/2025",
+                        caminho_saida=saida,
+                        dataset=dataset,
+                    ),
+                )
+            )
+
+            def consolidado_completo():
+                leitor.cache_workbooks = CacheWorkbooks()
+                preparado = leitor._preparar_consolidado("05/2025")
+                return leitor._concluir_consolidado(*preparado, caminho_saida=saida)
+
+            etapas.append(("gerar_consolidado_vr", consolidado_completo))
+
+            for etapa, funcao in etapas:
+                _, tempo, pico = _medir(funcao)
+                resultados.append(
+                    {
+                        "funcionarios": tamanho,
+                        "etapa": etapa,
+                        "tempo_s": tempo,
+                        "pico_mb": pico,
+                    }
+                )
+                print(f"{tamanho:>9}  {etapa:<38} {tempo:>9.2f} s {pico:>9.1f} MB")
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return resultados
+
+
+def comparar_resultados(atuais, anteriores):
+    """
+    Variação de tempo e memória de cada etapa em relação a um JSON anterior
+    """
+    indice = {
+        (r["funcionarios"], r["etapa"]): r for r in anteriores.get("resultados", [])
+    }
+    print(f"{'funcionarios':>12}  {'etapa':<38} {'tempo':>9} {'memória':>9}")
+    for r in atuais:
+        anterior = indice.get((r["funcionarios"], r["etapa"]))
+        if anterior is None:
+            continue
+        variacoes = []
+        for chave in ("tempo_s", "pico_mb"):
+            if r[chave] is None or not anterior[chave]:
+                variacoes.append(f"{'-':>9}")
+            else:
+                variacoes.append(f"{(r[chave] / anterior[chave] - 1) * 100:>+8.1f}%")
+        print(f"{r['funcionarios']:>12}  {r['etapa']:<38} {' '.join(variacoes)}")
+
+
+def _linhas_ativos_sinteticas(quantidade, cargos, sindicatos, semente):
+    """
+    Linhas no formato lido da ATIVOS (tuplas de células), para o benchmark de
+    memória
+    """
+    rng = random.Random(semente)
+    situacoes = ["Trabalhando"] * 95 + [
+        "Férias",
+        "Auxílio Doença",
+        "Licença Maternidade",
+    ]
+    return [
+        (
+            30_000 + i,
+            1410,
+            rng.choice(cargos),
+            rng.choice(situacoes),
+            rng.choice(sindicatos),
+        )
+        for i in range(quantidade)
+    ]
+
+
+def _memoria_retida(funcao):
+    """
+    Executa funcao sob tracemalloc e retorna (resultado, MB retidos, tempo em s).
+    O resultado é mantido vivo até a medição.
+    """
+    tracemalloc.start()
+    try:
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempo = time.perf_counter() - inicio
+        atual, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, atual / (1024 * 1024), tempo
+
+
+def benchmark_memoria(pasta_modelo, quantidades, semente):
+    """
+    Memória retida pelos registros da ATIVOS: lista de dicionários de strings
+    (como era) x TabelaRegistros, e o tempo de uma passagem lendo matrícula e
+    sindicato de cada registro
+    """
+    cargos, sindicatos = _amostras_ativos(pasta_modelo)
+    headers = ["MATRICULA", "EMPRESA", "TITULO DO CARGO", "DESC. SITUACAO", "Sindicato"]
+
+    def lista_dicionarios(linhas):
+        registros = []
+        for row in linhas:
+            registro = LeitorPlanilhas._linha_para_registro(headers, row)
+            if registro is not None:
+                registros.append(registro)
+        return registros
+
+    def percorrer(registros):
+        inicio = time.perf_counter()
+        contagem = Counter(
+            (registro.get("MATRICULA")[:1], registro.get("Sindicato"))
+            for registro in registros
+        )
+        return time.perf_counter() - inicio, contagem
+
+    resultados = []
+    for quantidade in quantidades:
+        linhas = _linhas_ativos_sinteticas(quantidade, cargos, sindicatos, semente)
+        resultado = {"linhas": quantidade}
+        contagens = []
+        for nome, montar in (
+            ("lista_dicionarios", lista_dicionarios),
+            (
+                "tabela_registros",
+                lambda linhas: TabelaRegistros.de_linhas(headers, linhas),
+            ),
+        ):
+            gc.collect()
+            registros, megabytes, tempo = _memoria_retida(lambda: montar(linhas))
+            tempo_leitura, contagem = percorrer(registros)
+            contagens.append(contagem)
+            resultado[nome] = {
+                "memoria_mb": round(megabytes, 1),
+                "montagem_s": round(tempo, 3),
+                "leitura_s": round(tempo_leitura, 3),
+            }
+            del registros
+        if contagens[0] != contagens[1]:
+            raise RuntimeError(f"Registros divergentes com {quantidade} linhas")
+        antes = resultado["lista_dicionarios"]["memoria_mb"]
+        depois = resultado["tabela_registros"]["memoria_mb"]
+        resultado["reducao"] = round(antes / depois, 1) if depois else None
+        resultados.append(resultado)
+        print(f"{quantidade} registros da ATIVOS:")
+        for nome in ("lista_dicionarios", "tabela_registros"):
+            medida = resultado[nome]
+            print(
+                f"  {nome:18s} {medida['memoria_mb']:9.1f} MB"
+                f"  montagem {medida['montagem_s']:7.2f} s"
+                f"  leitura {medida['leitura_s']:6.2f} s"
+            )
+        print(f"  redução de memória: {resultado['reducao']}x")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do agente VR/VA")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    parser_snapshot = subparsers.add_parser(
+        "snapshot", help="Partida a frio com e sem snapshot colunar"
+    )
+    parser_snapshot.add_argument("--pasta", default="./bases")
+    parser_snapshot.add_argument("--repeticoes", type=int, default=5)
+
+    parser_escrita = subparsers.add_parser(
+        "escrita", help="Escrita da VR MENSAL: openpyxl x write_only x xlsxwriter"
+    )
+    parser_escrita.add_argument("--pasta", default="./bases")
+    parser_escrita.add_argument(
+        "--linhas", type=int, nargs="+", default=[10_000, 100_000]
+    )
+
+    parser_carga = subparsers.add_parser(
+        "carga", help="Leitura das bases: sequencial x pool de processos"
+    )
+    parser_carga.add_argument("--pasta", default="./bases")
+    parser_carga.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser_carga.add_argument("--repeticoes", type=int, default=3)
+
+    parser_bases = subparsers.add_parser(
+        "bases", help="Gera bases sintéticas com os cabeçalhos de --pasta"
+    )
+    parser_bases.add_argument("--pasta", default="./bases")
+    parser_bases.add_argument("--destino", required=True)
+    parser_bases.add_argument("--funcionarios", type=int, default=100_000)
+    parser_bases.add_argument("--semente", type=int, default=42)
+    for nome, proporcao in PROPORCOES_PADRAO.items():
+        parser_bases.add_argument(f"--{nome}", type=float, default=proporcao)
+
+    parser_pipeline = subparsers.add_parser(
+        "pipeline", help="Tempo e memória de cada etapa com bases sintéticas"
+    )
+    parser_pipeline.add_argument("--pasta", default="./bases")
+    parser_pipeline.add_argument(
+        "--tamanhos", type=int, nargs="+", default=[1_000, 100_000]
+    )
+    parser_pipeline.add_argument("--motores", nargs="+", default=["python", "pandas"])
+    parser_pipeline.add_argument("--semente", type=int, default=42)
+    parser_pipeline.add_argument("--saida-json", default="benchmark_pipeline.json")
+    parser_pipeline.add_argument("--comparar", default=None)
+
+    parser_memoria = subparsers.add_parser(
+        "memoria", help="Memória dos registros: lista de dicionários x TabelaRegistros"
+    )
+    parser_memoria.add_argument("--pasta", default="./bases")
+    parser_memoria.add_argument(
+        "--linhas", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    parser_memoria.add_argument("--semente", type=int, default=42)
+    parser_memoria.add_argument("--saida-json", default=None)
+
+    args = parser.parse_args()
+    if args.comando == "snapshot":
+        benchmark_snapshot(args.pasta, args.repeticoes)
+    elif args.comando == "escrita":
+        benchmark_escrita(args.pasta, args.linhas)
+    elif args.comando == "carga":
+        benchmark_carga(args.pasta, args.processos, args.repeticoes)
+    elif args.comando == "bases":
+        contagens = gerar_bases_sinteticas(
+            args.destino,
+            args.funcionarios,
+            args.pasta,
+            {nome: getattr(args, nome) for nome in PROPORCOES_PADRAO},
+            args.semente,
+        )
+        print(f"{args.funcionarios} ativos em {args.destino}: {contagens}")
+    elif args.comando == "pipeline":
+        resultados = benchmark_pipeline(
+            args.pasta, args.tamanhos, args.motores, args.semente
+        )
+        with open(args.saida_json, "w", encoding="utf-8") as arquivo:
+            json.dump(
+                {"metadados": _metadados(), "resultados": resultados},
+                arquivo,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"Resultados gravados em {args.saida_json}")
+        if args.comparar:
+            with open(args.comparar, "r", encoding="utf-8") as arquivo:
+                comparar_resultados(resultados, json.load(arquivo))
+    elif args.comando == "memoria":
+        resultados = benchmark_memoria(args.pasta, args.linhas, args.semente)
+        if args.saida_json:
+            with open(args.saida_json, "w", encoding="utf-8") as arquivo:
+                json.dump(
+                    {"metadados": _metadados(), "resultados": resultados},
+                    arquivo,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import CacheWorkbooks, LeitorPlanilhas  # noqa: E402
+
+
+def _leitor(tmp_path, **kwargs):
+    return LeitorPlanilhas(
+        caminho_pasta=os.path.join(RAIZ, "bases"),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+        **kwargs,
+    )
+
+
+def test_carga_sequencial_por_padrao(tmp_path):
+    leitor = _leitor(tmp_path, cache_workbooks=CacheWorkbooks())
+    try:
+        assert leitor.max_processos_carga == 1
+        leitor.carregar_dataset("05/2025")
+        assert leitor._executor_carga is None
+    finally:
+        leitor.fechar()
+
+
+def test_carga_paralela_usa_linhas_descartadas_pelo_cache(tmp_path):
+    # Cache de uma entrada: as bases pré-carregadas expulsam umas às outras
+    cache = CacheWorkbooks(max_entradas=1)
+    leitor = _leitor(tmp_path, cache_workbooks=cache, max_processos_carga=2)
+    try:
+        dataset = leitor.carregar_dataset("05/2025")
+        assert cache.remocoes_lru > 0
+        assert cache.misses == len(LeitorPlanilhas.BASES_CONSOLIDADO)
+        assert dataset["ativos"]["total_registros"] == 1815
+        executor = leitor._executor_carga
+        assert executor is not None
+    finally:
+        leitor.fechar()
+    assert leitor._executor_carga is None
+    with pytest.raises(RuntimeError):
+        executor.submit(int)
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import LeitorPlanilhas  # noqa: E402
+
+
+def _leitor(tmp_path, **kwargs):
+    return LeitorPlanilhas(
+        caminho_pasta=str(tmp_path),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+        **kwargs,
+    )
+
+
+def _ramo(segundos, dados):
+    def ramo(pergunta, rota):
+        time.sleep(segundos)
+        return dados, "ok"
+
+    return ramo
+
+
+def test_ramo_esgotado_nao_trava_a_pergunta_seguinte(tmp_path):
+    # Pool de duas threads: o ramo lento da 1ª pergunta segura uma delas
+    leitor = _leitor(
+        tmp_path, max_consultas_simultaneas=1, timeout_excel=0.5, timeout_pdf=0.5
+    )
+    try:
+        primeira = leitor._executar_ramos(
+            [("excel", _ramo(3, "lento")), ("pdf", _ramo(0, "pdf"))], "p1", {}
+        )
+        assert primeira[0][1][1] == "EXCEL: tempo esgotado"
+        assert primeira[1][1] == ("pdf", "ok")
+
+        # Os dois ramos dividem a thread livre; o 2º começa depois do 1º e ainda
+        # tem o próprio timeout inteiro
+        segunda = leitor._executar_ramos(
+            [("excel", _ramo(0.3, "excel")), ("pdf", _ramo(0.3, "pdf"))], "p2", {}
+        )
+        assert segunda == [("excel", ("excel", "ok")), ("pdf", ("pdf", "ok"))]
+    finally:
+        leitor.fechar()
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import openpyxl
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import LeitorPlanilhas  # noqa: E402
+
+
+def _leitor(tmp_path):
+    return LeitorPlanilhas(
+        caminho_pasta=str(tmp_path),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+    )
+
+
+def test_write_only_escreve_direto_do_gerador(tmp_path, monkeypatch):
+    leitor = _leitor(tmp_path)
+    leitor.LINHAS_AMOSTRA_LARGURA = 10
+    total = 500
+    geradas = []
+
+    def linhas():
+        for i in range(total):
+            geradas.append(i)
+            yield [str(i), "Não encontrada", "SP", "05/2025", 22, 35.0, 770.0, 616.0]
+
+    # Quantas linhas o gerador já tinha produzido a cada append na planilha
+    produzidas_no_append = []
+    append_original = WriteOnlyWorksheet.append
+
+    def append(self, linha):
+        produzidas_no_append.append(len(geradas))
+        return append_original(self, linha)
+
+    monkeypatch.setattr(WriteOnlyWorksheet, "append", append)
+
+    caminho = tmp_path / "saida.xlsx"
+    headers = LeitorPlanilhas.COLUNAS_PLANILHA_VR[:8]
+    leitor._escrever_planilha_write_only(str(caminho), headers, linhas())
+
+    # Cabeçalho + linhas; a 1ª linha de dados sai com só a amostra lida
+    assert len(produzidas_no_append) == total + 1
+    assert produzidas_no_append[1] <= leitor.LINHAS_AMOSTRA_LARGURA + 1
+    assert max(produzidas_no_append[1:]) == total
+
+    ws = openpyxl.load_workbook(caminho).active
+    assert ws.max_row == total + 1
@@ -0,0 +1,75 @@
+import csv
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import LeitorPlanilhas, ModeloFake, dias_uteis_competencia  # noqa: E402
+
+
+def _leitor(tmp_path):
+    return LeitorPlanilhas(
+        caminho_pasta=os.path.join(RAIZ, "bases"),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+        usar_cache_llm=False,
+        modelo=ModeloFake(),
+    )
+
+
+def _ler_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8") as arquivo:
+        return list(csv.DictReader(arquivo))
+
+
+def test_lote_usa_a_competencia_de_cada_mes(tmp_path):
+    assert dias_uteis_competencia("04/2025") != dias_uteis_competencia("05/2025")
+
+    lote = _leitor(tmp_path).gerar_consolidados_lote(
+        "04/2025-05/2025",
+        max_processos=1,
+        formatos=("csv",),
+        caminho_saida=str(tmp_path),
+    )
+    por_mes = {r["competencia"]: r for r in lote["competencias"]}
+    assert set(por_mes) == {"04/2025", "05/2025"}
+    assert por_mes["04/2025"]["totais"] != por_mes["05/2025"]["totais"]
+
+    linhas = {
+        competencia: _ler_csv(resultado["arquivos"]["csv"])
+        for competencia, resultado in por_mes.items()
+    }
+    for competencia, registros in linhas.items():
+        assert registros
+        assert {r["Competência"] for r in registros} == {competencia}
+
+    # Abril não é coberto pela base de dias úteis (15/04 a 15/05): calendário
+    abril = {r["Matricula"]: r for r in linhas["04/2025"]}
+    maio = {r["Matricula"]: r for r in linhas["05/2025"]}
+    assert {float(r["Dias"]) for r in abril.values()} == {
+        dias_uteis_competencia("04/2025")
+    }
+    matricula = next(iter(maio))
+    assert abril[matricula]["TOTAL"] != maio[matricula]["TOTAL"]
+
+
+def test_competencia_invalida_vira_resposta_de_erro(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    leitor = _leitor(tmp_path)
+    assert leitor.gerar_consolidado_vr("13/2025").startswith("Erro:")
+
+    eventos = list(
+        leitor.processar_pergunta_usuario_stream("gerar consolidado de 13/2025")
+    )
+    assert eventos[-1]["evento"] == "fim"
+    assert "Competência inválida" in eventos[-1]["resposta"]
+
+
+def test_competencia_sem_zero_usa_o_nome_normalizado(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    resumo = _leitor(tmp_path).gerar_consolidado_vr("5/2025")
+    assert "VR MENSAL 05-2025.xlsx" in resumo
+    assert (tmp_path / "VR MENSAL 05-2025.xlsx").exists()
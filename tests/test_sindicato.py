@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import LeitorPlanilhas  # noqa: E402
+
+HEADERS = ["MATRICULA", "EMPRESA", "TITULO DO CARGO", "DESC. SITUACAO", "Sindicato"]
+# O cargo contém "PR" ("COMPRAS") numa coluna anterior à de sindicato
+LINHA = {
+    "MATRICULA": "35360",
+    "EMPRESA": "1410",
+    "TITULO DO CARGO": "ASSISTENTE DE COMPRAS",
+    "DESC. SITUACAO": "Trabalhando",
+    "Sindicato": "SINDPPD RS - SINDICATO DOS TRAB. EM PROC. DE DADOS RIO GRANDE DO SUL",
+}
+
+
+def _leitor(tmp_path):
+    return LeitorPlanilhas(
+        caminho_pasta=str(tmp_path),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+    )
+
+
+def _base(headers, dados):
+    return {"headers": headers, "dados": dados, "total_registros": len(dados)}
+
+
+def test_coluna_sindicato_tem_precedencia_sobre_o_cargo(tmp_path):
+    leitor = _leitor(tmp_path)
+    coluna = LeitorPlanilhas._esquema(_base(HEADERS, [LINHA]), "ativos").coluna(
+        "sindicato"
+    )
+    assert coluna == "Sindicato"
+    assert leitor._extrair_sindicato(LINHA, coluna) == "RS"
+    # Sem a coluna conhecida vale a varredura antiga: primeiro campo, por nome
+    assert leitor._extrair_sindicato(LINHA) == "PR"
+
+
+@pytest.mark.parametrize("motor", ["python", "pandas"])
+def test_motores_usam_a_coluna_sindicato(tmp_path, motor):
+    vazia = _base(["MATRICULA"], [])
+    dados = {
+        "ativos": _base(HEADERS, [LINHA]),
+        "aprendiz": vazia,
+        "estagio": vazia,
+        "afastamentos": vazia,
+        "exterior": vazia,
+    }
+    resultado = _leitor(tmp_path)._processar_dados_localmente(
+        dados, motor=motor, competencia="05/2025"
+    )
+    (funcionario,) = resultado["funcionarios"]
+    assert funcionario["sindicato"] == "RS"
+    assert funcionario["valor_diario_vr"] == LeitorPlanilhas.VALORES_SINDICATO["RS"]
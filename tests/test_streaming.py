@@ -0,0 +1,35 @@
+import os
+import sys
+import types
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import LeitorPlanilhas, TabelaRegistros  # noqa: E402
+
+
+def _leitor(tmp_path):
+    return LeitorPlanilhas(
+        caminho_pasta=os.path.join(RAIZ, "bases"),
+        caminho_cache=str(tmp_path / ".cache"),
+        usar_snapshot=False,
+        usar_indice_pdfs=False,
+        usar_consultas_locais=False,
+    )
+
+
+def test_streaming_devolve_gerador_sem_total(tmp_path):
+    leitor = _leitor(tmp_path)
+    base = leitor.extrair_dados_estruturados("ATIVOS.xlsx", streaming=True)
+    assert isinstance(base["dados"], types.GeneratorType)
+    assert base["total_registros"] is None
+    assert sum(1 for _ in base["dados"]) == 1815
+
+
+def test_streaming_materializado_sob_pedido(tmp_path):
+    leitor = _leitor(tmp_path)
+    base = leitor.extrair_dados_estruturados(
+        "ATIVOS.xlsx", streaming=True, materializar=True
+    )
+    assert isinstance(base["dados"], TabelaRegistros)
+    assert base["total_registros"] == 1815
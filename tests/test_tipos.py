@@ -0,0 +1,26 @@
+import os
+import sys
+from datetime import date, time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import coagir_celula  # noqa: E402
+
+
+@pytest.mark.parametrize("tipo", ["data", "inteiro", "decimal"])
+@pytest.mark.parametrize("valor", [time(8, 30), object(), b"07/04/2025"])
+def test_tipo_de_celula_nao_suportado_levanta_value_error(valor, tipo):
+    with pytest.raises(ValueError):
+        coagir_celula(valor, tipo)
+
+
+def test_texto_aceita_qualquer_valor():
+    assert coagir_celula(time(8, 30), "texto") == "08:30:00"
+
+
+def test_valores_suportados():
+    assert coagir_celula(" 07/04/2025 ", "data") == date(2025, 4, 7)
+    assert coagir_celula("R$ 1.035,50", "decimal") == 1035.5
+    assert coagir_celula(22.0, "inteiro") == 22